@@ -0,0 +1,162 @@
+"""
+SLU-C None analysis
+
+The tree evaluator lets None (an unset variable, or a call that fell off the
+end of its function) flow through expressions. Nones works out which
+expressions of a linked Program can never be None: variables assigned on
+every path to them, parameters no call passes a None to and calls to
+functions that always return a value. The Python source backend turns those
+into bare Python operators and the VM tail-calls functions that always
+return a value.
+"""
+from typing import Set
+from ast import *
+
+
+class Nones:
+    """
+    Each stmt_ method returns whether the statement always returns from the
+    function; each expr_ method returns whether the value of an expression
+    can be None, which is also kept in none for every expression reached.
+    """
+    def __init__(self):
+        self.functions = {}
+        # filled in optimistically, then cleared while a pass finds a call
+        # passing a None or a function ending without a value
+        self.params = {}   # FunctionDef -> per parameter: never None
+        self.returns = {}  # FunctionDef -> always returns a value
+        self.none = {}     # Expr -> can be None
+        self.changed = False
+        self.definite = set()  # slots that hold a value at this point
+
+    def program(self, prog: Program) -> "Nones":
+        for f in prog.funcs:
+            self.functions[str(f.id)] = f
+            self.params[f] = [True] * f.nparams
+            self.returns[f] = True
+        # every pass can only clear assumptions, so this ends
+        self.changed = True
+        while self.changed:
+            self.changed = False
+            self.none = {}
+            for f in prog.funcs:
+                self.function(f)
+        return self
+
+    def function(self, f: FunctionDef):
+        self.definite = {i for i, known in enumerate(self.params[f]) if known}
+        if not self.block(f.stmts) and self.returns[f]:
+            self.returns[f] = False
+            self.changed = True
+
+    def block(self, stmts: list) -> bool:
+        returns = False
+        for s in stmts:
+            if s is not None and type(s) != str:
+                returns = getattr(self, "stmt_" + type(s).__name__)(s) or returns
+        return returns
+
+    def stmt_TypedAssignment(self, s: TypedAssignment) -> bool:
+        self.expression(s.exp)
+        self.definite.add(s.slot)
+        return False
+
+    stmt_Assignment = stmt_TypedAssignment
+
+    def stmt_Block(self, s: Block) -> bool:
+        return self.block([j for i in s.stmts for j in i])
+
+    def stmt_IfStmt(self, s: IfStmt) -> bool:
+        self.expression(s.cond)
+        before = set(self.definite)
+        true = self.block([s.truepart])
+        after = self.definite
+        if not any(i is not None and type(i) != str for i in s.falsepart):
+            self.definite = before
+            return False
+        self.definite = set(before)
+        false = self.block(s.falsepart)
+        # a branch that returns does not reach the code after the if
+        if true:
+            pass
+        elif false:
+            self.definite = after
+        else:
+            self.definite &= after
+        return true and false
+
+    def stmt_WhileStmt(self, s: WhileStmt) -> bool:
+        before = set(self.definite)
+        self.expression(s.cond)
+        self.block([s.inLoop])
+        # the body may not have run at all
+        self.definite = before
+        return False
+
+    def stmt_PrintStmt(self, s: PrintStmt) -> bool:
+        for a in [s.pArg] + list(s.pArgList or []):
+            self.expression(a)
+        return False
+
+    def stmt_ReturnStmt(self, s: ReturnStmt) -> bool:
+        # returning None returns nothing: the function goes on
+        return not self.expression(s.exp)
+
+    def expression(self, e: Expr) -> bool:
+        none = getattr(self, "expr_" + type(e).__name__)(e)
+        # a node the optimizer shares between places is None if it is anywhere
+        self.none[e] = self.none.get(e, False) or none
+        return none
+
+    def expr_LitExpr(self, e: LitExpr) -> bool:
+        return False
+
+    expr_ConstExpr = expr_LitExpr
+
+    def expr_IDExpr(self, e: IDExpr) -> bool:
+        return e.slot not in self.definite
+
+    def expr_BinaryExpr(self, e: BinaryExpr) -> bool:
+        # both sides are evaluated, even when one is None
+        lnone = self.expression(e.left)
+        rnone = self.expression(e.right)
+        return lnone or rnone
+
+    def expr_AndExpr(self, e: AndExpr) -> bool:
+        # False or None on the left is the result
+        return self.expr_BinaryExpr(e)
+
+    def expr_OrExpr(self, e: OrExpr) -> bool:
+        lnone = self.expression(e.left)
+        rnone = self.expression(e.right)
+        if e.type == "bool" and not lnone:
+            return rnone
+        return lnone or rnone
+
+    def expr_UnaryOp(self, e: UnaryOp) -> bool:
+        # None * -1 fails as it does in UnaryOp.eval
+        self.expression(e.tree)
+        return False
+
+    def expr_Coercion(self, e: Coercion) -> bool:
+        return self.expression(e.exp)
+
+    def expr_FunctionExpr(self, e: FunctionExpr) -> bool:
+        f = self.functions.get(e.id)
+        if f is None or len(e.params) != f.nparams:
+            # fails when it runs
+            return False
+        for i, p in enumerate(e.params):
+            if self.expression(p) and self.params[f][i]:
+                self.params[f][i] = False
+                self.changed = True
+        return not self.returns[f]
+
+
+def returning(prog: Program) -> Set[str]:
+    """
+    Names of the functions of prog that return a value (never None) on
+    every path
+    """
+    nones = Nones().program(prog)
+    return {name for name, f in nones.functions.items() if nones.returns[f]}
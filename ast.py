@@ -4,8 +4,9 @@ SLU-C Abstract Syntax Trees
 An abstract syntax tree (AST) is a data structure that represents the
 concrete (text)
 """
-from typing import Sequence, List, Union, Optional, Dict
+from typing import Sequence, List, Union, Optional, Dict, Iterator
 import operator
+from output import Output
 
 ops = {'*': operator.mul,
        '/': operator.truediv,
@@ -19,7 +20,9 @@ ops = {'*': operator.mul,
        '==': operator.eq,
        '!=': operator.ne,
        '&&': operator.and_,
-       '||': operator.or_
+       '||': operator.or_,
+       '<<': operator.lshift,
+       '>>': operator.rshift
 }
 
 # use a class hierarchy to represent types
@@ -27,7 +30,7 @@ class Expr:
     """
     Parent class for other Exprs
     """
-    pass
+    type = None  # static type name, once typechecker has run
 
 
 class Params:
@@ -53,8 +56,8 @@ class Params:
 
 class Declaration:
     """
-    Variable type declarations, variables and their types are added to the
-    env dictionary (variable name to tuple(type, value))
+    Variable type declarations, each variable gets a slot in the frame of
+    its function and its type is kept in the function's static type table
     """
     def __init__(self, t: type, id: Expr):
         self.t = t
@@ -67,24 +70,84 @@ class Declaration:
         return self.id, self.t
 
 
+class Context:
+    """
+    What one run of a Program needs besides the tree, passed down through
+    every eval next to the frame: out is where print statements print
+    (print() if None), caches the memo.LRUCache of each memoized
+    FunctionDef and profiler the profiler.Profiler timing the run, if any.
+    The tree is linked the first time it runs and left unchanged after
+    that, so once it has run one Program can run with several Contexts at
+    once.
+    """
+    def __init__(self, out: Optional[Output] = None, caches: Optional[Dict] = None, profiler=None):
+        self.out = out
+        self.caches = caches or {}
+        self.profiler = profiler
+
+
 class Stmt:
     """
     Parent class for other Stmts
     """
-    pass
+    line = None  # source line the statement starts on, set by the parser
+
+
+def walk(node) -> Iterator:
+    """
+    Yields node and every Expr and Stmt below it, parents before children
+    """
+    yield node
+    todo = list(vars(node).values())
+    while todo:
+        v = todo.pop(0)
+        if isinstance(v, (Expr, Stmt)):
+            yield from walk(v)
+        elif type(v) == list:
+            todo[0:0] = v
 
 
 class FunctionDef:
     """
-    Creates env dictionary to store local variables used in this function, then evaluates
-    each statement.
+    Gives every parameter and declaration a fixed slot, then evaluates each
+    statement in a frame, a flat list of slot values.
     """
+    line = None  # source line of the definition, set by the parser
+
     def __init__(self, t: str, id: Expr, params: Params, decls: [Declaration], stmts: [Stmt]):
         self.t = t
         self.id = id
         self.params = params
         self.decls = decls
         self.stmts = stmts
+        self.resolve()
+
+    def resolve(self):
+        """
+        Builds the slot table (name to slot) and the parallel type table, then
+        resolves every variable in the body to its slot. A declaration with the
+        same name as a parameter shadows it with a new slot.
+        """
+        self.slots = {}
+        self.types = []
+        prms = self.params.eval()
+        for t, id in prms:
+            self.slots[id] = len(self.types)
+            self.types.append(t)
+        for d in self.decls:
+            id, t = d.eval()
+            self.slots[id] = len(self.types)
+            self.types.append(t)
+        self.nparams = len(prms)
+        self.blank = [None] * (len(self.types) - len(prms))
+        for s in self.stmts:
+            if type(s) != str:
+                s.resolve(self)
+
+    def slot(self, id: str) -> int:
+        if id not in self.slots:
+            raise SLUCFunctionError("Error: Variable {0} is not defined in this environment".format(id))
+        return self.slots[id]
 
     def __str__(self):
         st = "{0} {1}({2}) {{".format(str(self.t), str(self.id), str(self.params))
@@ -95,58 +158,72 @@ class FunctionDef:
         st = st + "}"
         return st
 
-    def eval(self, given: Sequence[Expr]) -> Union[int, float, bool, str]:
-        env = {}
-        prms = self.params.eval()
-        if len(prms) != len(given):
-            raise SLUCFunctionError("Error: function {0} expected {1} parameters, got {2}".format(self.id, len(prms), len(given)))
-        for p in range(len(prms)):
-            env[prms[p][1]] = (prms[p][0], given[p])
-        for d in self.decls:
-            dec = d.eval()
-            env[dec[0]] = (dec[1], None)
+    def eval(self, given: Sequence, ctx: Optional[Context] = None) -> Union[int, float, bool, str]:
+        if self.nparams != len(given):
+            raise SLUCFunctionError("Error: function {0} expected {1} parameters, got {2}".format(self.id, self.nparams, len(given)))
+        if ctx is None:
+            ctx = Context()
+        if ctx.profiler is not None:
+            return ctx.profiler.call(self, list(given) + self.blank, ctx)
+        return self.run(list(given) + self.blank, ctx)
+
+    def run(self, frame: List, ctx: Context) -> Union[int, float, bool, str]:
+        """
+        Evaluates the body in a frame that already holds the argument values
+        followed by the blank declaration slots
+        """
+        prof = ctx.profiler
         for s in self.stmts:
             if type(s) != str:
-                st = s.eval(env)
-                if type(st).__name__ == "dict":
-                    env = st
-                    continue
-                elif st is not None:
+                st = s.eval(frame, ctx) if prof is None else prof.stmt(s, frame, ctx)
+                if st is not None:
                     return st
 
 
 class Assignment(Stmt):
     """
-    Assigns values to variables in the env dictionary
+    Assigns values to variables in the frame, converting between int and
+    float to fit the declared type
     """
     def __init__(self, var: Expr, exp: Expr):
         self.var = var
         self.exp = exp
+        self.slot = None
+        self.t = None
 
     def __str__(self):
         return "{0} = {1};".format(str(self.var), str(self.exp))
 
-    def eval(self, env: Dict):
-        if str(self.var) in env.keys():
-            ex = self.exp.eval(env)
-            if env[str(self.var)][0] == type(ex).__name__:
-                temp = env[str(self.var)][0]
-                env[str(self.var)] = (temp, ex)
-                return env
-            elif env[str(self.var)][0] == "int" and type(ex).__name__ == "float":
-                ex = int(ex)
-                temp = env[str(self.var)][0]
-                env[str(self.var)] = (temp, ex)
-                return env
-            elif env[str(self.var)][0] == "float" and type(ex).__name__ == "int":
-                ex = float(ex)
-                temp = env[str(self.var)][0]
-                env[str(self.var)] = (temp, ex)
-                return env
-            else:
-                raise SLUCFunctionError("Error: Type Mismatch")
+    def resolve(self, scope: FunctionDef):
+        self.var.resolve(scope)
+        self.exp.resolve(scope)
+        self.slot = self.var.slot
+        self.t = scope.types[self.slot]
+
+    def eval(self, frame: List, ctx: Context):
+        ex = self.exp.eval(frame, ctx)
+        if self.t == type(ex).__name__:
+            frame[self.slot] = ex
+        elif self.t == "int" and type(ex) is float:
+            frame[self.slot] = int(ex)
+        elif self.t == "float" and type(ex) is int:
+            frame[self.slot] = float(ex)
         else:
-            raise SLUCFunctionError("Error: Variable {0} is not defined in this environment".format(self.var))
+            raise SLUCFunctionError("Error: Type Mismatch")
+
+
+class TypedAssignment(Assignment):
+    """
+    An Assignment the type checker has proven to fit the declared type, with
+    any int/float conversion made explicit by a Coercion, so only a None
+    value (an unset variable or a function that fell off its end) is left
+    to reject at run time
+    """
+    def eval(self, frame: List, ctx: Context):
+        ex = self.exp.eval(frame, ctx)
+        if ex is None:
+            raise SLUCFunctionError("Error: Type Mismatch")
+        frame[self.slot] = ex
 
 
 class Block(Stmt):
@@ -163,11 +240,20 @@ class Block(Stmt):
                 temp = temp + str(j)
         return temp
 
-    def eval(self, env):
+    def resolve(self, scope: FunctionDef):
+        for i in self.stmts:
+            for j in i:
+                if type(j) != str:
+                    j.resolve(scope)
+
+    def eval(self, frame, ctx):
+        prof = ctx.profiler
         for i in self.stmts:
             for j in i:
                 if type(j) != str:
-                    j.eval(env)
+                    st = j.eval(frame, ctx) if prof is None else prof.stmt(j, frame, ctx)
+                    if st is not None:
+                        return st
 
 
 class IfStmt(Stmt):
@@ -184,15 +270,26 @@ class IfStmt(Stmt):
         if len(self.falsepart) == 0:
             return "if ( {0} ) {1}".format(str(self.cond), str(self.truepart))
         else:
-            return "if ( {0} ) {1} else {2}".format(str(self.cond), str(self.truepart), str(self.falsepart))
-
-    def eval(self, env):
-
-        if self.cond.eval(env):
-            self.truepart.eval(env)
+            return "if ( {0} ) {1} else {2}".format(str(self.cond), str(self.truepart),
+                                                    " else ".join(str(i) for i in self.falsepart))
+
+    def resolve(self, scope: FunctionDef):
+        self.cond.resolve(scope)
+        for i in [self.truepart] + self.falsepart:
+            if type(i) != str:
+                i.resolve(scope)
+
+    def eval(self, frame, ctx):
+        prof = ctx.profiler
+        if self.cond.eval(frame, ctx):
+            if prof is not None:
+                return prof.stmt(self.truepart, frame, ctx)
+            return self.truepart.eval(frame, ctx)
         elif self.falsepart is not None:
             for i in self.falsepart:
-                i.eval(env)
+                st = i.eval(frame, ctx) if prof is None else prof.stmt(i, frame, ctx)
+                if st is not None:
+                    return st
 
 
 class WhileStmt(Stmt):
@@ -207,9 +304,17 @@ class WhileStmt(Stmt):
     def __str__(self):
         return "while ({0}) {1}".format(str(self.cond), str(self.inLoop))
 
-    def eval(self, env):
-        while self.cond.eval(env):
-            self.inLoop.eval(env)
+    def resolve(self, scope: FunctionDef):
+        self.cond.resolve(scope)
+        if type(self.inLoop) != str:
+            self.inLoop.resolve(scope)
+
+    def eval(self, frame, ctx):
+        prof = ctx.profiler
+        while self.cond.eval(frame, ctx):
+            st = self.inLoop.eval(frame, ctx) if prof is None else prof.stmt(self.inLoop, frame, ctx)
+            if st is not None:
+                return st
 
 
 class PrintStmt(Stmt):
@@ -228,20 +333,30 @@ class PrintStmt(Stmt):
         pri = pri + ")"
         return pri
 
-    def eval(self, env):
-        args = [self.pArg.eval(env)]
+    def resolve(self, scope: FunctionDef):
+        self.pArg.resolve(scope)
+        for i in self.pArgList or []:
+            i.resolve(scope)
+
+    def eval(self, frame, ctx):
+        args = [self.pArg.eval(frame, ctx)]
         if self.pArgList is not None:
             for i in self.pArgList:
                 if type(i) == str:
                     args.append(i)
-                args.append(i.eval(env))
-        for i in args:
-            print(i)
+                args.append(i.eval(frame, ctx))
+        if ctx.out is None:
+            for i in args:
+                print(i)
+        else:
+            ctx.out.write(args)
 
 
 class ReturnStmt(Stmt):
     """
     Returns a value to the functionDef class, which then returns the same value.
+    Blocks, ifs and whiles pass the value up, so a return ends the call from
+    any depth.
     """
     def __init__(self, exp: Expr):
         self.exp = exp
@@ -249,21 +364,24 @@ class ReturnStmt(Stmt):
     def __str__(self):
         return "return {0};" .format(str(self.exp))
 
-    def eval(self, env):
-        return self.exp.eval(env)
-
+    def resolve(self, scope: FunctionDef):
+        self.exp.resolve(scope)
 
-funcDict = {}
+    def eval(self, frame, ctx):
+        return self.exp.eval(frame, ctx)
 
 
 class Program:
     """
-    Main class that processes a list of function definitions and stores the definitions
-    in a dictionary so they can be called later.
+    Main class that processes a list of function definitions and links every
+    call to the definition it calls, so each Program has its own function
+    table and programs can run side by side.
     """
+    linked = False  # set by link, which the first eval runs
+
     def __init__(self, funcs: Sequence[FunctionDef]):
         self.funcs = funcs
-        global funcDict
+        self.functions = {}
 
     def __str__(self):
         temp = ""
@@ -271,11 +389,47 @@ class Program:
             temp = temp + str(i)
         return temp
 
-    def eval(self):
-        for i in self.funcs:
-            funcDict[str(i.id)] = i
-            if str(i.id) == "main":
-                i.eval([])
+    def link(self) -> Dict[str, FunctionDef]:
+        """
+        Builds the function table and points every call at the FunctionDef
+        it calls, or at None for an undefined function (an error only if the
+        call runs). Calls may refer to functions defined further down
+        (mutual recursion). The first eval links; the type checker and the
+        optimizer rewrite expressions but keep every FunctionDef and call,
+        so a linked Program stays linked, and running it changes nothing.
+        """
+        self.functions = {str(f.id): f for f in self.funcs}
+        for f in self.funcs:
+            for s in f.stmts:
+                if type(s) != str:
+                    for node in walk(s):
+                        if type(node) == FunctionExpr:
+                            node.target = self.functions.get(node.id)
+        self.linked = True
+        return self.functions
+
+    def eval(self, out: Optional[Output] = None, profiler=None, caches: Optional[Dict] = None):
+        """
+        Runs main, printing to out (buffered standard output by default),
+        which is flushed however the run ends. A profiler.Profiler given as
+        profiler counts and times the run, and caches (memo.memoize's, by
+        function name) memoize calls. All of it is kept in the run's own
+        Context.
+        """
+        if out is None:
+            out = Output()
+        if not self.linked:
+            self.link()
+        main = self.functions.get("main")
+        if profiler is not None:
+            profiler.instrument(self)
+        ctx = Context(out, {self.functions[name]: c for name, c in (caches or {}).items()
+                            if name in self.functions}, profiler)
+        try:
+            if main is not None:
+                main.eval([], ctx)
+        finally:
+            out.flush()
         return None
 
 
@@ -291,14 +445,67 @@ class BinaryExpr(Expr):
     def __str__(self):
         return "({0} {1} {2})".format(str(self.left), self.op, str(self.right))
 
-    def eval(self, env):
-        l = self.left.eval(env)
-        r = self.right.eval(env)
+    def resolve(self, scope: FunctionDef):
+        self.left.resolve(scope)
+        self.right.resolve(scope)
+
+    def eval(self, frame, ctx):
+        l = self.left.eval(frame, ctx)
+        r = self.right.eval(frame, ctx)
         if l is None or r is None:
             return None
         return ops[self.op](l, r)
 
 
+class AndExpr(BinaryExpr):
+    """
+    left && right. When both are bools (static type "bool") right is only
+    evaluated if left is true, and a None on the left is the result; on ints
+    it is their bitwise and, evaluated like any BinaryExpr. Not type checked
+    (no static type), a false or None left is the result, and with anything
+    else on the left both sides are evaluated like a BinaryExpr.
+    """
+    def __init__(self, left: Expr, right: Expr):
+        BinaryExpr.__init__(self, left, "&&", right)
+
+    def eval(self, frame, ctx):
+        t = self.type
+        if t is not None and t != "bool":
+            return BinaryExpr.eval(self, frame, ctx)
+        l = self.left.eval(frame, ctx)
+        if t is None:
+            if l is False or l is None:
+                return l
+            r = self.right.eval(frame, ctx)
+            return None if r is None else l & r
+        if not l:
+            return l
+        return self.right.eval(frame, ctx)
+
+
+class OrExpr(BinaryExpr):
+    """
+    left || right: like AndExpr, right is only evaluated on two bools if
+    left is false, and not type checked it is skipped after a true left
+    """
+    def __init__(self, left: Expr, right: Expr):
+        BinaryExpr.__init__(self, left, "||", right)
+
+    def eval(self, frame, ctx):
+        t = self.type
+        if t is not None and t != "bool":
+            return BinaryExpr.eval(self, frame, ctx)
+        l = self.left.eval(frame, ctx)
+        if t is None:
+            if l is True or l is None:
+                return l
+            r = self.right.eval(frame, ctx)
+            return None if r is None else l | r
+        if l or l is None:
+            return l
+        return self.right.eval(frame, ctx)
+
+
 class UnaryOp(Expr):
     """
     Negates the value of the given expression.
@@ -310,36 +517,63 @@ class UnaryOp(Expr):
     def __str__(self):
         return"{0}{1}".format(self.op, str(self.tree))
 
-    def eval(self, env) -> Union[int, float, bool]:
-        return self.tree.eval(env) * -1
+    def resolve(self, scope: FunctionDef):
+        self.tree.resolve(scope)
+
+    def eval(self, frame, ctx) -> Union[int, float, bool]:
+        return self.tree.eval(frame, ctx) * -1
+
+
+class Coercion(Expr):
+    """
+    Converts an int to float or a float to int, inserted by the type checker
+    wherever a value meets a declared type
+    """
+    def __init__(self, exp: Expr, t: str):
+        self.exp = exp
+        self.t = t
+        self.type = t
+        self.conv = int if t == "int" else float
+
+    def __str__(self):
+        return "{0}({1})".format(self.t, str(self.exp))
+
+    def resolve(self, scope: FunctionDef):
+        self.exp.resolve(scope)
+
+    def eval(self, frame, ctx):
+        v = self.exp.eval(frame, ctx)
+        if v is None:
+            return None
+        return self.conv(v)
 
 
 class IDExpr(Expr):
     """
-    Returns the value assosiated with the given variable, unless already a value.
+    Returns the value in the frame slot of the given variable.
     """
     def __init__(self, id: str):
         self.id = id
+        self.slot = None
 
     def __str__(self):
         return self.id
 
-    def eval(self, env):
-        if type(env[self.id][1]) in {int, float, bool, str}:
-            return env[self.id][1]
-        else:
-            return env[self.id][1].eval(env)
+    def resolve(self, scope: FunctionDef):
+        self.slot = scope.slot(self.id)
+
+    def eval(self, frame, ctx):
+        return frame[self.slot]
 
 
 class FunctionExpr(Expr):
     """
-    Calls function definitions using the function dictionary created by
-    the program class.
+    Calls the function definition Program.link pointed it at.
     """
     def __init__(self, id: str, params: []):
         self.id = id
         self.params = params
-        global funcDict
+        self.target = None
 
     def __str__(self):
         temp = "{0}(".format(str(self.id))
@@ -351,9 +585,27 @@ class FunctionExpr(Expr):
         else:
             return "{0}()".format(str(self.id))
 
-    def eval(self, env):
-        x = funcDict[self.id].eval(self.params)
-        return x
+    def resolve(self, scope: FunctionDef):
+        for p in self.params:
+            p.resolve(scope)
+
+    def eval(self, frame, ctx):
+        # arguments are evaluated once, here in the caller's frame, and become
+        # the first slots of the callee's frame
+        f = self.target
+        if f is None:
+            raise SLUCFunctionError("Error: function {0} is not defined".format(self.id))
+        if len(self.params) != f.nparams:
+            raise SLUCFunctionError("Error: function {0} expected {1} parameters, got {2}".format(self.id, f.nparams, len(self.params)))
+        callee = [p.eval(frame, ctx) for p in self.params]
+        if ctx.caches:
+            cache = ctx.caches.get(f)
+            if cache is not None:
+                return cache.call(f, callee, ctx)
+        callee.extend(f.blank)
+        if ctx.profiler is not None:
+            return ctx.profiler.call(f, callee, ctx)
+        return f.run(callee, ctx)
 
 
 class LitExpr(Expr):
@@ -370,10 +622,32 @@ class LitExpr(Expr):
         else:
             return str(self.lit)
 
-    def eval(self, env):
+    def resolve(self, scope: FunctionDef):
+        pass
+
+    def eval(self, frame, ctx):
+        if self.t == bool:
+            return self.lit == "true"
         return self.t(self.lit)
 
 
+class ConstExpr(LitExpr):
+    """
+    A literal whose value has already been converted (or computed by
+    constant folding), so eval just returns it.
+    """
+    def __init__(self, value: Union[int, float, bool, str]):
+        if type(value) == bool:
+            lit = "true" if value else "false"
+        else:
+            lit = str(value)
+        LitExpr.__init__(self, lit, type(value))
+        self.value = value
+
+    def eval(self, frame, ctx):
+        return self.value
+
+
 class SLUCFunctionError(Exception):
     def __init__(self, message: str):
         Exception.__init__(self)
@@ -0,0 +1,1180 @@
+"""
+SLU-C benchmarks
+
+python benchmark.py lexer|parser|expressions|incremental|coldstart [megabytes]
+python benchmark.py engines|calls [loop count]
+python benchmark.py depth [recursion depth]
+python benchmark.py batch [lanes]
+python benchmark.py parallel [programs]
+python benchmark.py output [values printed]
+python benchmark.py profile [loop count]
+python benchmark.py guards [loop count]
+python benchmark.py checks
+python benchmark.py suite [scale] > results.json
+python benchmark.py compare old.json new.json [tolerance]
+"""
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from typing import Callable, List
+
+from lexer import Lexer, Kind
+from parser import Parser, TokenStream
+from ast import Program, Expr, BinaryExpr, AndExpr, OrExpr, SLUCFunctionError, walk
+import vm
+import closures
+import pysource
+import optimizer
+import memo
+import typechecker
+import parsecache
+import serialize
+from output import Output, Capture
+import workloads
+
+
+def generate_program(size: int, seed: int = 364) -> str:
+    """
+    Returns SLU-C source of at least size characters made of small functions
+    with declarations, loops, ifs, prints and comments.
+    """
+    rnd = random.Random(seed)
+    parts = []
+    total = 0
+    n = 0
+    while total < size:
+        body = ["int f{0}(int n, float x) {{".format(n),
+                "    int i;", "    float acc;", "    bool ok;",
+                "    // running total for function {0}".format(n),
+                "    i = 0;", "    acc = {0}.5;".format(rnd.randint(0, 99)),
+                "    ok = true;"]
+        for _ in range(rnd.randint(2, 6)):
+            a, b = rnd.randint(1, 999), rnd.randint(1, 9)
+            body += ["    while (i < n && ok) {",
+                     "        acc = acc + x * {0} / {1} - (i % {1});".format(a, b),
+                     "        if (acc >= 3_000.25e-1)",
+                     "            ok = false;",
+                     "        i = i + 1;",
+                     "    }",
+                     "    /* block comment with \"quotes\" and // slashes */",
+                     "    print(\"acc is \", acc, \"at\", i);"]
+        body += ["    return i;", "}", ""]
+        text = "\n".join(body)
+        parts.append(text)
+        total += len(text) + 1
+        n += 1
+    return "\n".join(parts)
+
+
+
+def generate_expressions(size: int, seed: int = 364) -> str:
+    """
+    Returns SLU-C source of at least size characters made of functions that
+    are nothing but assignments of long expressions
+    """
+    rnd = random.Random(seed)
+    names = ["a", "b", "c", "d"]
+    precedence = {"||": 1, "&&": 2, "==": 3, "!=": 3, "<": 4, "<=": 4, ">": 4, ">=": 4,
+                  "+": 6, "-": 6, "*": 7, "/": 7, "%": 7}
+    binary = list(precedence)
+
+    def expr(depth: int, level: int = 1) -> str:
+        """
+        An expression that can stand where operators of precedence below
+        level would not bind
+        """
+        if depth == 0 or rnd.random() < 0.2:
+            leaf = rnd.choice(names + [str(rnd.randint(0, 99)), "true"])
+            return "-" + leaf if rnd.random() < 0.1 else leaf
+        op = rnd.choice(binary)
+        prec = precedence[op]
+        # == and < chains do not parse, so their left side binds tighter
+        left = expr(depth - 1, prec if prec not in (3, 4) else prec + 1)
+        text = "{0} {1} {2}".format(left, op, expr(depth - 1, prec + 1))
+        return "(" + text + ")" if prec < level or rnd.random() < 0.1 else text
+
+    parts = []
+    total = 0
+    n = 0
+    while total < size:
+        body = ["int e{0}(int a, int b) {{".format(n), "    int c;", "    int d;"]
+        body += ["    {0} = {1};".format(rnd.choice("cd"), expr(4)) for _ in range(8)]
+        body += ["    return c;", "}", ""]
+        text = "\n".join(body)
+        parts.append(text)
+        total += len(text) + 1
+        n += 1
+    return "\n".join(parts)
+
+
+class DescentParser(Parser):
+    """
+    The parser with the one-method-per-precedence-level expression grammar
+    it had before precedence climbing, kept as the reference that
+    Parser.expression is checked and benchmarked against
+    """
+    def expression(self) -> Expr:
+        """
+        Expression -> Conjunction { || Conjunction }
+        """
+        left = self.conjunction()
+        while self.currtok.kind == Kind.OR:
+            op = self.currtok.text
+            self.currtok = self.tg.advance()
+            left = BinaryExpr(left, op, self.conjunction())
+        return left
+
+    def conjunction(self) -> Expr:
+        """
+        Conjunction → Equality { && Equality }
+        """
+        left = self.equality()
+        while self.currtok.kind == Kind.AND:
+            op = self.currtok.text
+            self.currtok = self.tg.advance()
+            left = BinaryExpr(left, op, self.equality())
+        return left
+
+    def equality(self) -> Expr:
+        """
+        Equality → Relation [ EquOp Relation ]
+        """
+        left = self.relation()
+        if self.currtok.kind in (Kind.EQ, Kind.NEQ):
+            op = self.currtok.text
+            self.currtok = self.tg.advance()
+            left = BinaryExpr(left, op, self.relation())
+        return left
+
+    def relation(self) -> Expr:
+        """
+        Relation → Addition [ RelOp Addition ]
+        """
+        left = self.addition()
+        if self.currtok.kind in (Kind.GT, Kind.GTE, Kind.LT, Kind.LTE):
+            op = self.currtok.text
+            self.currtok = self.tg.advance()
+            left = BinaryExpr(left, op, self.addition())
+        return left
+
+    def addition(self) -> Expr:
+        """
+        Addition → Term { AddOp Term }
+        """
+        left = self.term()
+        while self.currtok.kind in (Kind.PLUS, Kind.MINUS):
+            op = self.currtok.text
+            self.currtok = self.tg.advance()
+            left = BinaryExpr(left, op, self.term())
+        return left
+
+    def term(self) -> Expr:
+        """
+        Term → Fact { MulOp Fact }
+        """
+        left = self.fact()
+        while self.currtok.kind in (Kind.MULT, Kind.DIV, Kind.MOD):
+            op = self.currtok.text
+            self.currtok = self.tg.advance()
+            left = BinaryExpr(left, op, self.fact())
+        return left
+
+
+class Lexed(Lexer):
+    """
+    Hands out tokens lexed beforehand, to time parsing on its own
+    """
+    def __init__(self, buf: str, tokens: list):
+        Lexer.__init__(self, "<lexed>", buf)
+        self.lexed = tokens
+        # where tokens() would have put the end of file
+        self.length = len(self.buf)
+        self.last_line = tokens[-1].line if tokens else 1
+
+    def tokens(self):
+        return iter(self.lexed)
+
+
+def best_of(fn: Callable[[], object], repeat: int = 3) -> float:
+    """
+    Returns the fastest wall time of repeat calls to fn
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def report(title: str, rows: List[tuple], count: int = 0, unit: str = ""):
+    """
+    Prints one line per (case, seconds) row; with a count, also the number of
+    units (calls, iterations, ...) per second
+    """
+    print(title)
+    print('{:<30}{:>12}{:>12}'.format("Case", "Seconds", "Speedup") +
+          ('{:>16}'.format(unit + "/s") if count else ""))
+    print("-" * (70 if count else 54))
+    base = rows[0][1]
+    for name, secs in rows:
+        print('{:<30}{:>12.4f}{:>11.2f}x'.format(name, secs, base / secs) +
+              ('{:>16,.0f}'.format(count / secs) if count else ""))
+
+
+def bench_lexer(megabytes: float):
+    """
+    Lexes a generated file with the line-by-line legacy lexer, the
+    master-regex lexer over the memory-mapped file and over an in-memory
+    bytes buffer, and checks that all of them produce the same tokens.
+    """
+    src = generate_program(int(megabytes * 1024 * 1024))
+    fd, fn = tempfile.mkstemp(suffix=".c")
+    with os.fdopen(fd, "w") as f:
+        f.write(src)
+    try:
+        legacy = list(Lexer(fn).legacy_token_generator())
+        fast = list(Lexer(fn).token_generator())
+        data = src.encode()
+        if not legacy == fast == list(Lexer(fn, data).token_generator()):
+            raise AssertionError("token streams differ")
+        rows = [("legacy_token_generator", best_of(lambda: list(Lexer(fn).legacy_token_generator()))),
+                ("token_generator (mmap)", best_of(lambda: list(Lexer(fn).token_generator()))),
+                ("token_generator (bytes)", best_of(lambda: list(Lexer(fn, data).token_generator()))),
+                ("tokens (bytes)", best_of(lambda: list(Lexer(fn, data).tokens())))]
+        report("Lexer: {0:.1f} MB, {1} tokens".format(len(src) / 1024 / 1024, len(fast)), rows)
+    finally:
+        os.remove(fn)
+
+
+def bench_parser(megabytes: float):
+    """
+    Lexes and parses a generated program from memory
+    """
+    src = generate_program(int(megabytes * 1024 * 1024))
+    with redirect_stdout(io.StringIO()):
+        rows = [("Parser.program", best_of(lambda: Parser("<generated>", src).program()))]
+    report("Parser: {0:.1f} MB".format(len(src) / 1024 / 1024), rows)
+
+
+def bench_expressions(megabytes: float):
+    """
+    Parses a generated program of long expressions with precedence climbing
+    and with the recursive descent chain, from source and from tokens lexed
+    beforehand, and checks the trees are the same
+    """
+    src = generate_expressions(int(megabytes * 1024 * 1024))
+    tokens = list(Lexer("<generated>", src).tokens())
+
+    def parse(cls, lexed: bool):
+        p = cls("<generated>", src)
+        if lexed:
+            p.tg = TokenStream(Lexed(src, tokens))
+        return p.program()
+
+    with redirect_stdout(io.StringIO()):
+        if str(parse(Parser, False)) != str(parse(DescentParser, True)):
+            raise AssertionError("expression trees differ")
+        rows = [("recursive descent", best_of(lambda: parse(DescentParser, False))),
+                ("precedence climbing", best_of(lambda: parse(Parser, False))),
+                ("recursive descent, lexed", best_of(lambda: parse(DescentParser, True))),
+                ("precedence climbing, lexed", best_of(lambda: parse(Parser, True)))]
+    report("Expressions: {0:.1f} MB, {1} tokens".format(len(src) / 1024 / 1024, len(tokens)), rows)
+
+
+def bench_incremental(megabytes: float):
+    """
+    Parses a generated file from scratch, through an empty parse cache,
+    through a full one and after editing one function in the middle
+    """
+    src = generate_program(int(megabytes * 1024 * 1024))
+    tmp = tempfile.mkdtemp()
+    fn = os.path.join(tmp, "generated.c")
+    with open(fn, "w") as f:
+        f.write(src)
+    cache = parsecache.ParseCache(fn)
+
+    def cold():
+        if os.path.exists(cache.path):
+            os.remove(cache.path)
+        return parse_cached()
+
+    def parse_cached():
+        with redirect_stdout(io.StringIO()):
+            return cache.program()
+
+    def edited():
+        # touch the middle function, so every run has one miss
+        edited.n += 1
+        with open(fn, "w") as f:
+            f.write(src.replace("acc = 50.5;", "acc = {0}.5;".format(1000 + edited.n), 1))
+        return parse_cached()
+    edited.n = 0
+
+    try:
+        expected = str(parse_quietly("generated", src))
+        if str(cold()) != expected or str(parse_cached()) != expected:
+            raise AssertionError("cached parse differs from Parser.program")
+        rows = [("Parser.program", best_of(lambda: parse_quietly("generated", src))),
+                ("ParseCache (empty)", best_of(cold)),
+                ("ParseCache (unchanged)", best_of(parse_cached))]
+        functions = len(parse_cached().funcs)
+        rows.append(("ParseCache (one edit)", best_of(edited)))
+        report("Incremental parse: {0:.1f} MB, {1} functions, {2} parsed after the edit".format(
+            len(src) / 1024 / 1024, functions, cache.misses), rows)
+    finally:
+        shutil.rmtree(tmp)
+
+
+def bench_coldstart(megabytes: float):
+    """
+    Compares parsing a generated file with loading its compiled program
+    file, in process and as a whole "python parser.py" run
+    """
+    src = generate_program(int(megabytes * 1024 * 1024))
+    tmp = tempfile.mkdtemp()
+    fn = os.path.join(tmp, "generated.c")
+    with open(fn, "w") as f:
+        f.write(src)
+    try:
+        h = serialize.source_hash(fn)
+        prog = parse_quietly("generated", src)
+        serialize.save(fn, prog, h)
+        if str(serialize.load(fn, h)) != str(prog):
+            raise AssertionError("loaded program differs from the parsed one")
+        command = [sys.executable, "-W", "ignore", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                "parser.py")]
+        rows = [("Parser.program", best_of(lambda: parse_quietly("generated", src))),
+                ("serialize.load", best_of(lambda: serialize.load(fn, h))),
+                ("parser.py --reparse", best_of(lambda: subprocess.run(command + ["--reparse", fn],
+                                                                       stdout=subprocess.DEVNULL, check=True))),
+                ("parser.py (compiled file)", best_of(lambda: subprocess.run(command + [fn],
+                                                                             stdout=subprocess.DEVNULL, check=True)))]
+        report("Cold start: {0:.1f} MB source, {1:.1f} MB compiled".format(
+            len(src) / 1024 / 1024, os.path.getsize(serialize.path(fn)) / 1024 / 1024), rows)
+    finally:
+        shutil.rmtree(tmp)
+
+
+LOOP_PROGRAMS = {
+    "countdown": """
+        int main() {
+            int x;
+            int s;
+            x = {n};
+            s = 0;
+            while (x > 0) {
+                if (x % 2 == 0)
+                    s = s + x;
+                x = x - 1;
+            }
+            print(s);
+        }""",
+    "euler1": """
+        int sum_3_or_5(int n) {
+            int sum;
+            int i;
+            sum = 0;
+            i = 0;
+            while (i < n) {
+                if (i % 3 == 0 || i % 5 == 0)
+                    sum = sum + i;
+                i = i + 1;
+            }
+            return sum;
+        }
+        int main() {
+            print(sum_3_or_5({n}));
+        }""",
+    "newton": """
+        int main() {
+            int k;
+            float r;
+            float n;
+            float tmp;
+            k = 0;
+            while (k < {n} / 20) {
+                n = 2.0 + k;
+                r = n;
+                tmp = 1.0;
+                while (tmp > 0.000006) {
+                    r = (r + n / r) / 2.0;
+                    tmp = r * r - n;
+                    if (tmp < 0)
+                        tmp = n - r * r;
+                }
+                k = k + 1;
+            }
+            print(r);
+        }""",
+    "constants": """
+        int main() {
+            int i;
+            float s;
+            i = 0;
+            s = 0.0;
+            while (i < {n}) {
+                s = s + (2 * 3 - 1) * -4.0 / (10 * 10) + i % (3 + 4);
+                i = i + 1;
+            }
+            print(s);
+        }""",
+    "invariants": """
+        int main() {
+            int i;
+            int j;
+            int a;
+            int b;
+            int s;
+            a = 7;
+            b = 3;
+            s = 0;
+            i = 0;
+            while (i < {n} / 100) {
+                j = 0;
+                while (j < 100) {
+                    s = (s + (a * b + i * a) * j - (a * b + i * a)) % 1000003;
+                    j = j + 1;
+                }
+                i = i + 1;
+            }
+            print(s);
+        }""",
+}
+
+
+def run_captured(fn: Callable[[], object]) -> str:
+    """
+    Runs fn and returns what it printed
+    """
+    out = io.StringIO()
+    with redirect_stdout(out):
+        fn()
+    return out.getvalue()
+
+
+def parse_quietly(name: str, text: str) -> Program:
+    """
+    Parses an in-memory program without Parser.program's "Done"
+    """
+    with redirect_stdout(io.StringIO()):
+        return Parser("<" + name + ">", text).program()
+
+
+def compare_engines(name: str, text: str, title: str, count: int = 0, unit: str = "",
+                    memoized: bool = False):
+    """
+    Runs one program with the tree-walking evaluator (plain, type checked,
+    optimized, and with pure functions memoized if asked), the bytecode VM,
+    the closure compiler and the Python source backend (compiled once, as
+    its cache would), checking that all print the same output.
+    """
+    prog = parse_quietly(name, text)
+    typed = typechecker.check(parse_quietly(name, text))
+    opt = optimizer.optimize(typechecker.check(parse_quietly(name, text)))
+    functions = vm.Compiler().program(prog)
+    expected = run_captured(prog.eval)
+    if run_captured(vm.VM(functions).main) != expected:
+        raise AssertionError("{0}: vm output differs from eval".format(name))
+    if run_captured(lambda: closures.run(prog)) != expected:
+        raise AssertionError("{0}: closure output differs from eval".format(name))
+    if run_captured(opt.eval) != expected:
+        raise AssertionError("{0}: optimized output differs from eval".format(name))
+    if run_captured(typed.eval) != expected:
+        raise AssertionError("{0}: type checked output differs from eval".format(name))
+    code = pysource.load(opt, optimized=True)
+    if run_captured(lambda: pysource.run(opt, code=code)) != expected:
+        raise AssertionError("{0}: python source output differs from eval".format(name))
+    rows = [("Program.eval", best_of(lambda: run_captured(prog.eval))),
+            ("Program.eval (type checked)", best_of(lambda: run_captured(typed.eval))),
+            ("Program.eval (optimized)", best_of(lambda: run_captured(opt.eval))),
+            ("vm.VM", best_of(lambda: run_captured(vm.VM(functions).main))),
+            ("closures.run", best_of(lambda: run_captured(lambda: closures.run(prog)))),
+            ("pysource (optimized)", best_of(lambda: run_captured(lambda: pysource.run(opt, code=code))))]
+    if memoized:
+        memo_prog = parse_quietly(name, text)
+        caches = memo.memoize(memo_prog)
+
+        def cold():
+            # every run starts with empty caches
+            for c in caches.values():
+                c.clear()
+            return run_captured(lambda: memo_prog.eval(caches=caches))
+        if cold() != expected:
+            raise AssertionError("{0}: memoized output differs from eval".format(name))
+        rows.append(("Program.eval (memoized)", best_of(cold)))
+    report(title, rows, count, unit)
+    print()
+
+
+def bench_engines(n: float):
+    """
+    Compares the engines on loop-heavy programs
+    """
+    for name, text in LOOP_PROGRAMS.items():
+        compare_engines(name, text.replace("{n}", str(int(n))), "{0}: n = {1}".format(name, int(n)))
+
+
+# name -> (program, number of SLU-C calls it makes for a given n)
+CALL_PROGRAMS = {
+    "exp": ("""
+        int exp(int x, int y) {
+            if (y == 0)
+                return 1;
+            else
+                return x * exp(x, y - 1);
+        }
+        int main() {
+            int i;
+            int r;
+            i = 0;
+            while (i < {n}) {
+                r = exp(2, 50);
+                i = i + 1;
+            }
+            print(r);
+        }""", lambda n: n * 51 + 1),
+    "fib": ("""
+        int fib(int n) {
+            if (n < 2)
+                return n;
+            return fib(n - 1) + fib(n - 2);
+        }
+        int main() {
+            print(fib({n}));
+        }""", lambda n: 2 * fib(n + 1)),
+    "even/odd": ("""
+        bool even(int n) {
+            if (n == 0)
+                return true;
+            return odd(n - 1);
+        }
+        bool odd(int n) {
+            if (n == 0)
+                return false;
+            return even(n - 1);
+        }
+        int main() {
+            int i;
+            bool b;
+            i = 0;
+            while (i < {n}) {
+                b = even(100);
+                i = i + 1;
+            }
+            print(b);
+        }""", lambda n: n * 101 + 1),
+}
+
+
+def fib(n: int) -> int:
+    a, b = 0, 1
+    for _ in range(n):
+        a, b = b, a + b
+    return a
+
+
+def bench_calls(n: float):
+    """
+    Compares the engines on call-heavy programs: recursive exp, naive fib and
+    mutually recursive even/odd. fib gets n / 10 so its run time stays in line
+    with the others.
+    """
+    for name, (text, calls) in CALL_PROGRAMS.items():
+        k = int(n) // 10 if name == "fib" else int(n)
+        compare_engines(name, text.replace("{n}", str(k)), "{0}: n = {1}".format(name, k),
+                        calls(k), "calls", memoized=True)
+
+
+DEPTH_PROGRAMS = {
+    "tail call": ("""
+        int count(int n, int acc) {
+            if (n == 0)
+                return acc;
+            return count(n - 1, acc + 1);
+        }
+        int main() {
+            print(count({n}, 0));
+        }""", lambda n: n),
+    "non-tail call": ("""
+        int sum(int n) {
+            if (n == 0)
+                return 0;
+            return n + sum(n - 1);
+        }
+        int main() {
+            print(sum({n}));
+        }""", lambda n: n * (n + 1) // 2),
+    # h gives None, so "return h(n)" does not return and down goes on
+    "None tail call": ("""
+        int h(int n) {
+            if (n < 0)
+                return n;
+        }
+        int down(int n) {
+            if (n == 0)
+                return 0;
+            return h(n);
+            return down(n - 1) + 1;
+        }
+        int main() {
+            print(down({n}));
+        }""", lambda n: n),
+}
+
+
+def bench_depth(n: float):
+    """
+    Runs recursion n calls deep on the VM, far past what the recursive
+    engines survive, and checks the printed result
+    """
+    n = int(n)
+    rows = []
+    for name, (text, expected) in DEPTH_PROGRAMS.items():
+        functions = vm.Compiler().program(parse_quietly(name, text.replace("{n}", str(n))))
+        out = run_captured(vm.VM(functions).main)
+        if out != "{0}\n".format(expected(n)):
+            raise AssertionError("{0}: printed {1!r}".format(name, out))
+        rows.append((name, best_of(lambda: run_captured(vm.VM(functions).main))))
+    report("Recursion depth: n = {0}".format(n), rows, n + 1, "calls")
+
+
+BATCH_PROGRAM = """
+    float root(float n) {
+        float r;
+        float tmp;
+        r = n;
+        tmp = 1.0;
+        while (tmp > 0.000006) {
+            r = (r + n / r) / 2.0;
+            tmp = r * r - n;
+            if (tmp < 0)
+                tmp = n - r * r;
+        }
+        return r;
+    }
+    int poly(int x, float y) {
+        int r;
+        r = x * x - 3 * x + 7;
+        if (y > 0.5)
+            r = r + y * 10;
+        return r;
+    }"""
+
+
+def bench_batch(n: float):
+    """
+    Calls the Newton square root of test0.c and a straight-line polynomial
+    once per argument with FunctionDef.eval, the closure compiler and the
+    VM, and for all arguments at once with vectorize
+    """
+    try:
+        import vectorize
+        vectorize.import_numpy()
+    except ImportError as e:
+        print(e)
+        return
+    n = int(n)
+    rnd = random.Random(364)
+    prog = parse_quietly("batch", BATCH_PROGRAM)
+    args = {"root": [[rnd.uniform(0.5, 10000.0) for _ in range(n)]],
+            "poly": [[rnd.randint(-1000, 1000) for _ in range(n)], [rnd.random() for _ in range(n)]]}
+    for name, columns in args.items():
+        batch = vectorize.vectorize(prog, name)
+        f = batch.f
+        closure = closures.ClosureCompiler().program(prog)[name]
+        machine = vm.VM(batch.code)
+        lanes = list(zip(*columns))
+        prog.link()
+        expected = [f.eval(list(a)) for a in lanes]
+        if batch(*columns).tolist() != expected or [closure(list(a)) for a in lanes] != expected:
+            raise AssertionError("{0}: batch results differ from eval".format(name))
+        if batch.fallback is not None:
+            raise AssertionError("{0}: ran lane by lane, {1}".format(name, batch.fallback))
+        rows = [("FunctionDef.eval", best_of(lambda: [f.eval(list(a)) for a in lanes])),
+                ("closures", best_of(lambda: [closure(list(a)) for a in lanes])),
+                ("vm.VM.run", best_of(lambda: [machine.run(batch.code[name], list(a)) for a in lanes])),
+                ("vectorize", best_of(lambda: batch(*columns)))]
+        report("{0}: {1} lanes".format(name, n), rows, n, "calls")
+        print()
+
+
+def bench_parallel(n: float):
+    """
+    Runs n copies of the euler1 loop program with runner.run on one worker
+    and on one worker per core
+    """
+    import runner
+    n = int(n)
+    tmp = tempfile.mkdtemp()
+    try:
+        tasks = []
+        for i in range(n):
+            fn = os.path.join(tmp, "euler{0}.c".format(i))
+            with open(fn, "w") as f:
+                f.write(LOOP_PROGRAMS["euler1"].replace("{n}", str(20000 + i)))
+            tasks.append((fn,))
+        expected = [run_captured(parse_quietly("euler", LOOP_PROGRAMS["euler1"].replace("{n}", str(20000 + i))).eval)
+                    for i in range(n)]
+        results = runner.run(tasks)
+        if [r.output.replace("Done\n", "", 1) for r in results] != expected:
+            raise AssertionError("runner output differs from eval")
+        cores = os.cpu_count() or 1
+        rows = [("runner.run, 1 worker", best_of(lambda: runner.run(tasks, 1))),
+                ("runner.run, {0} workers".format(cores), best_of(lambda: runner.run(tasks, cores)))]
+        report("Parallel: {0} programs".format(n), rows, n, "programs")
+    finally:
+        shutil.rmtree(tmp)
+
+
+OUTPUT_PROGRAM = """
+int main() {
+    int i;
+    float x;
+    i = 0;
+    x = 0.5;
+    while (i < {n}) {
+        print(i, x * i)
+        i = i + 1;
+    }
+}
+"""
+
+
+def bench_output(n: float):
+    """
+    Prints 2n values through an unbuffered sink (a write and flush per
+    print, like print() on a terminal) and through the buffered one, to a
+    line buffered file as a terminal would be, and into a Capture
+    """
+    n = int(n)
+    prog = parse_quietly("output", OUTPUT_PROGRAM.replace("{n}", str(n)))
+    typechecker.check(prog)
+    functions = vm.Compiler().program(prog)
+    expected = run_captured(prog.eval)
+    capture = Capture()
+    prog.eval(capture)
+    if capture.getvalue() != expected or len(capture.lines) != 2 * n:
+        raise AssertionError("captured output differs from stdout")
+    with open(os.devnull, "w", buffering=1) as tty:
+        rows = [("Program.eval, unbuffered", best_of(lambda: prog.eval(Output(tty, 1)))),
+                ("Program.eval, buffered", best_of(lambda: prog.eval(Output(tty)))),
+                ("Program.eval, Capture", best_of(lambda: prog.eval(Capture()))),
+                ("vm.VM, buffered", best_of(lambda: vm.VM(functions, Output(tty)).main())),
+                ("closures.run, buffered", best_of(lambda: closures.run(prog, Output(tty))))]
+    report("Output: {0} values".format(2 * n), rows, 2 * n, "values")
+
+
+def bench_profile(n: float):
+    """
+    Runs the euler1 loop and fib with Program.eval never profiled, profiled
+    and after profiling, and checks the profiler counted every loop
+    iteration and call
+    """
+    import profiler
+    n = int(n)
+    for name, text, count in [("euler1", LOOP_PROGRAMS["euler1"].replace("{n}", str(n)), n),
+                              ("fib", CALL_PROGRAMS["fib"][0].replace("{n}", str(n // 1000)),
+                               CALL_PROGRAMS["fib"][1](n // 1000))]:
+        prog = parse_quietly(name, text)
+        typechecker.check(prog)
+        expected = run_captured(prog.eval)
+        plain = best_of(lambda: run_captured(prog.eval))
+        prof = profiler.Profiler()
+        if run_captured(lambda: prog.eval(profiler=prof)) != expected:
+            raise AssertionError("profiled output differs")
+        counted = max(e.iterations() or 0 for e in prof.entries) if name == "euler1" else \
+            sum(e.count for e in prof.entries if e.kind == "function")
+        if counted != count:
+            raise AssertionError("profiled {0} iterations or calls, expected {1}".format(counted, count))
+        rows = [("Program.eval", plain),
+                ("Program.eval, profiled", best_of(lambda: run_captured(lambda: prog.eval(profiler=profiler.Profiler())))),
+                ("Program.eval, after profiling", best_of(lambda: run_captured(prog.eval)))]
+        report("Profile {0}: {1} iterations or calls".format(name, count), rows)
+
+
+GUARD_PROGRAM = """
+    bool expensive(int x) {
+        int i;
+        int s;
+        s = 0;
+        i = 0;
+        while (i < 20) {
+            s = s + x % (i + 1);
+            i = i + 1;
+        }
+        return s % 2 == 0;
+    }
+    int main() {
+        int i;
+        int hits;
+        i = 0;
+        hits = 0;
+        while (i < {n} && hits >= 0) {
+            if (i % 10 == 0 && expensive(i))
+                hits = hits + 1;
+            if (i % 10 != 0 || expensive(i + 1))
+                hits = hits + 1;
+            i = i + 1;
+        }
+        print(hits);
+    }"""
+
+
+def eager(prog: Program) -> Program:
+    """
+    Turns every && and || of prog back into a plain BinaryExpr, which
+    evaluates both sides (the same result on bools without side effects)
+    """
+    for f in prog.funcs:
+        for node in (n for s in f.stmts if type(s) != str for n in walk(s)):
+            if type(node) in (AndExpr, OrExpr):
+                node.__class__ = BinaryExpr
+    return prog
+
+
+def bench_guards(n: float):
+    """
+    Runs a loop whose ifs call a function behind a cheap && or || guard, on
+    every engine, with short-circuit && and || and with both sides always
+    evaluated
+    """
+    text = GUARD_PROGRAM.replace("{n}", str(int(n)))
+    short = typechecker.check(parse_quietly("guards", text))
+    full = eager(typechecker.check(parse_quietly("guards", text)))
+    short_code = vm.Compiler().program(short)
+    full_code = vm.Compiler().program(full)
+    expected = run_captured(full.eval)
+    for name, fn in (("eval", short.eval), ("vm", vm.VM(short_code).main),
+                     ("closures", lambda: closures.run(short)), ("eager closures", lambda: closures.run(full))):
+        if run_captured(fn) != expected:
+            raise AssertionError("guards: {0} output differs from eager eval".format(name))
+    rows = [("Program.eval (eager)", best_of(lambda: run_captured(full.eval))),
+            ("Program.eval", best_of(lambda: run_captured(short.eval))),
+            ("vm.VM (eager)", best_of(lambda: run_captured(vm.VM(full_code).main))),
+            ("vm.VM", best_of(lambda: run_captured(vm.VM(short_code).main))),
+            ("closures.run (eager)", best_of(lambda: run_captured(lambda: closures.run(full)))),
+            ("closures.run", best_of(lambda: run_captured(lambda: closures.run(short))))]
+    report("Guards: n = {0}, short-circuit && and || against eager".format(int(n)), rows, int(n), "iterations")
+
+
+# name -> (program, what it prints type checked, what it prints with --no-check),
+# a run ending in an error printing its message; None for a program the type
+# checker rejects
+CHECK_PROGRAMS = {
+    # the type checker converts arguments and return values to the declared
+    # types; without it they keep the type they were computed with
+    "call coercion": ("""
+        int trunc(float x) {
+            return x;
+        }
+        float widen(int n) {
+            return n;
+        }
+        float half(float x) {
+            return x / 2;
+        }
+        int main() {
+            print(trunc(2.7), widen(3), half(3));
+        }""", "2\n3.0\n1.5\n", "2.7\n3\n1.5\n"),
+    # k changes inside the loop, in an if, so k * 3 is not invariant
+    "hoisting past a nested if": ("""
+        int main() {
+            int i;
+            int k;
+            int s;
+            i = 0;
+            k = 1;
+            s = 0;
+            while (i < 6) {
+                s = s + k * 3;
+                if (i == 2)
+                    k = 5;
+                i = i + 1;
+            }
+            print(s);
+        }""", "54\n", "54\n"),
+    # a * b must be computed again after the if that may assign a
+    "sharing stops at an if": ("""
+        int main() {
+            int a;
+            int b;
+            int x;
+            int y;
+            a = 2;
+            b = 3;
+            x = a * b + 1;
+            if (x > 0)
+                a = 10;
+            y = a * b + 1;
+            print(x, y);
+        }""", "7\n31\n", "7\n31\n"),
+    # u is only set on one branch, so u * 2 can be None and is not hoisted
+    # into a typed temporary
+    "variable set on one branch": ("""
+        int f(int c) {
+            int u;
+            int i;
+            if (c > 0)
+                u = 4;
+            i = 0;
+            while (i < 2) {
+                print(u * 2)
+                i = i + 1;
+            }
+            return i;
+        }
+        int main() {
+            print(f(1));
+            print(f(0));
+        }""", "8\n8\n2\nNone\nNone\n2\n", "8\n8\n2\nNone\nNone\n2\n"),
+    # x - 0 keeps -0.0; float / 4 and / 0.5 become multiplications
+    "reduced float operations": ("""
+        int main() {
+            float x;
+            float z;
+            int n;
+            x = 3.0;
+            z = -0.0;
+            n = 7;
+            print(x - 0, z - 0, x / 4, x / 0.5, n / 8, n - 0);
+        }""", "3.0\n-0.0\n0.75\n6.0\n0.875\n7\n", "3.0\n-0.0\n0.75\n6.0\n0.875\n7\n"),
+    # && and || skip g on a bool that decides (or None) whether type
+    # checked or not; on ints both sides run
+    "short-circuit": ("""
+        bool g(int x) {
+            print("g", x)
+            return true;
+        }
+        int k(int x) {
+            print("k", x)
+            return x;
+        }
+        int main() {
+            bool b;
+            int n;
+            bool u;
+            b = false && g(1);
+            print(b);
+            b = true || g(2);
+            print(b);
+            b = true && g(3);
+            print(b);
+            b = false || g(4);
+            print(b);
+            n = 6 && k(3);
+            print(n, 6 || k(8));
+            print(u && g(5), u || g(6));
+            if (false && g(7))
+                print("no")
+            else
+                print("else");
+            while (true && n > 0 && g(n))
+                n = n - 3;
+            print(n);
+        }""", "False\nTrue\ng\n3\nTrue\ng\n4\nTrue\nk\n3\nk\n8\n2\n14\nNone\nNone\nelse\ng\n2\n-1\n", "False\nTrue\ng\n3\nTrue\ng\n4\nTrue\nk\n3\nk\n8\n2\n14\nNone\nNone\nelse\ng\n2\n-1\n"),
+    # a call to an undefined function, or with the wrong number of
+    # arguments, fails only if it runs, before its arguments are evaluated
+    "bad calls": ("""
+        int g(int x) {
+            print("g", x)
+            return x;
+        }
+        int main() {
+            int n;
+            n = 1;
+            if (n > 5)
+                print(nope(g(n)));
+            if (n > 5)
+                print(g(g(n), 2));
+            print("ran")
+            n = g(g(2), 3);
+        }""", None, "ran\nError: function g expected 1 parameters, got 2\n"),
+}
+
+# name -> (program, the errors the type checker rejects it with)
+REJECTED_PROGRAMS = {
+    # bool is not a number: only &&, ||, == and != take two bools, and
+    # nothing mixes a bool with an int
+    "bool operands": ("""
+        int main() {
+            int n;
+            bool b;
+            b = true && 5;
+            n = true + 1;
+            n = 3 << false;
+            b = true < false;
+            b = (n > 0) || (n < 9);
+            b = b != true;
+        }""", "Error: Type Mismatch, bool && int in (true && 5) in function main\n"
+              "Error: Type Mismatch, bool + int in (true + 1) in function main\n"
+              "Error: Type Mismatch, int << bool in (3 << false) in function main\n"
+              "Error: Type Mismatch, bool < bool in (true < false) in function main"),
+}
+
+
+def engines(name: str, text: str, checked: bool):
+    """
+    (engine, function running text) for every engine and for the optimized
+    tree, each on its own freshly parsed (and if checked, type checked) copy
+    """
+    def fresh() -> Program:
+        prog = parse_quietly(name, text)
+        return typechecker.check(prog) if checked else prog
+    tree = fresh()
+    opt = optimizer.optimize(fresh())
+    functions = vm.Compiler().program(fresh())
+    closure = fresh()
+    python = fresh()
+    return [("eval", tree.eval), ("optimized eval", opt.eval), ("vm", vm.VM(functions).main),
+            ("closures", lambda: closures.run(closure)), ("pysource", lambda: pysource.run(python))]
+
+
+def failing(fn: Callable[[], object]):
+    """
+    Runs fn, printing the message of the SLUCFunctionError it ends with
+    """
+    try:
+        fn()
+    except SLUCFunctionError as e:
+        print(e.message)
+
+
+def bench_checks(n: float):
+    """
+    Runs the CHECK_PROGRAMS on every engine, type checked and not, and
+    checks what each prints, then checks the type checker rejects the
+    REJECTED_PROGRAMS
+    """
+    for name, (text, typed, untyped) in CHECK_PROGRAMS.items():
+        for checked, expected in ((True, typed), (False, untyped)):
+            if expected is None:
+                continue
+            for engine, fn in engines(name, text, checked):
+                out = run_captured(lambda: failing(fn))
+                if out != expected:
+                    raise AssertionError("{0}: {1}{2} printed {3!r}, expected {4!r}".format(
+                        name, engine, "" if checked else " (--no-check)", out, expected))
+        print("{0}: ok".format(name))
+    for name, (text, errors) in REJECTED_PROGRAMS.items():
+        try:
+            typechecker.check(parse_quietly(name, text))
+        except typechecker.SLUCTypeError as e:
+            if e.message != errors:
+                raise AssertionError("{0}: rejected with {1!r}, expected {2!r}".format(name, e.message, errors))
+        else:
+            raise AssertionError("{0}: type checked, expected {1!r}".format(name, errors))
+        print("{0}: ok".format(name))
+
+
+def commit() -> str:
+    """
+    The commit the benchmarks ran on, or "" outside a git checkout
+    """
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ""
+
+
+def run_suite(scale: float = 1.0, repeat: int = 3, seed: int = 364) -> dict:
+    """
+    Times the lexer (Lexer.token_generator), the parser (Parser.program on
+    tokens lexed beforehand) and the evaluator (Program.eval of the type
+    checked tree, printing into a Capture) on their own, for every workload
+    at every size, and returns the results as a JSON-ready dict
+    """
+    results = []
+    for name, generate in workloads.workloads.items():
+        for size, n in workloads.sizes.items():
+            functions = max(1, int(n * scale))
+            src = generate(functions, seed)
+            tokens = list(Lexer(name, src).tokens())
+
+            def parse():
+                p = Parser(name, src)
+                p.tg = TokenStream(Lexed(src, tokens))
+                with redirect_stdout(io.StringIO()):
+                    return p.program()
+
+            prog = parse()
+            typechecker.check(prog)
+            results.append({
+                "workload": name, "size": size, "functions": functions,
+                "bytes": len(src), "tokens": len(tokens),
+                "lexer": best_of(lambda: list(Lexer(name, src).token_generator()), repeat),
+                "parser": best_of(parse, repeat),
+                "eval": best_of(lambda: prog.eval(Capture()), repeat),
+            })
+    return {"commit": commit(), "python": platform.python_version(), "machine": platform.machine(),
+            "scale": scale, "repeat": repeat, "seed": seed, "results": results}
+
+
+stages = ("lexer", "parser", "eval")
+
+
+def bench_suite(scale: float):
+    """
+    Runs the suite and prints its results as JSON
+    """
+    json.dump(run_suite(scale), sys.stdout, indent=1)
+    print()
+
+
+def compare(old: dict, new: dict, tolerance: float = 0.1) -> int:
+    """
+    Prints the time of every stage of every workload in two suite results
+    side by side and returns how many got slower by more than tolerance
+    (0.1 = 10%)
+    """
+    before = {(r["workload"], r["size"]): r for r in old["results"]}
+    print("{0} -> {1}".format(old.get("commit") or "old", new.get("commit") or "new"))
+    print('{:<16}{:<8}{:<8}{:>12}{:>12}{:>10}'.format("Workload", "Size", "Stage", "Before s", "After s", "Change"))
+    print("-" * 66)
+    slower = 0
+    for r in new["results"]:
+        o = before.get((r["workload"], r["size"]))
+        if o is None or o["bytes"] != r["bytes"]:
+            continue  # a different program; nothing to compare
+        for stage in stages:
+            change = r[stage] / o[stage] - 1
+            flag = ""
+            if change > tolerance:
+                slower += 1
+                flag = "  slower"
+            print('{:<16}{:<8}{:<8}{:>12.4f}{:>12.4f}{:>+9.1%}{}'.format(
+                r["workload"], r["size"], stage, o[stage], r[stage], change, flag))
+    return slower
+
+
+if __name__ == "__main__":
+    if len(sys.argv) >= 4 and sys.argv[1] == "compare":
+        with open(sys.argv[2]) as f:
+            old = json.load(f)
+        with open(sys.argv[3]) as f:
+            new = json.load(f)
+        sys.exit(1 if compare(old, new, float(sys.argv[4]) if len(sys.argv) > 4 else 0.1) else 0)
+    # name -> (benchmark, default size)
+    benches = {"lexer": (bench_lexer, 2.0), "parser": (bench_parser, 1.0),
+               "expressions": (bench_expressions, 1.0), "incremental": (bench_incremental, 1.0),
+               "coldstart": (bench_coldstart, 1.0),
+               "engines": (bench_engines, 20000),
+               "calls": (bench_calls, 200), "depth": (bench_depth, 100000),
+               "batch": (bench_batch, 100000), "parallel": (bench_parallel, 64),
+               "output": (bench_output, 100000), "profile": (bench_profile, 20000),
+               "guards": (bench_guards, 20000), "checks": (bench_checks, 1),
+               "suite": (bench_suite, 1.0)}
+    if len(sys.argv) < 2 or sys.argv[1] not in benches:
+        print("usage: python benchmark.py {0} [size]".format("|".join(benches)))
+        sys.exit(1)
+    bench, size = benches[sys.argv[1]]
+    bench(float(sys.argv[2]) if len(sys.argv) > 2 else size)
@@ -0,0 +1,284 @@
+"""
+SLU-C closure compiler
+
+Walks the AST once and turns every node into a Python closure that takes a
+frame (the list of slot values FunctionDef.resolve laid out). Operator
+functions, slots and literal values are looked up and converted while
+compiling, so running a program does none of the per-eval work of
+Program.eval but prints the same output.
+"""
+from typing import Callable, Dict, List, Optional
+from operator import itemgetter
+from ast import *
+from output import Output
+
+
+class ClosureFunction:
+    """
+    One compiled FunctionDef: the closures of its top-level statements and
+    what it needs to build a frame.
+    """
+    def __init__(self, f: FunctionDef):
+        self.name = str(f.id)
+        self.nparams = f.nparams
+        self.blank = f.blank
+        self.body = []
+
+    def __call__(self, args: List) -> Optional[object]:
+        if len(args) != self.nparams:
+            raise SLUCFunctionError("Error: function {0} expected {1} parameters, got {2}".format(
+                self.name, self.nparams, len(args)))
+        frame = args + self.blank
+        for s in self.body:
+            r = s(frame)
+            if r is not None:
+                return r
+        return None
+
+
+class ClosureCompiler:
+    """
+    Compiles a Program into ClosureFunctions, one per function. Like eval,
+    a statement closure returns the function's result once a return runs
+    and None otherwise. Prints go to out.
+    """
+    def __init__(self, out: Optional[Output] = None):
+        self.functions = {}
+        self.out = Output() if out is None else out
+
+    def program(self, prog: Program) -> Dict[str, ClosureFunction]:
+        # create every function first so calls can be bound directly
+        for f in prog.funcs:
+            self.functions[str(f.id)] = ClosureFunction(f)
+        for f in prog.funcs:
+            self.functions[str(f.id)].body = [self.statement(s) for s in f.stmts
+                                              if type(s) != str]
+        return self.functions
+
+    def statement(self, s) -> Callable:
+        if s is None or type(s) == str:
+            return lambda frame: None
+        return getattr(self, "compile_" + type(s).__name__)(s)
+
+    def compile_ReturnStmt(self, s: ReturnStmt) -> Callable:
+        return self.expression(s.exp)
+
+    def compile_Assignment(self, s: Assignment) -> Callable:
+        exp = self.expression(s.exp)
+        slot = s.slot
+        t = s.t
+
+        if t == "int":
+            def store(frame):
+                v = exp(frame)
+                if type(v) is int:
+                    frame[slot] = v
+                elif type(v) is float:
+                    frame[slot] = int(v)
+                else:
+                    raise SLUCFunctionError("Error: Type Mismatch")
+        elif t == "float":
+            def store(frame):
+                v = exp(frame)
+                if type(v) is float:
+                    frame[slot] = v
+                elif type(v) is int:
+                    frame[slot] = float(v)
+                else:
+                    raise SLUCFunctionError("Error: Type Mismatch")
+        else:
+            def store(frame):
+                v = exp(frame)
+                if type(v).__name__ != t:
+                    raise SLUCFunctionError("Error: Type Mismatch")
+                frame[slot] = v
+        return store
+
+    def compile_TypedAssignment(self, s: TypedAssignment) -> Callable:
+        exp = self.expression(s.exp)
+        slot = s.slot
+
+        def store(frame):
+            v = exp(frame)
+            if v is None:
+                raise SLUCFunctionError("Error: Type Mismatch")
+            frame[slot] = v
+        return store
+
+    def compile_Block(self, s: Block) -> Callable:
+        stmts = [self.statement(j) for i in s.stmts for j in i if type(j) != str]
+
+        def block(frame):
+            for st in stmts:
+                r = st(frame)
+                if r is not None:
+                    return r
+        return block
+
+    def compile_IfStmt(self, s: IfStmt) -> Callable:
+        cond = self.expression(s.cond)
+        truepart = self.statement(s.truepart)
+        falsepart = [self.statement(i) for i in s.falsepart]
+        if len(falsepart) == 0:
+            def ifstmt(frame):
+                if cond(frame):
+                    return truepart(frame)
+        elif len(falsepart) == 1:
+            other = falsepart[0]
+
+            def ifstmt(frame):
+                if cond(frame):
+                    return truepart(frame)
+                return other(frame)
+        else:
+            def ifstmt(frame):
+                if cond(frame):
+                    return truepart(frame)
+                for i in falsepart:
+                    r = i(frame)
+                    if r is not None:
+                        return r
+        return ifstmt
+
+    def compile_WhileStmt(self, s: WhileStmt) -> Callable:
+        cond = self.expression(s.cond)
+        body = self.statement(s.inLoop)
+
+        def whilestmt(frame):
+            while cond(frame):
+                r = body(frame)
+                if r is not None:
+                    return r
+        return whilestmt
+
+    def compile_PrintStmt(self, s: PrintStmt) -> Callable:
+        args = [self.expression(a) for a in [s.pArg] + list(s.pArgList or [])]
+        write = self.out.write
+
+        def printstmt(frame):
+            write([a(frame) for a in args])
+        return printstmt
+
+    def expression(self, e: Expr) -> Callable:
+        return getattr(self, "compile_" + type(e).__name__)(e)
+
+    def compile_LitExpr(self, e: LitExpr) -> Callable:
+        value = e.eval(None, None)
+        return lambda frame: value
+
+    compile_ConstExpr = compile_LitExpr
+
+    def compile_IDExpr(self, e: IDExpr) -> Callable:
+        return itemgetter(e.slot)
+
+    def compile_BinaryExpr(self, e: BinaryExpr) -> Callable:
+        fn = ops[e.op]
+        if type(e.left) == IDExpr and isinstance(e.right, LitExpr):
+            slot = e.left.slot
+            c = e.right.eval(None, None)
+
+            def local_const(frame):
+                l = frame[slot]
+                return None if l is None else fn(l, c)
+            return local_const
+        if type(e.left) == IDExpr and type(e.right) == IDExpr:
+            ls = e.left.slot
+            rs = e.right.slot
+
+            def local_local(frame):
+                l = frame[ls]
+                r = frame[rs]
+                return None if l is None or r is None else fn(l, r)
+            return local_local
+        left = self.expression(e.left)
+        right = self.expression(e.right)
+
+        def binary(frame):
+            l = left(frame)
+            r = right(frame)
+            return None if l is None or r is None else fn(l, r)
+        return binary
+
+    def compile_AndExpr(self, e: AndExpr) -> Callable:
+        if e.type is None:
+            return self.unchecked(e, False)
+        if e.type != "bool":
+            return self.compile_BinaryExpr(e)
+        left = self.expression(e.left)
+        right = self.expression(e.right)
+        # False or None on the left is the result
+        return lambda frame: left(frame) and right(frame)
+
+    def compile_OrExpr(self, e: OrExpr) -> Callable:
+        if e.type is None:
+            return self.unchecked(e, True)
+        if e.type != "bool":
+            return self.compile_BinaryExpr(e)
+        left = self.expression(e.left)
+        right = self.expression(e.right)
+
+        def or_(frame):
+            l = left(frame)
+            return l if l or l is None else right(frame)
+        return or_
+
+    def unchecked(self, e: BinaryExpr, decides: bool) -> Callable:
+        """
+        && (decides False) or || (decides True) not type checked: a left
+        value that is the bool decides, or None, skips right, like
+        AndExpr.eval
+        """
+        left = self.expression(e.left)
+        right = self.expression(e.right)
+        fn = ops[e.op]
+
+        def logical(frame):
+            l = left(frame)
+            if l is decides or l is None:
+                return l
+            r = right(frame)
+            return None if r is None else fn(l, r)
+        return logical
+
+    def compile_UnaryOp(self, e: UnaryOp) -> Callable:
+        tree = self.expression(e.tree)
+        return lambda frame: tree(frame) * -1
+
+    def compile_Coercion(self, e: Coercion) -> Callable:
+        exp = self.expression(e.exp)
+        conv = e.conv
+
+        def coerce(frame):
+            v = exp(frame)
+            return None if v is None else conv(v)
+        return coerce
+
+    def compile_FunctionExpr(self, e: FunctionExpr) -> Callable:
+        func = self.functions.get(e.id)
+        if func is None:
+            message = "Error: function {0} is not defined".format(e.id)
+        elif len(e.params) != func.nparams:
+            message = "Error: function {0} expected {1} parameters, got {2}".format(
+                e.id, func.nparams, len(e.params))
+        else:
+            params = [self.expression(p) for p in e.params]
+            return lambda frame: func([p(frame) for p in params])
+
+        # a bad call fails when it runs, before its arguments, like FunctionExpr.eval
+        def fail(frame):
+            raise SLUCFunctionError(message)
+        return fail
+
+
+def run(prog: Program, out: Optional[Output] = None):
+    """
+    Closure-compiles prog and runs its main function, flushing out at the end
+    """
+    if out is None:
+        out = Output()
+    functions = ClosureCompiler(out).program(prog)
+    try:
+        if "main" in functions:
+            functions["main"]([])
+    finally:
+        out.flush()
@@ -1,5 +1,8 @@
 import sys
-from typing import Generator, Tuple
+from typing import Generator, Tuple, Union, Optional
+from bisect import bisect_left, bisect_right
+import io
+import mmap
 import re
 
 """
@@ -40,92 +43,213 @@ class Lexer:
     RPAREN = "Right paren"
 
 
+    split_patt = re.compile(
+        r"""            # Split on
+            ((?<!(e|_))\+) |      # plus and capture (minus is not special unless in [])
+            ((?<!(e|_))-) | 
+            (\*)(?!(\/)) |      # multiply and capture
+            (\/)(?!(\/|\*)) |      # divide and capture (if not followed by another / or *)
+            (//) |      # comment indicator and capture
+            (/\*) |     # multiline comment beginning
+            (\*/) |     # multiline comment ending
+            
+            (\s)   |      # whitespace
+            (\{) |      # left brace and capture
+            (\}) |      # right brace and capture
+            (\[) |      # left bracket and capture
+            (\]) |      # right bracket and capture
+            (\() |      # left paren and capture
+            (\)) |       # right paren and capture
+            (\<)(?!(\=|\<)) |   # less than and capture (if not followed by =)
+            (\<\=) |
+            (\>)(?!(\=|\>)) |   # greater than and capture (if not followed by =)
+            (\>\=) |
+            (\<\<) |    # binary left shift and capture
+            (\>\>) |    # binary right shift and capture
+            (,)  |
+            (;)  |
+            (!)(?!(\=)) |
+            ((?<!(\\))\") |
+            ((?<!(\\))\') |
+            (:)
+        """,
+        re.VERBOSE
+    )
+
+    tokenDict = {
+        # the numbers int() and float() take: "_" only between digits
+        '[0-9](_?[0-9])*$': INTLIT,
+        '(([0-9](_?[0-9])*)?\.[0-9](_?[0-9])*|[0-9](_?[0-9])*\.)([eE][-+]?[0-9](_?[0-9])*)?$|'
+        '[0-9](_?[0-9])*[eE][-+]?[0-9](_?[0-9])*$': FLOATLIT,
+        'print|bool|else|false|if|true|float|int|char|while|main|return': KEYWORD,
+        '^[_a-zA-Z][_a-zA-Z0-9]*': ID,
+        '(^\".+\")|(^\'.+\')': STRINGLIT,
+        '\|\|': OR,
+        '&&': AND,
+        '==': EQ,
+        '\!\=': NEQ,
+        '\<=': LTE,
+        '\<(?!\=|\<)': LT,
+        '\>\=': GTE,
+        '\>(?!\=|\>)': GT,
+        '\<\<': BLS,
+        '\>\>': BRS,
+        '=': ASSIGN,
+        '\+': PLUS,
+        '-': MINUS,
+        '\*(?!\/)': MULT,
+        '\/(?!\/|\*)': DIV,
+        '%': MOD,
+        '!': FACT,
+        ';': SEMI,
+        '\,': COMMA,
+        '\{': LBRACE,
+        '\}': RBRACE,
+        '\[': LBRACKET,
+        '\]': RBRACKET,
+        '\(': LPAREN,
+        '\)': RPAREN
+    }
+
+    # tokenDict as one alternation; the first pattern that matches wins, just
+    # like walking tokenDict in order
+    classify_patt = re.compile(
+        "|".join("(?P<K{0}>{1})".format(i, p) for i, p in enumerate(tokenDict))
+    )
+    classify_kinds = {"K{0}".format(i): k for i, k in enumerate(tokenDict.values())}
+    keyword_group = "K{0}".format(list(tokenDict.values()).index(KEYWORD))
+
+    # one pass over the whole (bytes) buffer. NUM is a whole int or float
+    # literal, exponent sign included; OP and CHUNK produce the pieces
+    # split_patt would have produced, except that split_patt never splits a
+    # "+" or "-" off a piece ending in e or _ (so x = e-6 would be one piece).
+    # Strings and comments, including multi-line comments, are matched whole
+    # instead of being tracked by hand.
+    master_patt = re.compile(
+        rb"""
+            (?P<WS>\s+) |
+            (?P<COMMENT>//[^\n]*) |
+            (?P<MLCOMMENT>/\*(?:[^*/]+|\*(?!/)|//|/\*|/(?![/*]))*(?:\*/|\Z)) |
+            (?<!\\)"(?P<DQ>(?:[^"\n]|(?<=\\)")*)(?<!\\)" |
+            (?<!\\)'(?P<SQ>(?:[^'\n]|(?<=\\)')*)(?<!\\)' |
+            (?P<UNCLOSED>(?<!\\)["'][^\n]*) |
+            (?P<NUM>(?:[0-9](?:_?[0-9])*(?:\.(?:[0-9](?:_?[0-9])*)?)? | \.[0-9](?:_?[0-9])*)
+                    (?:[eE][-+]?[0-9](?:_?[0-9])*)?(?![\w.])) |
+            (?P<OP>[+\-] | \*/? | / | <[=<]? | >[=>]? | !(?!=) | [{}\[\](),;:]) |
+            (?P<CHUNK>(?:[^+\-*/\s{}\[\]()<>,;!"':] | !(?==) | (?<=\\)["'])+)
+        """,
+        re.VERBOSE
+    )
+
+    f = None        # the file buf maps, if it was read from one
+    length = 0      # of the buffer, kept once it is closed
+    last_line = 1   # set once tokens() reaches the end of the buffer
+
     # fn - file name we are lexing
-    def __init__(self, fn: str):
+    # source - optional str/bytes/memoryview to lex instead of reading fn
+    def __init__(self, fn: str, source: Optional[Union[str, bytes, memoryview]] = None):
 
+        self.fn = fn
+        if source is not None:
+            self.buf = source.encode() if isinstance(source, str) else source
+            return
         try:
-            self.f = open(fn)
+            self.f = open(fn, "rb")
         except IOError:
             print("File {} not found".format(fn))
             print("Exiting")
             sys.exit(1)  # can't go on
+        try:
+            self.buf = mmap.mmap(self.f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty files cannot be mapped
+            self.buf = b""
+
+    def newline_index(self) -> list:
+        """
+        Returns the offsets of every newline in the buffer, so the line of any
+        offset is one bisect away
+        """
+        return [m.start() for m in re.finditer(b"\n", self.buf)]
+
+    def tokens(self) -> Generator["Token", None, None]:
+        """
+        Returns the tokens of the language as Token objects. The whole buffer
+        is scanned once with master_patt and each distinct piece of text is
+        classified and decoded, and each number converted, only once.
+        """
+        newlines = self.newline_index()
+        kinds = {}
+        classify = Lexer.classify_patt.match
+        for m in Lexer.master_patt.finditer(self.buf):
+            group = m.lastgroup
+            if group == "WS" or group == "COMMENT" or group == "MLCOMMENT":
+                continue
+            if group == "CHUNK" or group == "OP" or group == "NUM":
+                start, end = m.span()
+                b = m.group()
+                tok = kinds.get(b)
+                if tok is None:
+                    t = b.decode()
+                    if group == "NUM":
+                        if b"." in b or b"e" in b or b"E" in b:
+                            tok = (Kind.FLOATLIT, t, float(t))
+                        else:
+                            tok = (Kind.INTLIT, t, int(t))
+                    else:
+                        c = classify(t)
+                        if c is None:
+                            tok = (Kind.ILLEGAL, t, None)
+                        elif c.lastgroup == Lexer.keyword_group:
+                            tok = (Kind.KEYWORDS.get(t, Kind.KEYWORD), t, None)
+                        else:
+                            tok = (Kind.CODES[Lexer.classify_kinds[c.lastgroup]], t, None)
+                    kinds[b] = tok
+                yield Token(tok[0], tok[1], start, end, bisect_right(newlines, start) + 1, tok[2])
+            elif group == "UNCLOSED":
+                start, end = m.span()
+                yield Token(Kind.ILLEGAL, "[MISSING \"]", start, end, bisect_right(newlines, start) + 1)
+            else:
+                start, end = m.span(group)
+                yield Token(Kind.STRINGLIT, m.group(group).decode(), start, end,
+                            bisect_right(newlines, start) + 1)
+        # the last line with anything on it, where EOF is reported
+        end = len(self.buf)
+        while end and self.buf[end - 1] in b" \t\n\r\x0b\x0c":
+            end -= 1
+        self.last_line = bisect_left(newlines, end) + 1
+        self.length = len(self.buf)
+        self.close()
 
-    def token_generator(self) -> Generator[Tuple[int, str], None, None]:
+    def close(self):
         """
-        Returns the tokens of the language
+        Unmaps the buffer and closes the file it was read from. tokens()
+        does this when it gets to the end; lexing the buffer again is an
+        error after that.
         """
+        if self.f is not None:
+            if isinstance(self.buf, mmap.mmap):
+                self.buf.close()
+            self.f.close()
+            self.f = None
 
-        split_patt = re.compile(
-            r"""            # Split on
-                ((?<!(e|_))\+) |      # plus and capture (minus is not special unless in [])
-                ((?<!(e|_))-) | 
-                (\*)(?!(\/)) |      # multiply and capture
-                (\/)(?!(\/|\*)) |      # divide and capture (if not followed by another / or *)
-                (//) |      # comment indicator and capture
-                (/\*) |     # multiline comment beginning
-                (\*/) |     # multiline comment ending
-                
-                (\s)   |      # whitespace
-                (\{) |      # left brace and capture
-                (\}) |      # right brace and capture
-                (\[) |      # left bracket and capture
-                (\]) |      # right bracket and capture
-                (\() |      # left paren and capture
-                (\)) |       # right paren and capture
-                (\<)(?!(\=|\<)) |   # less than and capture (if not followed by =)
-                (\<\=) |
-                (\>)(?!(\=|\>)) |   # greater than and capture (if not followed by =)
-                (\>\=) |
-                (\<\<) |    # binary left shift and capture
-                (\>\>) |    # binary right shift and capture
-                (,)  |
-                (;)  |
-                (!)(?!(\=)) |
-                ((?<!(\\))\") |
-                ((?<!(\\))\') |
-                (:)
-            """,
-            re.VERBOSE
-        )
-
-        tokenDict = {
-            "([0-9][_0-9]*[0-9]$|[0-9]$)": Lexer.INTLIT,
-            '(^[1-9][_0-9]*(\.)?(_)*[_0-9]*[e|_0-9](-|\+)?[_0-9]*[0-9]$)|([0-9]*\.[0-9]*$)': Lexer.FLOATLIT,
-            'print|bool|else|false|if|true|float|int|char|while|main|return': Lexer.KEYWORD,
-            '^[_a-zA-Z][_a-zA-Z0-9]*': Lexer.ID,
-            '(^\".+\")|(^\'.+\')': Lexer.STRINGLIT,
-            '\|\|': Lexer.OR,
-            '&&': Lexer.AND,
-            '==': Lexer.EQ,
-            '\!\=': Lexer.NEQ,
-            '\<=': Lexer.LTE,
-            '\<(?!\=|\<)': Lexer.LT,
-            '\>\=': Lexer.GTE,
-            '\>(?!\=|\>)': Lexer.GT,
-            '\<\<': Lexer.BLS,
-            '\>\>': Lexer.BRS,
-            '=': Lexer.ASSIGN,
-            '\+': Lexer.PLUS,
-            '-': Lexer.MINUS,
-            '\*(?!\/)': Lexer.MULT,
-            '\/(?!\/|\*)': Lexer.DIV,
-            '%': Lexer.MOD,
-            '!': Lexer.FACT,
-            ';': Lexer.SEMI,
-            '\,': Lexer.COMMA,
-            '\{': Lexer.LBRACE,
-            '\}': Lexer.RBRACE,
-            '\[': Lexer.LBRACKET,
-            '\]': Lexer.RBRACKET,
-            '\(': Lexer.LPAREN,
-            '\)': Lexer.RPAREN
-        }
+    def token_generator(self) -> Generator[Tuple[str, str, int], None, None]:
+        """
+        Returns the tokens of the language as (kind, text, line) tuples
+        """
+        for tok in self.tokens():
+            yield (Kind.NAMES[tok.kind], tok.text, tok.line)
 
+    def legacy_token_generator(self) -> Generator[Tuple[str, str, int], None, None]:
+        """
+        Returns the tokens of the language, splitting each line with split_patt
+        and trying every pattern in tokenDict on each piece. Kept as the
+        reference that token_generator is checked and benchmarked against.
+        """
         line_num = 0
         in_something = 0
-        for line in self.f:
+        for line in io.StringIO(bytes(self.buf).decode(), newline=None):
             line_num += 1
-            tokens = (t for t in split_patt.split(line) if t)
+            tokens = (t for t in Lexer.split_patt.split(line) if t)
             for t in tokens:
                 matched = 0
                 # if tokens are in between quotes, they are merged and yielded as 1 string object
@@ -156,9 +280,9 @@ class Lexer:
                     if re.match('\s', t):
                         continue
                     # go through all tokens regexes to find a match
-                    for i in tokenDict.keys():
+                    for i in Lexer.tokenDict.keys():
                         if re.match(i, t):
-                            yield (tokenDict[i], t, line_num)
+                            yield (Lexer.tokenDict[i], t, line_num)
                             matched = 1
                             break
                     if matched == 0:
@@ -173,6 +297,60 @@ class Lexer:
                 yield ("ILLEGAL", "[MISSING \"]", line_num)
 
 
+class Kind:
+    """
+    Small-int token kinds. Every keyword has its own kind so the parser can
+    dispatch on kind alone; words that merely start with a keyword (tokenDict
+    matches keywords as prefixes) keep the generic KEYWORD kind.
+    """
+    (INTLIT, FLOATLIT, STRINGLIT, ID, KEYWORD, OR, AND, EQ, NEQ, LT, LTE, GT, GTE,
+     BLS, BRS, ASSIGN, PLUS, MINUS, MULT, DIV, MOD, FACT, SEMI, COMMA, LBRACE,
+     RBRACE, LBRACKET, RBRACKET, LPAREN, RPAREN, ILLEGAL,
+     PRINT, BOOL, ELSE, FALSE, IF, TRUE, FLOAT, INT, CHAR, WHILE, MAIN, RETURN,
+     EOF) = range(44)
+
+    # kind -> the Lexer kind string used by the tuple API
+    NAMES = (Lexer.INTLIT, Lexer.FLOATLIT, Lexer.STRINGLIT, Lexer.ID, Lexer.KEYWORD, Lexer.OR,
+             Lexer.AND, Lexer.EQ, Lexer.NEQ, Lexer.LT, Lexer.LTE, Lexer.GT, Lexer.GTE, Lexer.BLS,
+             Lexer.BRS, Lexer.ASSIGN, Lexer.PLUS, Lexer.MINUS, Lexer.MULT, Lexer.DIV, Lexer.MOD,
+             Lexer.FACT, Lexer.SEMI, Lexer.COMMA, Lexer.LBRACE, Lexer.RBRACE, Lexer.LBRACKET,
+             Lexer.RBRACKET, Lexer.LPAREN, Lexer.RPAREN, "ILLEGAL") + (Lexer.KEYWORD,) * 12 + ("EOF",)
+    CODES = {name: code for code, name in enumerate(NAMES[:ILLEGAL + 1])}
+    KEYWORDS = {"print": PRINT, "bool": BOOL, "else": ELSE, "false": FALSE, "if": IF,
+                "true": TRUE, "float": FLOAT, "int": INT, "char": CHAR, "while": WHILE,
+                "main": MAIN, "return": RETURN}
+
+    # kind sets the parser dispatches on
+    TYPES = frozenset({INT, BOOL, FLOAT})
+    BOOLLITS = frozenset({TRUE, FALSE})
+    UNARYOPS = frozenset({MINUS, FACT})
+
+
+class Token:
+    """
+    A token: its Kind, its text and its (start, end, line) span in the
+    lexer's buffer, and for an INTLIT or FLOATLIT its value as an int or a
+    float. Texts are shared between tokens with the same spelling.
+    """
+    __slots__ = ("kind", "text", "start", "end", "line", "value")
+
+    def __init__(self, kind: int, text: str, start: int, end: int, line: int,
+                 value: Union[int, float, None] = None):
+        self.kind = kind
+        self.text = text
+        self.start = start
+        self.end = end
+        self.line = line
+        self.value = value
+
+    def __repr__(self):
+        return "Token({0}, {1!r}, {2}, {3}, {4})".format(Kind.NAMES[self.kind], self.text,
+                                                       self.start, self.end, self.line)
+
+    def astuple(self) -> Tuple[str, str, int]:
+        return Kind.NAMES[self.kind], self.text, self.line
+
+
 # create our own exception by inheriting from python's exception
 class SLUCLexicalError(Exception):
     def __init__(self, message: str):
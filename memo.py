@@ -0,0 +1,95 @@
+"""
+SLU-C pure-function memoization
+
+A function is pure when it never prints, takes only int, float and bool
+parameters and only calls pure functions, so its result depends on its
+arguments alone. memoize makes an LRUCache for every pure function; given
+to Program.eval, they go in the run's Context, which FunctionExpr.eval
+consults before running the body.
+"""
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from ast import *
+
+value_types = {"int", "float", "bool"}
+
+
+class LRUCache:
+    """
+    Results of one function keyed by the argument values and their types
+    (1, 1.0 and true are different calls), least recently used evicted
+    first once there are more than maxsize entries. maxsize None means
+    unbounded.
+    """
+    def __init__(self, maxsize: Optional[int] = 1024):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def call(self, f: FunctionDef, args: List, ctx: Context):
+        key = (tuple(args), tuple(map(type, args)))
+        data = self.data
+        if key in data:
+            self.hits += 1
+            data.move_to_end(key)
+            return data[key]
+        self.misses += 1
+        args.extend(f.blank)
+        result = f.run(args, ctx) if ctx.profiler is None else ctx.profiler.call(f, args, ctx)
+        data[key] = result
+        if self.maxsize is not None and len(data) > self.maxsize:
+            data.popitem(last=False)
+        return result
+
+    def clear(self):
+        self.data.clear()
+        self.hits = 0
+        self.misses = 0
+
+
+def pure_functions(prog: Program) -> List[FunctionDef]:
+    """
+    Returns the functions of prog that are pure. Starts from every function
+    that is pure on its own and removes callers of impure (or undefined)
+    functions until nothing changes, so recursive functions can be pure.
+    """
+    calls = {}
+    pure = set()
+    for f in prog.funcs:
+        name = str(f.id)
+        calls[name] = set()
+        ok = all(t in value_types for t, id in f.params.eval())
+        for node in walk(f):
+            if type(node) == PrintStmt:
+                ok = False
+            elif type(node) == FunctionExpr:
+                calls[name].add(node.id)
+        if ok:
+            pure.add(name)
+    changed = True
+    while changed:
+        changed = False
+        for name in list(pure):
+            if not calls[name] <= pure:
+                pure.discard(name)
+                changed = True
+    return [f for f in prog.funcs if str(f.id) in pure]
+
+
+def memoize(prog: Program, maxsize: Optional[int] = 1024) -> Dict[str, LRUCache]:
+    """
+    Makes an LRUCache for every pure function of prog and returns them by
+    function name, for Program.eval
+    """
+    return {str(f.id): LRUCache(maxsize) for f in pure_functions(prog)}
+
+
+def report(caches: Dict[str, LRUCache]):
+    print('{:<20}{:>12}{:>12}{:>10}'.format("Function", "Hits", "Misses", "Size"))
+    print("-" * 54)
+    for name, c in caches.items():
+        print('{:<20}{:>12}{:>12}{:>10}'.format(name, c.hits, c.misses, len(c)))
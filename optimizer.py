@@ -0,0 +1,440 @@
+"""
+SLU-C AST optimizer
+
+Runs between Parser.program() and Program.eval(). It converts every literal
+once, folds constant subexpressions (including UnaryOp on constants) and
+drops the empty ";" statements the parser keeps as bare strings. On a type
+checked tree it also replaces operations by cheaper ones with the same
+result, moves expressions a while loop does not change out of the loop and
+computes an expression a run of statements repeats only once, keeping both
+in new temporary variables ($0, $1, ... declared in the function). The tree
+is rewritten in place and keeps the semantics of eval.
+"""
+import math
+from typing import Iterator, Optional
+from ast import *
+
+numeric = {"int", "float", "bool"}
+# operators that cannot fail or print on the operand types the type checker
+# allows, so an expression of them may run earlier than it was written
+safe = {"+", "-", "*", "<", "<=", ">", ">=", "==", "!=", "&&", "||"}
+
+
+class Optimizer:
+    """
+    Each optimize_ method returns the node that replaces the one it is given.
+    """
+    def __init__(self):
+        self.folded = 0
+        self.dropped = 0
+        self.reduced = 0
+        self.hoisted = 0
+        self.shared = 0
+        self.scope = None
+
+    def program(self, prog: Program) -> Program:
+        for f in prog.funcs:
+            f.stmts = self.statements(f.stmts)
+            self.function(f)
+        return prog
+
+    def statements(self, stmts: list) -> list:
+        result = []
+        for s in stmts:
+            if type(s) == str:
+                self.dropped += 1
+            else:
+                result.append(self.statement(s))
+        return result
+
+    def statement(self, s):
+        if s is None:
+            return s
+        if type(s) == str:
+            # a lone ";" as the body of an if or while
+            self.dropped += 1
+            return Block([])
+        return getattr(self, "optimize_" + type(s).__name__)(s)
+
+    def optimize_Assignment(self, s: Assignment):
+        s.exp = self.expression(s.exp)
+        return s
+
+    optimize_TypedAssignment = optimize_Assignment
+
+    def optimize_Block(self, s: Block):
+        s.stmts = [self.statements(i) for i in s.stmts]
+        return s
+
+    def optimize_IfStmt(self, s: IfStmt):
+        s.cond = self.expression(s.cond)
+        s.truepart = self.statement(s.truepart)
+        s.falsepart = self.statements(s.falsepart)
+        return s
+
+    def optimize_WhileStmt(self, s: WhileStmt):
+        s.cond = self.expression(s.cond)
+        s.inLoop = self.statement(s.inLoop)
+        return s
+
+    def optimize_PrintStmt(self, s: PrintStmt):
+        s.pArg = self.expression(s.pArg)
+        if s.pArgList is not None:
+            s.pArgList = [self.expression(i) for i in s.pArgList]
+        return s
+
+    def optimize_ReturnStmt(self, s: ReturnStmt):
+        s.exp = self.expression(s.exp)
+        return s
+
+    def expression(self, e: Expr) -> Expr:
+        return getattr(self, "optimize_" + type(e).__name__)(e)
+
+    def optimize_LitExpr(self, e: LitExpr) -> Expr:
+        return ConstExpr(e.eval(None, None))
+
+    def optimize_ConstExpr(self, e: ConstExpr) -> Expr:
+        return e
+
+    def optimize_IDExpr(self, e: IDExpr) -> Expr:
+        return e
+
+    def optimize_BinaryExpr(self, e: BinaryExpr) -> Expr:
+        e.left = self.expression(e.left)
+        e.right = self.expression(e.right)
+        if type(e.left) == ConstExpr and type(e.right) == ConstExpr:
+            return self.fold(e)
+        return self.reduce(e)
+
+    def optimize_AndExpr(self, e: AndExpr) -> Expr:
+        """
+        On two bools, true && x is x and false && x is false (x is skipped);
+        not type checked, only false && x is known: false
+        """
+        e = self.optimize_BinaryExpr(e)
+        if type(e) == AndExpr and e.type == "bool" and type(e.left) == ConstExpr:
+            self.folded += 1
+            return e.right if e.left.value else e.left
+        if type(e) == AndExpr and e.type is None and type(e.left) == ConstExpr and e.left.value is False:
+            self.folded += 1
+            return e.left
+        return e
+
+    def optimize_OrExpr(self, e: OrExpr) -> Expr:
+        e = self.optimize_BinaryExpr(e)
+        if type(e) == OrExpr and e.type == "bool" and type(e.left) == ConstExpr:
+            self.folded += 1
+            return e.left if e.left.value else e.right
+        if type(e) == OrExpr and e.type is None and type(e.left) == ConstExpr and e.left.value is True:
+            self.folded += 1
+            return e.left
+        return e
+
+    def optimize_UnaryOp(self, e: UnaryOp) -> Expr:
+        e.tree = self.expression(e.tree)
+        if type(e.tree) == ConstExpr:
+            return self.fold(e)
+        return e
+
+    def optimize_Coercion(self, e: Coercion) -> Expr:
+        e.exp = self.expression(e.exp)
+        if type(e.exp) == ConstExpr:
+            return self.fold(e)
+        return e
+
+    def optimize_FunctionExpr(self, e: FunctionExpr) -> Expr:
+        e.params = [self.expression(p) for p in e.params]
+        return e
+
+    def fold(self, e: Expr) -> Expr:
+        # anything that fails (division by zero, mismatched operands) is left
+        # for eval to fail on when, and if, it actually runs
+        try:
+            value = e.eval(None, None)
+        except Exception:
+            return e
+        if value is None:
+            return e
+        self.folded += 1
+        return ConstExpr(value)
+
+    def reduce(self, e: BinaryExpr) -> Expr:
+        """
+        Strength reduction: x / c becomes x * (1 / c) for a float x and a
+        power of two c (the same value, rounded the same way), and x + 0,
+        x - 0 and x * 1 become x where that keeps the type of the result
+        """
+        c = e.right.value if type(e.right) == ConstExpr else None
+        if e.type is None or type(c) not in (int, float):
+            return e
+        left = typeof(e.left)
+        if e.op == "/" and left == "float" and c and math.frexp(c)[0] in (0.5, -0.5) \
+                and abs(math.frexp(c)[1]) < 1000:
+            self.reduced += 1
+            r = BinaryExpr(e.left, "*", ConstExpr(1 / c))
+            r.type = "float"
+            return r
+        # -0.0 + 0 is 0.0, so only an int may drop a + 0
+        if left == e.type and (c == 0 and (e.op == "-" or e.op == "+" and left == "int")
+                               or c == 1 and e.op == "*"):
+            self.reduced += 1
+            return e.left
+        return e
+
+    def function(self, f: FunctionDef):
+        """
+        Hoists loop invariants and shares common subexpressions in f, then
+        resolves f again to give the temporaries their slots
+        """
+        self.scope = f
+        declared = len(f.decls)
+        f.stmts = self.sequence(f.stmts, set())
+        if len(f.decls) > declared:
+            f.resolve()
+
+    def sequence(self, stmts: list, definite: set) -> list:
+        """
+        Optimizes a list of statements run in order. definite holds the
+        variables that have a value whenever the list starts: any assigned
+        before it, since an assignment never stores None (an unset variable,
+        or the result of a function that fell off its end). Parameters may
+        hold None, so they are not definite.
+        """
+        entry = definite
+        definite = set(definite)
+        result = []
+        for s in stmts:
+            if type(s) == WhileStmt:
+                stores = self.hoist(s, definite)
+                result.extend(stores)
+                definite.update(i.var.id for i in stores)
+            self.nested(s, definite)
+            result.append(s)
+            if isinstance(s, Assignment):
+                definite.add(s.var.id)
+        return self.share(result, set(entry))
+
+    def nested(self, s, definite: set):
+        if type(s) == Block:
+            s.stmts = [self.sequence([j for i in s.stmts for j in i], definite)]
+        elif type(s) == IfStmt:
+            s.truepart = self.single(s.truepart, definite)
+            s.falsepart = self.sequence(s.falsepart, definite)
+        elif type(s) == WhileStmt:
+            s.inLoop = self.single(s.inLoop, definite)
+
+    def single(self, s, definite: set):
+        """
+        Optimizes the one statement of an if or while, putting it in a Block
+        with any temporaries it needs set first
+        """
+        if s is None:
+            return s
+        stmts = self.sequence([s], definite)
+        return stmts[0] if len(stmts) == 1 else Block([stmts])
+
+    def temporary(self, e: Expr, line) -> TypedAssignment:
+        """
+        Declares a new variable of e's type in the function being optimized
+        and returns the assignment of e to it
+        """
+        name = "${0}".format(sum(1 for d in self.scope.decls if d.id.startswith("$")))
+        self.scope.decls.append(Declaration(typeof(e), name))
+        store = TypedAssignment(IDExpr(name), e)
+        store.line = line
+        return store
+
+    def hoist(self, w: WhileStmt, definite: set) -> list:
+        """
+        Loop-invariant code motion: every largest expression in w whose
+        variables all have a value before the loop and are not assigned in
+        it is computed once into a temporary just before the loop. The
+        assignments are returned for the caller to insert.
+        """
+        known = definite - assigns([w])
+        stores = {}
+        for e in invariants(w, known):
+            key = str(e)
+            if key not in stores:
+                stores[key] = self.temporary(e, w.line)
+                self.hoisted += 1
+        if stores:
+            substitute(w, {key: store.var.id for key, store in stores.items()})
+        return list(stores.values())
+
+    def share(self, stmts: list, definite: set) -> list:
+        """
+        Common subexpression elimination: an expression a statement computes
+        that it and the statements after it, up to the first that assigns one
+        of its variables, compute more than once is computed into a
+        temporary before the statement instead, where that saves work
+        """
+        i = 0
+        while i < len(stmts):
+            s = stmts[i]
+            found = self.common(stmts, i, definite)
+            if found is None:
+                if isinstance(s, Assignment):
+                    definite.add(s.var.id)
+                i += 1
+                continue
+            e, end = found
+            store = self.temporary(e, s.line)
+            temps = {str(e): store.var.id}
+            for t in stmts[i:end + 1]:
+                if isinstance(t, Assignment):
+                    t.exp = replaced(t.exp, temps)
+                else:
+                    substitute(t, temps)
+            stmts.insert(i, store)
+            definite.add(store.var.id)
+            self.shared += 1
+            i += 1
+        return stmts
+
+    def common(self, stmts: list, i: int, definite: set):
+        """
+        Returns the largest expression worth sharing that statement i always
+        computes, with the index of the last statement sharing it, or None
+        """
+        s = stmts[i]
+        found = {}
+        for h in computes(s):
+            for e in walk(h):
+                if type(e) == BinaryExpr and computable(e, definite):
+                    found.setdefault(str(e), e)
+        for key in sorted(found, key=len, reverse=True):
+            names = variables(found[key])
+            if not isinstance(s, Assignment) and assigns([s]) & names:
+                continue
+            count = 0
+            end = i
+            for j in range(i, len(stmts)):
+                t = stmts[j]
+                written = assigns([t]) & names
+                if isinstance(t, Assignment):
+                    # the value is computed before it is stored
+                    count += occurrences(t.exp, key)
+                elif written:
+                    break
+                else:
+                    count += occurrences(t, key)
+                end = j
+                if written:
+                    break
+            # an evaluated node costs about the same whatever it is: the
+            # assignment and count loads must cost no more than the nodes saved
+            if count > 1 and (count - 1) * (size(found[key]) - 1) >= 2:
+                return found[key], end
+        return None
+
+
+def typeof(e: Expr) -> Optional[str]:
+    """
+    The static type of e, including constants made by folding
+    """
+    if type(e) == ConstExpr:
+        return type(e.value).__name__
+    return e.type
+
+
+def computable(e: Expr, known: set) -> bool:
+    """
+    Whether e can be computed at any point where the variables in known have
+    a value, without failing, printing or changing anything
+    """
+    t = type(e)
+    if t == ConstExpr or t == IDExpr:
+        return typeof(e) in numeric and (t == ConstExpr or e.id in known)
+    if t == UnaryOp:
+        return computable(e.tree, known)
+    if t != BinaryExpr or e.op not in safe or e.type not in numeric:
+        return False
+    # mixing int and float converts the int, which fails past 1e308
+    if e.type == "float" and e.op in ("+", "-", "*") and typeof(e.left) != typeof(e.right):
+        return False
+    return computable(e.left, known) and computable(e.right, known)
+
+
+def children(node) -> Iterator:
+    for v in vars(node).values():
+        if isinstance(v, (Expr, Stmt)):
+            yield v
+        elif type(v) == list:
+            for i in v:
+                if type(i) == list:
+                    yield from (j for j in i if isinstance(j, (Expr, Stmt)))
+                elif isinstance(i, (Expr, Stmt)):
+                    yield i
+
+
+def invariants(node, known: set) -> Iterator[Expr]:
+    """
+    Yields the largest computable binary expressions below node
+    """
+    for v in children(node):
+        if type(v) == BinaryExpr and computable(v, known):
+            yield v
+        else:
+            yield from invariants(v, known)
+
+
+def assigns(stmts: list) -> set:
+    """
+    The names of the variables any of stmts assigns
+    """
+    return {n.var.id for s in stmts if isinstance(s, Stmt) for n in walk(s) if isinstance(n, Assignment)}
+
+
+def variables(e: Expr) -> set:
+    return {n.id for n in walk(e) if type(n) == IDExpr}
+
+
+def computes(s) -> list:
+    """
+    The expressions statement s always computes
+    """
+    if isinstance(s, Assignment) or type(s) == ReturnStmt:
+        return [s.exp]
+    if type(s) in (IfStmt, WhileStmt):
+        return [s.cond]
+    if type(s) == PrintStmt:
+        return [s.pArg] + [i for i in s.pArgList or [] if isinstance(i, Expr)]
+    return []
+
+
+def occurrences(node, key: str) -> int:
+    return sum(1 for n in walk(node) if type(n) == BinaryExpr and str(n) == key)
+
+
+def size(e: Expr) -> int:
+    return sum(1 for _ in walk(e))
+
+
+def replaced(v, temps: dict):
+    """
+    Returns v with every binary expression whose text is a key of temps
+    replaced by a load of the temporary it names
+    """
+    if type(v) == BinaryExpr and str(v) in temps:
+        load = IDExpr(temps[str(v)])
+        load.type = v.type
+        return load
+    if isinstance(v, (Expr, Stmt)):
+        substitute(v, temps)
+    elif type(v) == list:
+        return [replaced(i, temps) for i in v]
+    return v
+
+
+def substitute(node, temps: dict):
+    for attr, v in list(vars(node).items()):
+        if isinstance(v, (Expr, Stmt, list)):
+            setattr(node, attr, replaced(v, temps))
+
+
+def optimize(prog: Program) -> Program:
+    """
+    Optimizes prog in place and returns it
+    """
+    return Optimizer().program(prog)
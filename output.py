@@ -0,0 +1,55 @@
+"""
+SLU-C program output
+
+Every engine prints through an Output instead of calling print() per value.
+An Output collects the printed values and writes them to its stream in one
+piece once it holds size of them, and when the program ends (flush), so a
+loop that prints a million values makes a few hundred writes.
+"""
+import sys
+from typing import List, Optional, TextIO
+
+
+class Output:
+    """
+    Buffered sink for print statements: one value per line, written to
+    stream (sys.stdout as it is when the buffer is written, if None).
+    """
+    def __init__(self, stream: Optional[TextIO] = None, size: int = 8192):
+        self.stream = stream
+        self.size = size
+        self.pending = []
+
+    def write(self, values: List):
+        """
+        Prints each of values on a line of its own
+        """
+        pending = self.pending
+        pending.extend(map(str, values))
+        if len(pending) >= self.size:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            stream = self.stream or sys.stdout
+            stream.write("\n".join(self.pending) + "\n")
+            stream.flush()
+            self.pending = []
+
+
+class Capture(Output):
+    """
+    Keeps everything printed in memory, as the list of printed lines
+    """
+    def __init__(self):
+        Output.__init__(self)
+        self.lines = []
+
+    def write(self, values: List):
+        self.lines.extend(map(str, values))
+
+    def flush(self):
+        pass
+
+    def getvalue(self) -> str:
+        return "".join(line + "\n" for line in self.lines)
@@ -0,0 +1,235 @@
+"""
+SLU-C incremental parse cache
+
+Keeps the parsed FunctionDef of every function of a source file on disk, in
+__slucache__/<file>.functions next to it, keyed by a hash of the function's
+source text. An unchanged file is loaded without lexing it at all; after an
+edit, the file is scanned for the braces that end each function and only the
+functions whose text changed are lexed and parsed. The line numbers of a
+reused function are moved to wherever its text now starts.
+The cache is dropped whenever lexer.py, ast.py or parser.py change.
+"""
+import gc
+import hashlib
+import os
+import pickle
+import re
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+from lexer import Lexer, Kind
+from parser import Parser, TokenStream, SLUCSyntaxError
+from ast import *
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+
+def version() -> bytes:
+    """
+    Hash of the modules that decide what a parsed function looks like
+    """
+    h = hashlib.sha1()
+    for name in ("lexer.py", "ast.py", "parser.py"):
+        with open(os.path.join(here, name), "rb") as f:
+            h.update(f.read())
+    return h.digest()
+
+
+# the parts of master_patt that can hide a brace, and the braces themselves.
+# A "*/" outside a comment is lexed differently by the two (master_patt keeps
+# it as one token), so it sends the file to a full parse.
+brace_patt = re.compile(
+    rb"""
+        (?P<COMMENT>//[^\n]*) |
+        (?P<MLCOMMENT>/\*(?:[^*/]+|\*(?!/)|//|/\*|/(?![/*]))*(?:\*/|\Z)) |
+        (?<!\\)"(?P<DQ>(?:[^"\n]|(?<=\\)")*)(?<!\\)" |
+        (?<!\\)'(?P<SQ>(?:[^'\n]|(?<=\\)')*)(?<!\\)' |
+        (?P<UNCLOSED>(?<!\\)["'][^\n]*) |
+        (?P<STAREND>\*/) |
+        (?P<BRACE>[{}])
+    """,
+    re.VERBOSE
+)
+
+
+def split_functions(buf) -> Optional[List[Tuple[int, int]]]:
+    """
+    Returns the (start, end) offsets of every function in buf, each from the
+    end of the one before it to its closing brace, or None if the braces do
+    not balance or anything but whitespace and comments follows the last one
+    """
+    ranges = []
+    depth = 0
+    start = 0
+    for m in brace_patt.finditer(buf):
+        group = m.lastgroup
+        if group == "BRACE":
+            if m.group() == b"{":
+                depth += 1
+            else:
+                depth -= 1
+                if depth < 0:
+                    return None
+                if depth == 0:
+                    ranges.append((start, m.end()))
+                    start = m.end()
+        elif group == "STAREND":
+            return None
+    for m in Lexer.master_patt.finditer(buf, start):
+        if m.lastgroup not in ("WS", "COMMENT", "MLCOMMENT"):
+            return None
+    return ranges
+
+
+call_patt = re.compile(rb"([A-Za-z_]\w*)\s*\(")
+
+
+def shift_lines(f: FunctionDef, delta: int):
+    """
+    Moves f and every statement in it delta lines down
+    """
+    f.line += delta
+    for s in f.stmts:
+        if type(s) != str:
+            for node in walk(s):
+                if isinstance(node, Stmt) and node.line is not None:
+                    node.line += delta
+
+
+def calls(text: bytes) -> set:
+    """
+    Every name followed by "(" in text: the functions it calls, plus some
+    keywords and the odd word in a string or comment
+    """
+    return {m.decode() for m in call_patt.findall(text)}
+
+
+class ParseCache:
+    """
+    The cached functions of one source file, each pickled on its own so an
+    edit only pickles the functions it changed. hits and misses count the
+    functions reused and parsed by the last parse.
+    """
+    def __init__(self, fn: str):
+        self.fn = fn
+        self.path = os.path.join(os.path.dirname(os.path.abspath(fn)), "__slucache__",
+                                 os.path.basename(fn) + ".functions")
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, ver: bytes) -> Tuple[bytes, List[bytes], List[int], Dict[bytes, bytes]]:
+        """
+        Returns the hash of the whole file, the key of each function in order,
+        the line each of them started on and the pickled functions by key, as
+        last saved
+        """
+        try:
+            with open(self.path, "rb") as f:
+                saved, whole, order, starts, functions = pickle.load(f)
+        except Exception:  # missing, unreadable or written by another version
+            return b"", [], [], {}
+        if saved != ver:
+            return b"", [], [], {}
+        return whole, order, starts, functions
+
+    @staticmethod
+    def unpickle(data: bytes) -> FunctionDef:
+        # unpickling makes many objects and no garbage, so collecting while
+        # it runs is wasted time
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            return pickle.loads(data)
+        finally:
+            if enabled:
+                gc.enable()
+
+    def save(self, ver: bytes, whole: bytes, order: List[bytes], starts: List[int],
+             functions: Dict[bytes, bytes]):
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "wb") as f:
+                pickle.dump((ver, whole, order, starts, functions), f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass  # a read-only directory just means no cache
+
+    def program(self) -> Program:
+        """
+        Parses the file like Parser.program(). An unchanged file is loaded
+        whole; otherwise every function whose text is unchanged is reused and
+        only the others are lexed and parsed. Anything the parser would reject
+        is handed to a full parse so the error is the same one.
+        """
+        ver = version()
+        p = Parser(self.fn)
+        buf = p.lex.buf
+        whole = hashlib.sha1(buf).digest()
+        saved, order, saved_starts, cached = self.load(ver)
+        if saved == whole:
+            self.hits, self.misses = len(order), 0
+            p.lex.close()
+            print("Done")
+            return Program([self.unpickle(cached[key]) for key in order])
+        ranges = split_functions(buf)
+        if ranges is None:
+            return p.program()
+        keys = [hashlib.sha1(buf[start:end]).digest() for start, end in ranges]
+        # the line each function's text starts on
+        newlines = p.lex.newline_index()
+        starts = [bisect_left(newlines, start) + 1 for start, end in ranges]
+        if not cached:
+            prog = p.program()
+            self.hits, self.misses = 0, len(prog.funcs)
+            if len(keys) == len(prog.funcs):
+                self.save(ver, whole, keys, starts, {key: pickle.dumps(f, pickle.HIGHEST_PROTOCOL)
+                                                     for key, f in zip(keys, prog.funcs)})
+            return prog
+        saved_starts = dict(zip(order, saved_starts))
+        functions = {}
+        funcs = []
+        self.hits = self.misses = 0
+        try:
+            for (start, end), key, line in zip(ranges, keys, starts):
+                if key in cached:
+                    self.hits += 1
+                    f = self.unpickle(cached[key])
+                    if line != saved_starts[key]:
+                        shift_lines(f, line - saved_starts[key])
+                        functions[key] = pickle.dumps(f, pickle.HIGHEST_PROTOCOL)
+                    else:
+                        functions[key] = cached[key]
+                    if str(f.id) in p.functionDict:
+                        raise SLUCSyntaxError("Function Already Declared")
+                    # a call to a name an earlier function declared as a
+                    # variable would not parse as a call in a full parse
+                    if not calls(buf[start:end]).isdisjoint(p.variableDict):
+                        raise SLUCSyntaxError("Invalid Function call")
+                    p.functionDict[str(f.id)] = (f.t, None)
+                    for id in f.slots:
+                        p.variableDict[id] = (f.types[f.slots[id]], None)
+                else:
+                    self.misses += 1
+                    p.tg = TokenStream(Lexer(self.fn, buf[start:end]))
+                    p.currtok = p.tg.advance()
+                    f = p.functiondef()
+                    if p.errors or p.tg.advance().kind != Kind.EOF:
+                        raise SLUCSyntaxError("Error")
+                    shift_lines(f, line - 1)  # lexed from its own first line
+                    functions[key] = pickle.dumps(f, pickle.HIGHEST_PROTOCOL)
+                funcs.append(f)
+        except (SLUCSyntaxError, SLUCFunctionError):
+            p.lex.close()
+            return Parser(self.fn).program()
+        p.lex.close()
+        self.save(ver, whole, keys, starts, functions)
+        print("Done")
+        return Program(funcs)
+
+
+def parse(fn: str) -> Program:
+    """
+    Parses fn through its parse cache
+    """
+    return ParseCache(fn).program()
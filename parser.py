@@ -1,60 +1,187 @@
-from lexer import Lexer
+from typing import Iterator, Optional, Union
+from itertools import chain
+from lexer import Lexer, Kind, Token
 from ast import *
 
 
+# binary operator kind -> (precedence, left associative); a higher
+# precedence binds tighter
+binary_ops = {Kind.OR: (1, True), Kind.AND: (2, True),
+              Kind.EQ: (3, False), Kind.NEQ: (3, False),
+              Kind.LT: (4, False), Kind.LTE: (4, False), Kind.GT: (4, False), Kind.GTE: (4, False),
+              Kind.BLS: (5, True), Kind.BRS: (5, True),
+              Kind.PLUS: (6, True), Kind.MINUS: (6, True),
+              Kind.MULT: (7, True), Kind.DIV: (7, True), Kind.MOD: (7, True)}
+tightest = max(prec for prec, assoc in binary_ops.values())
+# operators with a node type of their own (evaluated short-circuit)
+logical_nodes = {Kind.AND: AndExpr, Kind.OR: OrExpr}
+# the same by kind, as lists: precedence 0 for anything not an operator
+precedences = [binary_ops.get(k, (0, True))[0] for k in range(Kind.EOF + 1)]
+associative = [binary_ops.get(k, (0, True))[1] for k in range(Kind.EOF + 1)]
+
+
+class TokenStream:
+    """
+    The tokens of a Lexer, pulled one at a time as the parser asks for them:
+    advance() moves to the next token and returns it, and peek(k) returns
+    the token k places after the last one advance() returned. Tokens peeked
+    at wait in a ring buffer of size - 1 slots until advance() gets to them.
+    Past the last token every read gives an EOF token, so the end of the
+    input is a kind like any other instead of a StopIteration.
+    """
+    def __init__(self, lex: Lexer, size: int = 4):
+        self.lex = lex
+        self.size = size
+        self.ring = [None] * size
+        self.head = 0   # slot of the first token peeked at
+        self.ahead = 0  # tokens peeked at
+        self.stream = chain(lex.tokens(), self.end())
+        # straight from the lexer while nothing has been peeked at
+        self.advance = self.stream.__next__
+
+    def end(self) -> Iterator[Token]:
+        """
+        EOF tokens, on the last line with anything on it
+        """
+        lex = self.lex
+        eof = Token(Kind.EOF, "end of file", lex.length, lex.length, lex.last_line)
+        while True:
+            yield eof
+
+    def peek(self, k: int = 1) -> Token:
+        if not 0 < k < self.size:
+            raise ValueError("can only look 1 to {0} tokens ahead".format(self.size - 1))
+        while self.ahead < k:
+            self.ring[(self.head + self.ahead) % self.size] = next(self.stream)
+            self.ahead += 1
+        self.advance = self.buffered
+        return self.ring[(self.head + k - 1) % self.size]
+
+    def buffered(self) -> Token:
+        """
+        advance() while there are tokens in the ring
+        """
+        tok = self.ring[self.head]
+        self.ring[self.head] = None
+        self.head = (self.head + 1) % self.size
+        self.ahead -= 1
+        if not self.ahead:
+            self.advance = self.stream.__next__
+        return tok
+
+
 class Parser:
 
-    def __init__(self, fn: str):
+    # fn - file name we are parsing
+    # source - optional in-memory program text, lexed instead of reading fn
+    def __init__(self, fn: str, source: Optional[Union[str, bytes, memoryview]] = None):
 
-        self.lex = Lexer(fn)
-        self.tg = self.lex.token_generator()
+        self.lex = Lexer(fn, source)
+        self.tg = TokenStream(self.lex)
         self.variableDict = {}
         self.functionDict = {}
+        self.errors = []
 
     # top level function that will be called
     def program(self):
         """
         Program -> {FunctionDef}            (while loop)
+
+        A syntax error does not stop the parse: it is recorded, the tokens up
+        to a place the parse can go on from are skipped, and every error found
+        is raised together at the end.
         """
         funcs = []
-        while True:
+        self.currtok = self.tg.advance()
+        while self.currtok.kind != Kind.EOF:
             try:
-                self.currtok = next(self.tg)
                 temp = self.functiondef()
                 funcs.append(temp)
-            except StopIteration:
-                print("Done")
-                break
+                self.currtok = self.tg.advance()
+            except SLUCSyntaxError as e:
+                self.errors.append(e.message)
+                self.skip_function()
+        if self.errors:
+            raise SLUCSyntaxError("\n".join(self.errors))
+        print("Done")
         return Program(funcs)
 
+    def expect(self, kind: int, message: str):
+        """
+        Moves past the current token if it has kind; otherwise raises message,
+        formatted with the current token's line
+        """
+        if self.currtok.kind != kind:
+            raise SLUCSyntaxError(message.format(self.currtok.line))
+        self.currtok = self.tg.advance()
+
+    def function_head(self) -> bool:
+        """
+        True if the current token starts a FunctionDef: Type id (
+        """
+        return (self.currtok.kind in Kind.TYPES and self.tg.peek(1).kind in (Kind.ID, Kind.MAIN)
+                and self.tg.peek(2).kind == Kind.LPAREN)
+
+    def skip_function(self):
+        """
+        Skips to the start of the next FunctionDef after an error
+        """
+        while self.currtok.kind != Kind.EOF and not self.function_head():
+            self.currtok = self.tg.advance()
+
+    def skip_statement(self):
+        """
+        Skips past the ; that ends the statement an error was found in, or to
+        the } that closes the block it is in or the next FunctionDef
+        """
+        depth = 0
+        while self.currtok.kind != Kind.EOF:
+            kind = self.currtok.kind
+            if kind == Kind.SEMI and depth == 0:
+                self.currtok = self.tg.advance()
+                return
+            if kind == Kind.RBRACE:
+                if depth == 0:
+                    return
+                depth -= 1
+            elif kind == Kind.LBRACE:
+                depth += 1
+            elif depth == 0 and self.function_head():
+                return
+            self.currtok = self.tg.advance()
+
     def functiondef(self) -> FunctionDef:
         """
         FunctionDef → Type id ( Params ) { Declarations Statements }
         """
-        t = self.currtok[1]
-        self.currtok = next(self.tg)
-        id = self.currtok[1]
-        self.currtok = next(self.tg)
+        t = self.currtok.text
+        line = self.currtok.line
+        self.currtok = self.tg.advance()
+        id = self.currtok.text
+        self.currtok = self.tg.advance()
         if id in self.functionDict:
             raise SLUCSyntaxError("Function Already Declared")
         else:
             self.functionDict[id] = (t, None)
-            if self.currtok[0] == Lexer.LPAREN:
-                self.currtok = next(self.tg)
+            if self.currtok.kind == Kind.LPAREN:
+                self.currtok = self.tg.advance()
                 params = self.params()
-                if self.currtok[0] == Lexer.RPAREN:
-                    self.currtok = next(self.tg)
-                else:
-                    raise SLUCSyntaxError("Missing right paren on line {0}".format(self.currtok[2]))
-                if self.currtok[0] == Lexer.LBRACE:
-                    self.currtok = next(self.tg)
+                self.expect(Kind.RPAREN, "Missing right paren on line {0}")
+                if self.currtok.kind == Kind.LBRACE:
+                    self.currtok = self.tg.advance()
                     decls = self.declarations()
                     stmts = self.statements()
-                    if self.currtok[0] == Lexer.RBRACE:
-                        temp = FunctionDef(t, IDExpr(id), params, decls, stmts)
+                    if self.currtok.kind == Kind.RBRACE:
+                        try:
+                            temp = FunctionDef(t, IDExpr(id), params, decls, stmts)
+                        except SLUCFunctionError as e:
+                            # a variable resolve found undeclared is an error of the
+                            # parse like any other, collected with the rest
+                            raise SLUCSyntaxError("{0} in function {1} on line {2}".format(e.message, id, line))
+                        temp.line = line
                         return temp
                     else:
-                        raise SLUCSyntaxError("Missing Right Brace on line {0}".format(self.currtok[2]))
+                        raise SLUCSyntaxError("Missing Right Brace on line {0}".format(self.currtok.line))
         raise SLUCSyntaxError("Error")
 
     def params(self) -> Params:
@@ -62,21 +189,21 @@ class Parser:
         Params → Type id { , Type id } | ε
         """
         params = []
-        if self.currtok[0] == Lexer.RPAREN:
+        if self.currtok.kind == Kind.RPAREN:
             return Params(params)
         else:
-            t = self.currtok[1]
-            self.currtok = next(self.tg)
-            id = self.currtok[1]
-            self.currtok = next(self.tg)
+            t = self.currtok.text
+            self.currtok = self.tg.advance()
+            id = self.currtok.text
+            self.currtok = self.tg.advance()
             self.variableDict[id] = t
             params.append((t, id))
-            while self.currtok[0] == Lexer.COMMA:
-                self.currtok = next(self.tg)
-                t = self.currtok[1]
-                self.currtok = next(self.tg)
-                id = self.currtok[1]
-                self.currtok = next(self.tg)
+            while self.currtok.kind == Kind.COMMA:
+                self.currtok = self.tg.advance()
+                t = self.currtok.text
+                self.currtok = self.tg.advance()
+                id = self.currtok.text
+                self.currtok = self.tg.advance()
                 self.variableDict[id] = (t, None)
                 params.append((t, id))
             return Params(params)
@@ -86,9 +213,9 @@ class Parser:
         Declarations → { Declaration }
         """
         decls = []
-        while self.currtok[1] in {"int", "bool", "float"}:
+        while self.currtok.kind in Kind.TYPES:
             temp = self.declaration()
-            self.currtok = next(self.tg)
+            self.currtok = self.tg.advance()
             decls.append(temp)
         return decls
 
@@ -96,22 +223,27 @@ class Parser:
         """
         Declaration → Type Identifier ;
         """
-        t = self.currtok[1]
-        self.currtok = next(self.tg)
-        id = self.currtok[1]
-        self.currtok = next(self.tg)
+        t = self.currtok.text
+        self.currtok = self.tg.advance()
+        id = self.currtok.text
+        self.currtok = self.tg.advance()
         self.variableDict[id] = (t, None)
-        if self.currtok[0] == Lexer.SEMI:
+        if self.currtok.kind == Kind.SEMI:
             temp = Declaration(t, id)
-            id = self.currtok[1]
+            id = self.currtok.text
             return temp
         else:
-            raise SLUCSyntaxError("Error: Missing Semi-colon on line {0}".format(self.currtok[2]))
+            raise SLUCSyntaxError("Error: Missing Semi-colon on line {0}".format(self.currtok.line))
 
     def statements(self) -> [Stmt]:
         stmts = []
         while True:
-            temp = self.statement()
+            try:
+                temp = self.statement()
+            except SLUCSyntaxError as e:
+                self.errors.append(e.message)
+                self.skip_statement()
+                continue
             if temp is not None:
                 stmts.append(temp)
             else:
@@ -122,99 +254,100 @@ class Parser:
         """
         Statement → ; | Block | Assignment | IfStatement | WhileStatement | PrintStmt | ReturnStmt
         """
-        if self.currtok[0] == Lexer.SEMI:  # semi-colon
-            temp = self.currtok[1]
-            self.currtok = next(self.tg)
+        line = self.currtok.line
+        if self.currtok.kind == Kind.SEMI:  # semi-colon
+            temp = self.currtok.text
+            self.currtok = self.tg.advance()
             return temp
-        elif self.currtok[0] == Lexer.KEYWORD and self.currtok[1] == "if":
-            return self.ifstatement()
-        elif self.currtok[0] == Lexer.KEYWORD and self.currtok[1] == "while":
-            return self.whilestatement()
-        elif self.currtok[0] == Lexer.KEYWORD and self.currtok[1] == "print":
-            return self.printstmt()
-        elif self.currtok[0] == Lexer.KEYWORD and self.currtok[1] == "return":
-            return self.returnstmt()
-        elif self.currtok[0] == Lexer.LBRACE:  # block
-            return self.block()
-        elif self.currtok[0] == Lexer.ID:  # assignment
-            return self.assignment()
+        elif self.currtok.kind == Kind.IF:
+            temp = self.ifstatement()
+        elif self.currtok.kind == Kind.WHILE:
+            temp = self.whilestatement()
+        elif self.currtok.kind == Kind.PRINT:
+            temp = self.printstmt()
+        elif self.currtok.kind == Kind.RETURN:
+            temp = self.returnstmt()
+        elif self.currtok.kind == Kind.LBRACE:  # block
+            temp = self.block()
+        elif self.currtok.kind == Kind.ID:  # assignment
+            temp = self.assignment()
         else:
             return None
+        if temp is not None:
+            temp.line = line
+        return temp
 
     def returnstmt(self):
         """
         ReturnStmt → return Expression ;
         """
-        self.currtok = next(self.tg)
+        self.currtok = self.tg.advance()
         temp = self.expression()
-        if self.currtok[0] == Lexer.SEMI:
-            self.currtok = next(self.tg)
-            return ReturnStmt(temp)
-        else:
-            raise SLUCSyntaxError("Missing Semi-Colon on line {0}".format(self.currtok[2]))
+        self.expect(Kind.SEMI, "Missing Semi-Colon on line {0}")
+        return ReturnStmt(temp)
 
 
     def block(self):
         """
         Block → { Statements }
         """
-        self.currtok = next(self.tg)
+        self.currtok = self.tg.advance()
         block = []
-        while self.currtok[0] != Lexer.RBRACE:
+        while self.currtok.kind != Kind.RBRACE:
             temp = self.statements()
-            if temp is not None:
+            if temp:
                 block.append(temp)
             else:
                 break
-        if self.currtok[0] == Lexer.RBRACE:
-            self.currtok = next(self.tg)
+        if self.currtok.kind == Kind.RBRACE:
+            self.currtok = self.tg.advance()
             return Block(block)
         else:
-            raise SLUCSyntaxError("Missing Right Brace on line {0}".format(self.currtok[2]))
+            raise SLUCSyntaxError("Missing Right Brace on line {0}".format(self.currtok.line))
 
 
     def assignment(self):
         """
         Asssignment → ID = Expression ;
         """
-        id = self.currtok[1]
+        id = self.currtok.text
         if id in self.variableDict.keys():
-            self.currtok = next(self.tg)
-            if self.currtok[0] == Lexer.ASSIGN:
-                self.currtok = next(self.tg)
+            self.currtok = self.tg.advance()
+            if self.currtok.kind == Kind.ASSIGN:
+                self.currtok = self.tg.advance()
                 exp = self.expression()
-                if self.currtok[0] == Lexer.SEMI:
+                if self.currtok.kind == Kind.SEMI:
                     temp = self.variableDict[id][0]
                     self.variableDict[id] = (temp, exp)
-                    self.currtok = next(self.tg)
+                    self.currtok = self.tg.advance()
                     return Assignment(IDExpr(id), exp)
                 else:
-                    raise SLUCSyntaxError("Missing Semi-colon on line {0}".format(self.currtok[2]))
+                    raise SLUCSyntaxError("Missing Semi-colon on line {0}".format(self.currtok.line))
         else:
-            raise SLUCSyntaxError("Assignment of an undeclared variable on line {0}".format(self.currtok[2]))
+            raise SLUCSyntaxError("Assignment of an undeclared variable on line {0}".format(self.currtok.line))
 
     def ifstatement(self):
         """
         IfStatement → if ( Expression ) Statement [ else Statement ]
         """
         stmtList = []
-        if self.currtok[0] == Lexer.KEYWORD and self.currtok[1] == "if":
-            self.currtok = next(self.tg)
-            if self.currtok[0] == Lexer.LPAREN:
-                self.currtok = next(self.tg)
+        if self.currtok.kind == Kind.IF:
+            self.currtok = self.tg.advance()
+            if self.currtok.kind == Kind.LPAREN:
+                self.currtok = self.tg.advance()
                 ifCond = self.expression()
-                if self.currtok[0] == Lexer.RPAREN:
-                    self.currtok = next(self.tg)
+                if self.currtok.kind == Kind.RPAREN:
+                    self.currtok = self.tg.advance()
                     firstStmt = self.statement()
-                    while self.currtok[0] == Lexer.KEYWORD and self.currtok[1] == "else":
-                        self.currtok = next(self.tg)
+                    while self.currtok.kind == Kind.ELSE:
+                        self.currtok = self.tg.advance()
                         elseStmt = self.statement()
                         stmtList.append(elseStmt)
                     temp = IfStmt(ifCond, firstStmt, stmtList)
                     return temp
                 else:
                     # use the line number from your token object
-                    raise SLUCSyntaxError("Missing right paren on line {0}".format(self.currtok[2]))
+                    raise SLUCSyntaxError("Missing right paren on line {0}".format(self.currtok.line))
 
 
     def whilestatement(self):
@@ -222,19 +355,19 @@ class Parser:
         WhileStatement → while ( Expression ) Statement
         """
 
-        if self.currtok[0] == Lexer.KEYWORD and self.currtok[1] == "while":
-            self.currtok = next(self.tg)
-            if self.currtok[0] == Lexer.LPAREN:
-                self.currtok = next(self.tg)
+        if self.currtok.kind == Kind.WHILE:
+            self.currtok = self.tg.advance()
+            if self.currtok.kind == Kind.LPAREN:
+                self.currtok = self.tg.advance()
                 left = self.expression()
-                if self.currtok[0] == Lexer.RPAREN:
-                    self.currtok = next(self.tg)
+                if self.currtok.kind == Kind.RPAREN:
+                    self.currtok = self.tg.advance()
                     right = self.statement()
                     temp = WhileStmt(left, right)
                     return temp
                 else:
                     # use the line number from your token object
-                    raise SLUCSyntaxError("Missing right paren on line {0}".format(self.currtok[2]))
+                    raise SLUCSyntaxError("Missing right paren on line {0}".format(self.currtok.line))
 
     def printstmt(self):
         """
@@ -242,122 +375,59 @@ class Parser:
         """
         printS = []
 
-        if self.currtok[0] == Lexer.KEYWORD and self.currtok[1] == "print":
-            self.currtok = next(self.tg)
-            if self.currtok[0] == Lexer.LPAREN:
-                self.currtok = next(self.tg)
+        if self.currtok.kind == Kind.PRINT:
+            self.currtok = self.tg.advance()
+            if self.currtok.kind == Kind.LPAREN:
+                self.currtok = self.tg.advance()
                 firstPrint = self.printarg()
-                while self.currtok[0] == Lexer.COMMA:
-                    self.currtok = next(self.tg)
+                while self.currtok.kind == Kind.COMMA:
+                    self.currtok = self.tg.advance()
                     otherPrint = self.printarg()
                     printS.append(otherPrint)
-                if self.currtok[0] == Lexer.RPAREN:
-                    self.currtok = next(self.tg)
+                if self.currtok.kind == Kind.RPAREN:
+                    self.currtok = self.tg.advance()
                     temp = PrintStmt(firstPrint, printS)
                     return temp
                 else:
                     # use the line number from your token object
-                    raise SLUCSyntaxError("Missing right paren on line {0}".format(self.currtok[2]))
+                    raise SLUCSyntaxError("Missing right paren on line {0}".format(self.currtok.line))
 
     def printarg(self):
         """
         PrintArg → Expression | stringlit
         """
         # parse the stringlit
-        if self.currtok[0] == Lexer.STRINGLIT:
+        if self.currtok.kind == Kind.STRINGLIT:
             tmp = self.currtok
-            self.currtok = next(self.tg)
-            return LitExpr(tmp[1], str)
+            self.currtok = self.tg.advance()
+            return LitExpr(tmp.text, str)
         # parse the Expression
         else:
             return self.expression()
-        # raise SLUCSyntaxError("ERROR: Unexpected token {0} on line {1}".format(self.currtok[1], self.currtok[2]))
-
-    def expression(self) -> Expr:
-        """
-        Expression -> Conjunction { || Conjunction }
-        """
-        left = self.conjunction()
-
-        while self.currtok[0] == Lexer.OR:
-            op = self.currtok[1]
-            self.currtok = next(self.tg)  # advance to the next token because
-            # we matched a plus
-            right = self.conjunction()
-            left = BinaryExpr(left, op, right)
-        return left
-
-    def conjunction(self) -> Expr:
-        """
-        Conjunction → Equality { && Equality }
-        """
-        left = self.equality()
-
-        while self.currtok[0] == Lexer.AND:
-            op = self.currtok[1]
-            self.currtok = next(self.tg)  # advance to the next token because
-            # we matched a plus
-            right = self.equality()
-            left = BinaryExpr(left, op, right)
-
-        return left
-
-    def equality(self) -> Expr:
-        """
-        Equality → Relation [ EquOp Relation ]
-        """
-        left = self.relation()
-
-        if self.currtok[0] in {Lexer.EQ, Lexer.NEQ}:
-            op = self.currtok[1]
-            self.currtok = next(self.tg)
-            right = self.relation()
-            left = BinaryExpr(left, op, right)
-
-        return left
+        # raise SLUCSyntaxError("ERROR: Unexpected token {0} on line {1}".format(self.currtok.text, self.currtok.line))
 
-    def relation(self) -> Expr:
+    def expression(self, min_prec: int = 1) -> Expr:
         """
-        Relation → Addition [ RelOp Addition ]
-        """
-        left = self.addition()
-
-        if self.currtok[0] in {Lexer.GT, Lexer.GTE, Lexer.LT, Lexer.LTE}:
-            op = self.currtok[1]
-            self.currtok = next(self.tg)  # advance to the next token because
-            # we matched a plus
-            right = self.addition()
-            left = BinaryExpr(left, op, right)
-
-        return left
-
-    def addition(self) -> Expr:
-        """
-        Expr -> Term { + Term }
-        """
-        left = self.term()
+        Expression → Fact { BinOp Fact }
 
-        while self.currtok[0] in {Lexer.PLUS, Lexer.MINUS}:
-            op = self.currtok[1]
-            self.currtok = next(self.tg)  # advance to the next token because
-            # we matched a plus
-            right = self.term()
-            left = BinaryExpr(left, op, right)
-        return left
-
-    def term(self) -> Expr:
-        """
-        Term -> Fact { (*|/) Fact}
+        Parsed by precedence climbing over binary_ops, loosest first:
+            ||   &&   == !=   < <= > >=   << >>   + -   * / %
+        Every operator is left associative except the equality and relational
+        ones, which take no operator of their own precedence after them.
         """
         left = self.fact()
-
-        while self.currtok[0] in {Lexer.MULT, Lexer.DIV, Lexer.MOD}:
-            op = self.currtok[1]
-            self.currtok = next(self.tg)
-            right = self.fact()
-            left = BinaryExpr(left, op, right)
-
-        return left
+        limit = tightest
+        while True:
+            prec = precedences[self.currtok.kind]
+            if prec < min_prec or prec > limit:
+                return left
+            op = self.currtok.text
+            node = logical_nodes.get(self.currtok.kind)
+            # a tighter operator after right would have gone into right
+            limit = prec if associative[self.currtok.kind] else prec - 1
+            self.currtok = self.tg.advance()
+            right = self.expression(prec + 1)
+            left = BinaryExpr(left, op, right) if node is None else node(left, right)
 
     def fact(self) -> Expr:
         """
@@ -365,9 +435,9 @@ class Parser:
         """
 
         # only advance to the next token on a successful match
-        if self.currtok[0] in {Lexer.MINUS, Lexer.FACT}:
-            op = self.currtok[1]
-            self.currtok = next(self.tg)
+        if self.currtok.kind in Kind.UNARYOPS:
+            op = self.currtok.text
+            self.currtok = self.tg.advance()
             tree = self.primary()
             return UnaryOp(tree, op)
 
@@ -379,58 +449,50 @@ class Parser:
         """
 
         # parse an ID
-        if self.currtok[0] == Lexer.ID:  # using ID in expression
+        if self.currtok.kind == Kind.ID:  # using ID in expression
             tmp = self.currtok
-            if self.currtok[1] in self.variableDict:  # parse variable ID
-                self.currtok = next(self.tg)
-                return IDExpr(tmp[1])
-            elif self.currtok[1] in self.functionDict:  # parse function ID
-                self.currtok = next(self.tg)
-                if self.currtok[0] == Lexer.LPAREN:
-                    self.currtok = next(self.tg)
+            if self.currtok.text in self.variableDict:  # parse variable ID
+                self.currtok = self.tg.advance()
+                return IDExpr(tmp.text)
+            else:  # parse function call, the function may be defined further down
+                self.currtok = self.tg.advance()
+                if self.currtok.kind == Kind.LPAREN:
+                    self.currtok = self.tg.advance()
                     params = []
-                    if self.currtok[0] == Lexer.RPAREN:
-                        return FunctionExpr(tmp[1], params)
-                    else:
+                    if self.currtok.kind != Kind.RPAREN:
                         params.append(self.expression())
-                        while self.currtok[0] == Lexer.COMMA:
-                            self.currtok = next(self.tg)
+                        while self.currtok.kind == Kind.COMMA:
+                            self.currtok = self.tg.advance()
                             params.append(self.expression())
-                        if self.currtok[0] == Lexer.RPAREN:
-                            self.currtok = next(self.tg)
-                            return FunctionExpr(tmp[1], params)
-                else:
+                    if self.currtok.kind == Kind.RPAREN:
+                        self.currtok = self.tg.advance()
+                        return FunctionExpr(tmp.text, params)
+                    raise SLUCSyntaxError("Missing right paren on line {0}".format(self.currtok.line))
+                elif tmp.text in self.functionDict:
                     raise SLUCSyntaxError("Invalid Function call")
-            else:
-                raise SLUCSyntaxError("Undefined variable {0} on line {1}".format(tmp[1], tmp[2]))
-        elif self.currtok[0] == Lexer.INTLIT:  # parse an integer literal
-            tmp = self.currtok
-            self.currtok = next(self.tg)
-            return LitExpr(tmp[1], int)
-        elif self.currtok[0] == Lexer.FLOATLIT:  # parse an float literal
+                else:
+                    raise SLUCSyntaxError("Undefined variable {0} on line {1}".format(tmp.text, tmp.line))
+        elif self.currtok.kind == Kind.INTLIT or self.currtok.kind == Kind.FLOATLIT:
+            # numbers come converted from the lexer
             tmp = self.currtok
-            self.currtok = next(self.tg)
-            return LitExpr(tmp[1], float)
-        elif self.currtok[0] == Lexer.STRINGLIT:  # parse an float literal
+            self.currtok = self.tg.advance()
+            return ConstExpr(tmp.value)
+        elif self.currtok.kind == Kind.STRINGLIT:  # parse an float literal
             tmp = self.currtok
-            self.currtok = next(self.tg)
-            return LitExpr(tmp[1], str)
-        elif self.currtok[0] == Lexer.KEYWORD and self.currtok[1] in {"true", "false"}:
+            self.currtok = self.tg.advance()
+            return LitExpr(tmp.text, str)
+        elif self.currtok.kind in Kind.BOOLLITS:
             tmp = self.currtok
-            self.currtok = next(self.tg)
-            return LitExpr(tmp[1], bool)
-        elif self.currtok[0] == Lexer.LPAREN:  # parse a parenthesized expression
-            self.currtok = next(self.tg)
+            self.currtok = self.tg.advance()
+            return LitExpr(tmp.text, bool)
+        elif self.currtok.kind == Kind.LPAREN:  # parse a parenthesized expression
+            self.currtok = self.tg.advance()
             tree = self.expression()
-            if self.currtok[0] == Lexer.RPAREN:
-                self.currtok = next(self.tg)
-                return tree
-            else:
-                # use the line number from your token object
-                raise SLUCSyntaxError("Missing right paren on line {0}".format(self.currtok[2]))
+            self.expect(Kind.RPAREN, "Missing right paren on line {0}")
+            return tree
 
         # if we get here we have a problem
-        raise SLUCSyntaxError("ERROR: Unexpected token {0} on line {1}".format(self.currtok[1], self.currtok[2]))
+        raise SLUCSyntaxError("ERROR: Unexpected token {0} on line {1}".format(self.currtok.text, self.currtok.line))
 
 
 # create our own exception by inheriting from python's exception
@@ -445,14 +507,104 @@ class SLUCSyntaxError(Exception):
 
 if __name__ == "__main__":
 
-    import sys
-
-    filename = sys.argv[-1]
-
-    p = Parser(filename)
-
-    t = p.program()
-
-    t.eval()
-
-
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Run a SLU-C program")
+    ap.add_argument("--engine", choices=["tree", "vm", "closure", "python"], default="tree",
+                    help="tree: AST eval (default), vm: bytecode compiler and stack VM (no recursion limit), "
+                         "closure: AST compiled to nested Python closures, "
+                         "python: functions translated to Python source and compiled")
+    ap.add_argument("--reparse", action="store_true",
+                    help="parse the source even if __slucache__ holds its compiled program, and save none")
+    ap.add_argument("--cache", action="store_true",
+                    help="reuse parsed functions whose source is unchanged since the last --cache run")
+    ap.add_argument("--no-check", action="store_true",
+                    help="skip the static type checker and check types while running instead; call arguments "
+                         "and return values then keep their own int or float type instead of being "
+                         "converted to the declared one")
+    ap.add_argument("-O", "--optimize", action="store_true",
+                    help="fold constants, drop empty statements, hoist loop invariants, share common "
+                         "subexpressions and reduce operations before running")
+    ap.add_argument("--dump-opt", action="store_true",
+                    help="print every function before and after optimizing")
+    ap.add_argument("--dis", action="store_true",
+                    help="print the bytecode (the generated Python for --engine python) before running it")
+    ap.add_argument("--memo", action="store_true", help="tree engine: cache results of pure functions")
+    ap.add_argument("--memo-size", type=int, default=1024, metavar="SIZE",
+                    help="entries kept per function cache (default 1024, 0 for unbounded)")
+    ap.add_argument("--memo-stats", action="store_true", help="print cache hits and misses after running")
+    ap.add_argument("--profile", action="store_true",
+                    help="tree engine: print the count and time of every function and statement after running")
+    ap.add_argument("--profile-out", metavar="FILE",
+                    help="tree engine: write the profile as collapsed stacks for a flame graph")
+    ap.add_argument("filename")
+    args = ap.parse_args()
+    if (args.profile or args.profile_out) and args.engine != "tree":
+        ap.error("--profile and --profile-out need the tree engine")
+
+    import serialize
+    h = None if args.reparse else serialize.source_hash(args.filename)
+    t = None if h is None else serialize.load(args.filename, h)
+    if t is not None:
+        print("Done")
+    else:
+        if args.cache:
+            import parsecache
+            t = parsecache.parse(args.filename)
+        else:
+            p = Parser(args.filename)
+            t = p.program()
+        if h is not None:
+            serialize.save(args.filename, t, h)
+
+    if not args.no_check:
+        import typechecker
+        typechecker.check(t)
+
+    # --dump-opt runs the optimizer too, so the tree is optimized either way
+    optimized = args.optimize or args.dump_opt
+    if optimized:
+        import optimizer
+        before = [str(f) for f in t.funcs]
+        opt = optimizer.Optimizer()
+        opt.program(t)
+        if args.dump_opt:
+            for b, f in zip(before, t.funcs):
+                print("before: " + b)
+                print("after:  " + str(f))
+            print("{0} constants folded, {1} empty statements dropped, {2} operations reduced, "
+                  "{3} loop invariants hoisted, {4} common subexpressions shared".format(
+                      opt.folded, opt.dropped, opt.reduced, opt.hoisted, opt.shared))
+
+    if args.engine == "vm":
+        import vm
+        functions = vm.Compiler().program(t)
+        if args.dis:
+            for code in functions.values():
+                print(code)
+        vm.VM(functions).main()
+    elif args.engine == "closure":
+        import closures
+        closures.run(t)
+    elif args.engine == "python":
+        import pysource
+        if args.dis:
+            print(pysource.translate(t), end="")
+        pysource.run(t, fn=args.filename, optimized=optimized, checked=not args.no_check)
+    else:
+        import memo
+        caches = {}
+        if args.memo:
+            caches = memo.memoize(t, args.memo_size or None)
+        prof = None
+        if args.profile or args.profile_out:
+            import profiler
+            prof = profiler.Profiler()
+        t.eval(profiler=prof, caches=caches)
+        if args.memo_stats:
+            memo.report(caches)
+        if args.profile:
+            prof.report()
+        if args.profile_out:
+            with open(args.profile_out, "w") as f:
+                prof.collapsed(f)
@@ -0,0 +1,164 @@
+"""
+SLU-C profiler
+
+Counts and times every function, loop and statement of a Program while
+Program.eval runs it. The profiler rides in the run's Context: where one is
+set, calls go through call() and statements through stmt(), which time the
+node's run or eval. A run without one only tests that it is None, and
+nothing is attached to the tree, so other runs of the same Program are not
+profiled.
+
+    prof = Profiler()
+    prog.eval(profiler=prof)
+    prof.report()                       # table, most own time first
+    with open("run.folded", "w") as f:
+        prof.collapsed(f)               # for flamegraph.pl or speedscope
+"""
+import sys
+import time
+from typing import Callable, List, Optional, TextIO
+from ast import *
+
+
+class Entry:
+    """
+    What the profiler knows about one node: count is calls for a function
+    and runs for a statement, total the seconds from entering it to leaving
+    it (once, for a function that is running already) and own the part of
+    them not spent in profiled nodes below it. body is the entry of a
+    loop's body, whose count is the number of iterations.
+    """
+    def __init__(self, kind: str, function: str, line: Optional[int]):
+        self.kind = kind
+        self.function = function
+        self.line = line
+        self.count = 0
+        self.total = 0.0
+        self.own = 0.0
+        self.active = 0
+        self.body = None
+
+    def name(self) -> str:
+        if self.kind == "function":
+            return self.function
+        return "{0}:{1}".format(self.function, self.kind)
+
+    def iterations(self) -> Optional[int]:
+        return None if self.body is None else self.body.count
+
+
+kinds = {Assignment: "assign", TypedAssignment: "assign", Block: "block", IfStmt: "if",
+         WhileStmt: "while", PrintStmt: "print", ReturnStmt: "return"}
+
+
+class Profiler:
+    """
+    Collects Entries for the nodes of the Programs it instruments, plus the
+    own time of every chain of nodes (main, main:while, f, ...) for the
+    collapsed stack output. clock is any function returning seconds.
+    """
+    def __init__(self, clock: Callable[[], float] = time.perf_counter):
+        self.clock = clock
+        self.entries = []
+        self.nodes = {}  # FunctionDef or Stmt -> Entry
+        # a chain of nodes is numbered once: (parent number, entry) -> number
+        self.paths = {}
+        self.parents = [(None, None)]  # number -> (parent number, entry)
+        self.stacks = {}  # chain number -> own seconds
+        self.frames = [[0.0, 0]]  # [seconds spent below, chain number] per node running
+
+    def instrument(self, prog: Program):
+        """
+        Makes an Entry for every FunctionDef and statement of prog that has
+        none yet
+        """
+        for f in prog.funcs:
+            if f in self.nodes:
+                continue
+            name = str(f.id)
+            self.add(f, Entry("function", name, f.line))
+            entries = {}
+            for s in f.stmts:
+                if type(s) != str:
+                    for node in walk(s):
+                        if isinstance(node, Stmt):
+                            entries[node] = Entry(kinds.get(type(node), type(node).__name__), name, node.line)
+                            self.add(node, entries[node])
+            for node, entry in entries.items():
+                if type(node) == WhileStmt and type(node.inLoop) != str:
+                    entry.body = entries[node.inLoop]
+
+    def add(self, node, entry: Entry):
+        self.nodes[node] = entry
+        self.entries.append(entry)
+
+    def call(self, f: FunctionDef, frame: List, ctx: Context):
+        """
+        f.run(frame, ctx), timed
+        """
+        return self.time(self.nodes[f], f.run, frame, ctx)
+
+    def stmt(self, s: Stmt, frame: List, ctx: Context):
+        """
+        s.eval(frame, ctx), timed
+        """
+        return self.time(self.nodes[s], s.eval, frame, ctx)
+
+    def time(self, entry: Entry, fn: Callable, frame: List, ctx: Context):
+        frames = self.frames
+        parent = frames[-1]
+        key = (parent[1], entry)
+        path = self.paths.get(key)
+        if path is None:
+            path = self.paths[key] = len(self.parents)
+            self.parents.append(key)
+        timing = [0.0, path]
+        frames.append(timing)
+        entry.count += 1
+        entry.active += 1
+        clock = self.clock
+        start = clock()
+        try:
+            return fn(frame, ctx)
+        finally:
+            elapsed = clock() - start
+            frames.pop()
+            entry.active -= 1
+            if not entry.active:
+                entry.total += elapsed
+            own = elapsed - timing[0]
+            entry.own += own
+            self.stacks[path] = self.stacks.get(path, 0.0) + own
+            parent[0] += elapsed
+
+    def chain(self, path: int) -> List[Entry]:
+        entries = []
+        while path:
+            path, entry = self.parents[path]
+            entries.append(entry)
+        return entries[::-1]
+
+    def report(self, out: Optional[TextIO] = None, sort: str = "own", limit: Optional[int] = None):
+        """
+        Prints a row per node that ran, sorted by sort ("own", "total" or
+        "count"), largest first
+        """
+        out = out or sys.stdout
+        rows = sorted((e for e in self.entries if e.count), key=lambda e: getattr(e, sort), reverse=True)
+        out.write('{:<30}{:>6}{:>12}{:>12}{:>12}{:>12}\n'.format(
+            "Node", "Line", "Count", "Iterations", "Total s", "Own s"))
+        out.write("-" * 84 + "\n")
+        for e in rows[:limit]:
+            it = e.iterations()
+            out.write('{:<30}{:>6}{:>12}{:>12}{:>12.6f}{:>12.6f}\n'.format(
+                e.name(), "" if e.line is None else e.line, e.count, "" if it is None else it, e.total, e.own))
+
+    def collapsed(self, out: TextIO):
+        """
+        Writes the collapsed stacks flame graph tools read: one line per chain
+        of nodes, names joined by ";", then its own time in microseconds
+        """
+        for path, seconds in self.stacks.items():
+            names = ("{0}@{1}".format(e.name(), e.line) if e.kind != "function" else e.name()
+                     for e in self.chain(path))
+            out.write("{0} {1}\n".format(";".join(names), int(seconds * 1e6)))
@@ -0,0 +1,342 @@
+"""
+SLU-C to Python source backend
+
+The SourceCompiler translates every FunctionDef of a type checked Program
+into a Python function (slot i becomes local v<i>, while/if/return/print
+become their Python statements), compile() turns the module source into one
+code object, and exec() runs it into a namespace that is the shared function
+table, so calls, recursion and mutual recursion are plain Python calls.
+
+The tree evaluator lets None (an unset variable, or a call that fell off the
+end of its function) flow through expressions. Expressions the None analysis
+finds can never be None become bare Python operators; the rest check for
+None the way BinaryExpr.eval does.
+
+Code objects are cached per source hash and the passes the tree went
+through, in memory and next to the source in __slucache__/<file>.code
+(<file>.opt.code when optimized, <file>.unchecked.code when not type
+checked), like the compiled program files of serialize.
+"""
+import hashlib
+import marshal
+import math
+import os
+import struct
+import sys
+from types import CodeType
+from typing import Callable, Dict, List, Optional, Tuple
+from ast import *
+from output import Output
+from analysis import Nones
+import serialize
+
+# SLU-C operator -> Python operator; && and || of ints are bitwise
+pyops = {'*': '*', '/': '/', '%': '%', '+': '+', '-': '-', '>': '>', '>=': '>=', '<': '<',
+         '<=': '<=', '==': '==', '!=': '!=', '&&': '&', '||': '|', '<<': '<<', '>>': '>>'}
+
+MAGIC = b"SLUP"
+header = struct.Struct("<4s20s20s")
+here = os.path.dirname(os.path.abspath(__file__))
+
+# (source hash, optimized, checked) -> code object
+cache = {}
+
+
+class SourceCompiler:
+    """
+    Each compile_ method writes the lines of one statement; each expr_
+    method returns the Python text of an expression and whether its value
+    can be None, as the None analysis found.
+    """
+    def __init__(self):
+        self.lines = []
+        self.depth = 1
+        self.temps = 0
+        self.functions = {}
+        self.names = {}
+        self.nones = None
+
+    def program(self, prog: Program) -> str:
+        self.nones = Nones().program(prog)
+        for i, f in enumerate(prog.funcs):
+            name = str(f.id)
+            self.functions[name] = f
+            self.names[f] = "f_" + name if name.isidentifier() else "f{0}".format(i)
+        for f in prog.funcs:
+            self.function(f)
+        self.lines.append("functions = {{{0}}}".format(", ".join(
+            "{0!r}: {1}".format(name, self.names[f]) for name, f in self.functions.items())))
+        return "\n".join(self.lines) + "\n"
+
+    def emit(self, line: str):
+        self.lines.append("    " * self.depth + line)
+
+    def temp(self) -> str:
+        self.temps += 1
+        return "t{0}".format(self.temps)
+
+    def function(self, f: FunctionDef):
+        self.temps = 0
+        self.depth = 0
+        self.emit("def {0}({1}):".format(self.names[f], ", ".join("v{0}".format(i) for i in range(f.nparams))))
+        self.depth = 1
+        blank = ["v{0}".format(i) for i in range(f.nparams, len(f.types))]
+        if blank:
+            self.emit(" = ".join(blank) + " = None")
+        self.block(f.stmts)
+
+    def block(self, stmts: list):
+        """
+        Writes stmts (a pass if there is nothing to run) at the current depth
+        """
+        start = len(self.lines)
+        for s in stmts:
+            if s is not None and type(s) != str:
+                getattr(self, "compile_" + type(s).__name__)(s)
+        if len(self.lines) == start:
+            self.emit("pass")
+
+    def nested(self, stmts: list):
+        self.depth += 1
+        self.block(stmts)
+        self.depth -= 1
+
+    def compile_TypedAssignment(self, s: TypedAssignment):
+        code, none = self.expression(s.exp)
+        if none:
+            t = self.temp()
+            code = "{0} if ({0} := {1}) is not None else mismatch()".format(t, code)
+        self.emit("v{0} = {1}".format(s.slot, code))
+
+    def compile_Assignment(self, s: Assignment):
+        # not type checked: converted at run time like Assignment.eval
+        self.emit("v{0} = store({1}, {2!r})".format(s.slot, self.expression(s.exp)[0], s.t))
+
+    def compile_Block(self, s: Block):
+        self.block([j for i in s.stmts for j in i])
+
+    def compile_IfStmt(self, s: IfStmt):
+        self.emit("if {0}:".format(self.expression(s.cond)[0]))
+        self.nested([s.truepart])
+        if any(i is not None and type(i) != str for i in s.falsepart):
+            self.emit("else:")
+            self.nested(s.falsepart)
+
+    def compile_WhileStmt(self, s: WhileStmt):
+        self.emit("while {0}:".format(self.expression(s.cond)[0]))
+        self.nested([s.inLoop])
+
+    def compile_PrintStmt(self, s: PrintStmt):
+        args = [s.pArg] + list(s.pArgList or [])
+        self.emit("write([{0}])".format(", ".join(self.expression(a)[0] for a in args)))
+
+    def compile_ReturnStmt(self, s: ReturnStmt):
+        code, none = self.expression(s.exp)
+        if not none:
+            self.emit("return " + code)
+            return
+        # returning None returns nothing: the function goes on
+        t = self.temp()
+        self.emit("if ({0} := {1}) is not None:".format(t, code))
+        self.emit("    return " + t)
+
+    def expression(self, e: Expr) -> Tuple[str, bool]:
+        return getattr(self, "expr_" + type(e).__name__)(e)
+
+    def expr_LitExpr(self, e: LitExpr) -> Tuple[str, bool]:
+        value = e.eval(None, None)
+        if type(value) is float and not math.isfinite(value):
+            return "float({0!r})".format(str(value)), False
+        return repr(value), False
+
+    expr_ConstExpr = expr_LitExpr
+
+    def expr_IDExpr(self, e: IDExpr) -> Tuple[str, bool]:
+        return "v{0}".format(e.slot), self.nones.none[e]
+
+    def expr_BinaryExpr(self, e: BinaryExpr) -> Tuple[str, bool]:
+        l, lnone = self.expression(e.left)
+        r, rnone = self.expression(e.right)
+        op = pyops[e.op]
+        if not lnone and not rnone:
+            return "({0} {1} {2})".format(l, op, r), False
+        # both sides are evaluated, left first, even when one is None;
+        # a variable or a constant can be read out of order
+        if not rnone and type(e.right) in (IDExpr, ConstExpr, LitExpr):
+            a = self.temp()
+            return "(None if ({0} := {1}) is None else {0} {2} {3})".format(a, l, op, r), True
+        if not lnone and type(e.left) in (IDExpr, ConstExpr, LitExpr):
+            b = self.temp()
+            return "(None if ({0} := {1}) is None else {2} {3} {0})".format(b, r, l, op), True
+        a = self.temp()
+        b = self.temp()
+        return "(None if (({0} := {2}) is None) | (({1} := {3}) is None) else {0} {4} {1})".format(
+            a, b, l, r, op), True
+
+    def expr_AndExpr(self, e: AndExpr) -> Tuple[str, bool]:
+        if e.type is None:
+            return self.unchecked(e, False)
+        if e.type != "bool":
+            return self.expr_BinaryExpr(e)
+        l, lnone = self.expression(e.left)
+        r, rnone = self.expression(e.right)
+        # False or None on the left is the result
+        return "({0} and {1})".format(l, r), lnone or rnone
+
+    def expr_OrExpr(self, e: OrExpr) -> Tuple[str, bool]:
+        if e.type is None:
+            return self.unchecked(e, True)
+        if e.type != "bool":
+            return self.expr_BinaryExpr(e)
+        l, lnone = self.expression(e.left)
+        r, rnone = self.expression(e.right)
+        if not lnone:
+            return "({0} or {1})".format(l, r), rnone
+        a = self.temp()
+        return "({0} if ({0} := {1}) or {0} is None else {2})".format(a, l, r), True
+
+    def unchecked(self, e: BinaryExpr, decides: bool) -> Tuple[str, bool]:
+        """
+        && (decides False) or || (decides True) not type checked: a left
+        value that is the bool decides, or None, is the result, like
+        AndExpr.eval
+        """
+        l, lnone = self.expression(e.left)
+        r, rnone = self.expression(e.right)
+        a = self.temp()
+        b = self.temp()
+        return "({0} if ({0} := {2}) is {4} or {0} is None else (None if ({1} := {3}) is None else {0} {5} {1}))".format(
+            a, b, l, r, decides, pyops[e.op]), lnone or rnone
+
+    def expr_UnaryOp(self, e: UnaryOp) -> Tuple[str, bool]:
+        # None * -1 fails here as it does in UnaryOp.eval
+        return "({0} * -1)".format(self.expression(e.tree)[0]), False
+
+    def expr_Coercion(self, e: Coercion) -> Tuple[str, bool]:
+        code, none = self.expression(e.exp)
+        conv = e.conv.__name__
+        if not none:
+            return "{0}({1})".format(conv, code), False
+        a = self.temp()
+        return "(None if ({0} := {1}) is None else {2}({0}))".format(a, code, conv), True
+
+    def expr_FunctionExpr(self, e: FunctionExpr) -> Tuple[str, bool]:
+        f = self.functions.get(e.id)
+        if f is None:
+            return "fail({0!r})".format("Error: function {0} is not defined".format(e.id)), False
+        if len(e.params) != f.nparams:
+            return "fail({0!r})".format("Error: function {0} expected {1} parameters, got {2}".format(
+                e.id, f.nparams, len(e.params))), False
+        args = [self.expression(p)[0] for p in e.params]
+        return "{0}({1})".format(self.names[f], ", ".join(args)), not self.nones.returns[f]
+
+
+def fail(message: str):
+    raise SLUCFunctionError(message)
+
+
+def mismatch():
+    raise SLUCFunctionError("Error: Type Mismatch")
+
+
+def store(v, t: str):
+    """
+    The value Assignment.eval would store in a variable of type t
+    """
+    if t == type(v).__name__:
+        return v
+    if t == "int" and type(v) is float:
+        return int(v)
+    if t == "float" and type(v) is int:
+        return float(v)
+    raise SLUCFunctionError("Error: Type Mismatch")
+
+
+def translate(prog: Program) -> str:
+    """
+    Returns the Python source of prog
+    """
+    return SourceCompiler().program(prog)
+
+
+def version(optimized: bool, checked: bool) -> bytes:
+    """
+    Hash of what decides the generated code: the modules that build and
+    rewrite the tree, this one, the Python version and which passes ran
+    """
+    h = hashlib.sha1(sys.version.encode() + (b"O" if optimized else b"") + (b"" if checked else b"U"))
+    for name in ("lexer.py", "ast.py", "parser.py", "typechecker.py", "optimizer.py", "pysource.py"):
+        with open(os.path.join(here, name), "rb") as f:
+            h.update(f.read())
+    return h.digest()
+
+
+def path(fn: str, optimized: bool, checked: bool) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(fn)), "__slucache__",
+                        os.path.basename(fn) + ("" if checked else ".unchecked") +
+                        (".opt.code" if optimized else ".code"))
+
+
+def load(prog: Program, fn: Optional[str] = None, optimized: bool = False, checked: bool = True) -> CodeType:
+    """
+    Returns the compiled Python module of prog. With the file prog was
+    parsed from (optimized and checked saying whether it went through the
+    optimizer and the type checker), the code object is cached for that
+    source.
+    """
+    h = None if fn is None else serialize.source_hash(fn)
+    if h is None:
+        return compile(translate(prog), "<slu-c>", "exec")
+    key = (h, optimized, checked)
+    if key in cache:
+        return cache[key]
+    ver = version(optimized, checked)
+    p = path(fn, optimized, checked)
+    code = None
+    try:
+        with open(p, "rb") as f:
+            data = f.read()
+        if len(data) > header.size and header.unpack_from(data) == (MAGIC, h, ver):
+            code = marshal.loads(memoryview(data)[header.size:])
+    except (OSError, ValueError, EOFError, TypeError):
+        code = None  # missing or damaged: compile again
+    if code is None:
+        code = compile(translate(prog), "<{0}>".format(fn), "exec")
+        try:
+            os.makedirs(os.path.dirname(p), exist_ok=True)
+            with open(p + ".tmp", "wb") as f:
+                f.write(header.pack(MAGIC, h, ver) + marshal.dumps(code))
+            os.replace(p + ".tmp", p)
+        except OSError:
+            pass  # a read-only directory just means nothing is saved
+    cache[key] = code
+    return code
+
+
+def functions(code: CodeType, out: Output) -> Dict[str, Callable]:
+    """
+    Runs a load() result into a new namespace printing to out and returns
+    its function table: SLU-C name -> Python function of the arguments
+    """
+    namespace = {"write": out.write, "fail": fail, "mismatch": mismatch, "store": store}
+    exec(code, namespace)
+    return namespace["functions"]
+
+
+def run(prog: Program, out: Optional[Output] = None, fn: Optional[str] = None, optimized: bool = False,
+        checked: bool = True, code: Optional[CodeType] = None):
+    """
+    Compiles prog to Python (cached for fn), or takes the load() result
+    code, and runs its main function, flushing out at the end
+    """
+    if out is None:
+        out = Output()
+    table = functions(code or load(prog, fn, optimized, checked), out)
+    main = {str(f.id): f for f in prog.funcs}.get("main")
+    try:
+        if main is not None:
+            if main.nparams:
+                fail("Error: function main expected {0} parameters, got 0".format(main.nparams))
+            table["main"]()
+    finally:
+        out.flush()
@@ -0,0 +1,216 @@
+"""
+SLU-C parallel runner
+
+Runs many SLU-C programs, or many calls of one function, across a pool of
+worker processes. Every task runs its own Program with its own function
+table, its output is captured and reported in the order the tasks were
+given, and a task that runs longer than the timeout is stopped and reported
+as timed out.
+
+python runner.py [-j JOBS] [--engine tree|vm|closure|python] [-O] [--timeout S] file.c ...
+python runner.py [-j JOBS] [--timeout S] --call NAME file.c ARGS ...
+
+where each ARGS is one call's arguments separated by commas, e.g. 2,10.
+"""
+import io
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from typing import List, Optional, Sequence, Tuple
+
+from parser import Parser
+import ast
+import typechecker
+import optimizer
+import vm
+import closures
+import pysource
+from output import Output
+
+
+class TaskTimeout(BaseException):
+    """
+    Raised by the alarm when a task runs out of time. Not an Exception, so
+    the except Exception blocks of the code the task runs cannot swallow it.
+    """
+
+
+class Result:
+    """
+    What one task printed and how it ended: status is "ok", "error" (with
+    the message in error) or "timeout"
+    """
+    def __init__(self, name: str, status: str, output: str, seconds: float,
+                 error: Optional[str] = None, value=None):
+        self.name = name
+        self.status = status
+        self.output = output
+        self.seconds = seconds
+        self.error = error
+        self.value = value
+
+
+def alarm(signum, frame):
+    raise TaskTimeout()
+
+
+def load(fn: str, engine: str, optimize: bool, out: Optional[Output] = None):
+    """
+    Parses, type checks and (if asked) optimizes fn, then prepares it for
+    engine: the Program for tree, the CodeObjects for vm and the
+    ClosureFunctions (printing to out) for closure and the Python functions
+    (printing to out) for python
+    """
+    prog = Parser(fn).program()
+    typechecker.check(prog)
+    if optimize:
+        optimizer.optimize(prog)
+    if engine == "vm":
+        return vm.Compiler().program(prog)
+    if engine == "closure":
+        return closures.ClosureCompiler(out).program(prog)
+    if engine == "python":
+        return pysource.functions(pysource.load(prog, fn, optimize), out)
+    return prog
+
+
+# (file, modification time, optimize) -> CodeObjects, so a worker parses a
+# program once however many of its calls it runs; the VM keeps no state in
+# them between runs
+compiled = {}
+
+
+def execute(task: Tuple, engine: str, optimize: bool, timeout: Optional[float]) -> Result:
+    """
+    Runs one task in a worker: (fn,) runs the program, (fn, name, args)
+    calls one function on the VM and keeps its return value
+    """
+    out = io.StringIO()
+    sink = Output(out)
+    name = task[0] if len(task) == 1 else "{0}({1})".format(task[1], ", ".join(map(str, task[2])))
+    if timeout:
+        signal.signal(signal.SIGALRM, alarm)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    start = time.perf_counter()
+    status, error, value = "ok", None, None
+    try:
+        with redirect_stdout(out):
+            if len(task) == 1:
+                prepared = load(task[0], engine, optimize, sink)
+                if engine == "vm":
+                    vm.VM(prepared, sink).main()
+                elif engine == "closure":
+                    if "main" in prepared:
+                        prepared["main"]([])
+                elif engine == "python":
+                    if "main" in prepared:
+                        prepared["main"]()
+                else:
+                    prepared.eval(sink)
+            else:
+                key = (task[0], os.stat(task[0]).st_mtime_ns, optimize)
+                if key not in compiled:
+                    with redirect_stdout(io.StringIO()):  # no "Done" in a call's output
+                        compiled[key] = load(task[0], "vm", optimize)
+                functions = compiled[key]
+                if task[1] not in functions:
+                    raise ast.SLUCFunctionError("Error: function {0} is not defined".format(task[1]))
+                code = functions[task[1]]
+                value = vm.VM(functions, sink).run(code, convert(code, list(task[2])))
+    except TaskTimeout:
+        status = "timeout"
+    except (Exception, SystemExit) as e:  # the parser exits on a missing file
+        status, error = "error", "{0}: {1}".format(type(e).__name__, e)
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        sink.flush()
+    return Result(name, status, out.getvalue(), time.perf_counter() - start, error, value)
+
+
+def convert(code: vm.CodeObject, args: List) -> List:
+    """
+    args converted between int and float to the parameter types of code,
+    as the type checker converts the arguments of a call made in SLU-C
+    """
+    if len(args) != code.nparams:
+        return args  # VM.run reports it
+    converted = []
+    for i, (v, t) in enumerate(zip(args, code.types)):
+        given = type(v).__name__
+        if {given, t} == {"int", "float"}:
+            v = int(v) if t == "int" else float(v)
+        elif given != t:
+            raise ast.SLUCFunctionError("Error: Type Mismatch, argument {0} of {1} is {2}, expected {3}".format(
+                i + 1, code.name, given, t))
+        converted.append(v)
+    return converted
+
+
+def run(tasks: Sequence[Tuple], jobs: Optional[int] = None, engine: str = "tree", optimize: bool = False,
+        timeout: Optional[float] = None) -> List[Result]:
+    """
+    Runs every task on a pool of jobs worker processes (one per core by
+    default) and returns their Results in task order
+    """
+    with ProcessPoolExecutor(jobs) as pool:
+        futures = [pool.submit(execute, t, engine, optimize, timeout) for t in tasks]
+        return [f.result() for f in futures]
+
+
+def parse_value(text: str):
+    if text in ("true", "false"):
+        return text == "true"
+    return float(text) if "." in text or "e" in text else int(text)
+
+
+def summary(results: List[Result], wall: float):
+    """
+    Prints how the tasks ended and how long they took, in total and per
+    task, and how much faster that was than running them one by one
+    """
+    times = [r.seconds for r in results]
+    counts = {s: sum(r.status == s for r in results) for s in ("ok", "error", "timeout")}
+    print("{0} tasks: {1} ok, {2} errors, {3} timed out".format(
+        len(results), counts["ok"], counts["error"], counts["timeout"]))
+    if results:
+        print("task seconds: total {0:.3f}, min {1:.3f}, mean {2:.3f}, max {3:.3f}".format(
+            sum(times), min(times), sum(times) / len(times), max(times)))
+    print("wall seconds: {0:.3f} ({1:.2f}x the sum of the tasks)".format(wall, sum(times) / wall if wall else 0))
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Run SLU-C programs or calls in parallel")
+    ap.add_argument("-j", "--jobs", type=int, default=None, help="worker processes (default: one per core)")
+    ap.add_argument("--engine", choices=["tree", "vm", "closure", "python"], default="tree")
+    ap.add_argument("-O", "--optimize", action="store_true")
+    ap.add_argument("--timeout", type=float, default=None, metavar="S", help="seconds allowed per task")
+    ap.add_argument("--call", metavar="NAME", help="call function NAME of the one file once per ARGS")
+    ap.add_argument("--quiet", action="store_true", help="print only failures and the summary")
+    ap.add_argument("files", nargs="+")
+    args = ap.parse_args()
+
+    if args.call:
+        tasks = [(args.files[0], args.call, [parse_value(v) for v in a.split(",") if v])
+                 for a in args.files[1:]]
+    else:
+        tasks = [(fn,) for fn in args.files]
+    start = time.perf_counter()
+    results = run(tasks, args.jobs, args.engine, args.optimize, args.timeout)
+    wall = time.perf_counter() - start
+    for r in results:
+        if args.quiet and r.status == "ok":
+            continue
+        print("== {0}: {1} ({2:.3f}s)".format(r.name, r.status, r.seconds))
+        sys.stdout.write(r.output)
+        if r.value is not None:
+            print(r.value)
+        if r.error:
+            print(r.error)
+    summary(results, wall)
+    sys.exit(0 if all(r.status == "ok" for r in results) else 1)
@@ -0,0 +1,197 @@
+"""
+SLU-C compiled program files
+
+Writes a parsed Program to a compact binary file, __slucache__/<file>.ast next
+to the source, and loads it back much faster than the source can be parsed,
+the way Python uses .pyc files. The file is
+
+    magic (4 bytes) | format version (4 bytes, little endian)
+    | SHA-1 of the source (20 bytes) | SHA-1 of lexer.py, ast.py, parser.py and serialize.py (20 bytes)
+    | marshal data
+
+and the marshal data is a flat array of node records, children before their
+parents, in which every reference to another node is its index in the array.
+Loading is one loop over the array, with no recursion.
+"""
+import gc
+import hashlib
+import marshal
+import os
+import struct
+from typing import Optional
+
+from ast import *
+
+MAGIC = b"SLUC"
+FORMAT = 4
+header = struct.Struct("<4sI20s20s")
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+# how a field is stored
+PLAIN = 0    # as is
+NODE = 1     # a node (as its index), a ";" string or None
+NODES = 2    # a list of NODE values, or None
+NESTED = 3   # a list of lists of NODE values
+TYPE = 4     # a Python type or conversion function, by name
+
+fields = {
+    Program: [("funcs", NODES)],
+    FunctionDef: [("t", PLAIN), ("id", NODE), ("params", NODE), ("decls", NODES), ("stmts", NODES),
+                  ("slots", PLAIN), ("types", PLAIN), ("nparams", PLAIN), ("blank", PLAIN),
+                  ("line", PLAIN)],
+    Params: [("prms", PLAIN)],
+    Declaration: [("t", PLAIN), ("id", PLAIN)],
+    Assignment: [("var", NODE), ("exp", NODE), ("slot", PLAIN), ("t", PLAIN), ("line", PLAIN)],
+    TypedAssignment: [("var", NODE), ("exp", NODE), ("slot", PLAIN), ("t", PLAIN), ("line", PLAIN)],
+    Block: [("stmts", NESTED), ("line", PLAIN)],
+    IfStmt: [("cond", NODE), ("truepart", NODE), ("falsepart", NODES), ("line", PLAIN)],
+    WhileStmt: [("cond", NODE), ("inLoop", NODE), ("line", PLAIN)],
+    PrintStmt: [("pArg", NODE), ("pArgList", NODES), ("line", PLAIN)],
+    ReturnStmt: [("exp", NODE), ("line", PLAIN)],
+    BinaryExpr: [("left", NODE), ("right", NODE), ("op", PLAIN)],
+    AndExpr: [("left", NODE), ("right", NODE), ("op", PLAIN)],
+    OrExpr: [("left", NODE), ("right", NODE), ("op", PLAIN)],
+    UnaryOp: [("tree", NODE), ("op", PLAIN)],
+    IDExpr: [("id", PLAIN), ("slot", PLAIN)],
+    FunctionExpr: [("id", PLAIN), ("params", NODES)],
+    LitExpr: [("lit", PLAIN), ("t", TYPE)],
+    ConstExpr: [("lit", PLAIN), ("t", TYPE), ("value", PLAIN)],
+    Coercion: [("exp", NODE), ("t", PLAIN), ("type", PLAIN), ("conv", TYPE)],
+}
+classes = list(fields)
+types = {"int": int, "float": float, "str": str, "bool": bool}
+
+
+def version() -> bytes:
+    """
+    Hash of the modules that decide what a parsed Program looks like
+    """
+    h = hashlib.sha1()
+    for name in ("lexer.py", "ast.py", "parser.py", "serialize.py"):
+        with open(os.path.join(here, name), "rb") as f:
+            h.update(f.read())
+    return h.digest()
+
+
+def path(fn: str) -> str:
+    return os.path.join(os.path.dirname(os.path.abspath(fn)), "__slucache__", os.path.basename(fn) + ".ast")
+
+
+class Writer:
+    """
+    Lays a tree out as node records, children first
+    """
+    def __init__(self):
+        self.records = []
+        self.index = {}
+        self.classes = {cls: i for i, cls in enumerate(classes)}
+
+    def node(self, n):
+        if n is None or type(n) == str:
+            return n
+        if id(n) in self.index:
+            return self.index[id(n)]
+        record = [self.classes[type(n)]]
+        for name, kind in fields[type(n)]:
+            v = getattr(n, name)
+            if kind == NODE:
+                v = self.node(v)
+            elif kind == NODES:
+                v = None if v is None else [self.node(i) for i in v]
+            elif kind == NESTED:
+                v = [[self.node(j) for j in i] for i in v]
+            elif kind == TYPE:
+                v = v.__name__
+            record.append(v)
+        self.index[id(n)] = len(self.records)
+        self.records.append(tuple(record))
+        return self.index[id(n)]
+
+
+def dumps(prog: Program, source_hash: bytes) -> bytes:
+    """
+    Returns the file contents for prog, parsed from source with this hash
+    """
+    w = Writer()
+    w.node(prog)
+    return header.pack(MAGIC, FORMAT, source_hash, version()) + marshal.dumps(w.records)
+
+
+def loads(data: bytes) -> Program:
+    """
+    Rebuilds the Program of a dumps() result (without its header check)
+    """
+    # every node is new and none refer to each other in a cycle, so there
+    # is nothing for the garbage collector to find while they are made
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return build(marshal.loads(memoryview(data)[header.size:]))
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def build(records: list) -> Program:
+    table = [(cls, fields[cls]) for cls in classes]
+    nodes = []
+    append = nodes.append
+    for record in records:
+        cls, spec = table[record[0]]
+        n = cls.__new__(cls)
+        d = n.__dict__
+        i = 1
+        for name, kind in spec:
+            v = record[i]
+            i += 1
+            if kind == NODE:
+                if type(v) is int:
+                    v = nodes[v]
+            elif kind == NODES:
+                if v is not None:
+                    v = [nodes[j] if type(j) is int else j for j in v]
+            elif kind == NESTED:
+                v = [[nodes[k] if type(k) is int else k for k in j] for j in v]
+            elif kind == TYPE:
+                v = types[v]
+            d[name] = v
+        append(n)
+    return nodes[-1]
+
+
+def load(fn: str, source_hash: bytes) -> Optional[Program]:
+    """
+    Returns the Program saved for fn, or None if there is none or it was
+    saved for other source or by another version
+    """
+    try:
+        with open(path(fn), "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) < header.size or header.unpack_from(data) != (MAGIC, FORMAT, source_hash, version()):
+        return None
+    try:
+        return loads(data)
+    except Exception:  # a damaged file is just out of date
+        return None
+
+
+def save(fn: str, prog: Program, source_hash: bytes):
+    p = path(fn)
+    try:
+        os.makedirs(os.path.dirname(p), exist_ok=True)
+        with open(p + ".tmp", "wb") as f:
+            f.write(dumps(prog, source_hash))
+        os.replace(p + ".tmp", p)
+    except OSError:
+        pass  # a read-only directory just means nothing is saved
+
+
+def source_hash(fn: str) -> Optional[bytes]:
+    try:
+        with open(fn, "rb") as f:
+            return hashlib.sha1(f.read()).digest()
+    except OSError:
+        return None
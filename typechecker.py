@@ -0,0 +1,182 @@
+"""
+SLU-C static type checker
+
+Runs once between Parser.program() and running the program. It gives every
+expression its static type (the type attribute), turns each assignment into
+a TypedAssignment and makes every int/float conversion an explicit Coercion:
+on assignment, on call arguments (to the parameter type) and on return
+values (to the declared return type). Every type error in the program is
+reported before any of it runs.
+"""
+from typing import Optional
+from ast import *
+
+numeric = {"int", "float"}
+arithmetic = {"+", "-", "*", "%"}
+relational = {"<", "<=", ">", ">="}
+logical = {"&&", "||"}
+shifts = {"<<", ">>"}
+
+
+class TypeChecker:
+    """
+    Each check_ method checks one statement; each type_ method returns the
+    static type name of an expression ("int", "float", "bool" or "str").
+    Errors are collected so one run reports all of them.
+    """
+    def __init__(self):
+        self.errors = []
+        self.functions = {}
+        self.coerced = 0
+        self.scope = None
+
+    def program(self, prog: Program) -> Program:
+        for f in prog.funcs:
+            self.functions[str(f.id)] = f
+        for f in prog.funcs:
+            self.scope = f
+            f.stmts = [self.statement(s) for s in f.stmts]
+        if self.errors:
+            raise SLUCTypeError("\n".join(self.errors))
+        return prog
+
+    def error(self, message: str):
+        self.errors.append("Error: {0} in function {1}".format(message, self.scope.id))
+
+    def convert(self, e: Expr, t: str, what: str) -> Expr:
+        """
+        Returns e as a value of type t, wrapped in a Coercion between int and
+        float if need be
+        """
+        if e.type == t or e.type is None:
+            # None: already reported
+            return e
+        if {e.type, t} == {"int", "float"}:
+            self.coerced += 1
+            return Coercion(e, t)
+        self.error("Type Mismatch, {0} is {1}, expected {2}".format(what, e.type, t))
+        return e
+
+    def statement(self, s):
+        if s is None or type(s) == str:
+            return s
+        return getattr(self, "check_" + type(s).__name__)(s)
+
+    def check_Assignment(self, s: Assignment):
+        self.expression(s.exp)
+        typed = TypedAssignment(s.var, self.convert(s.exp, s.t, "{0} = {1}".format(s.var, s.exp)))
+        typed.slot = s.slot
+        typed.t = s.t
+        typed.line = s.line
+        return typed
+
+    check_TypedAssignment = check_Assignment
+
+    def check_Block(self, s: Block):
+        s.stmts = [[self.statement(j) for j in i] for i in s.stmts]
+        return s
+
+    def check_IfStmt(self, s: IfStmt):
+        self.expression(s.cond)
+        s.truepart = self.statement(s.truepart)
+        s.falsepart = [self.statement(i) for i in s.falsepart]
+        return s
+
+    def check_WhileStmt(self, s: WhileStmt):
+        self.expression(s.cond)
+        s.inLoop = self.statement(s.inLoop)
+        return s
+
+    def check_PrintStmt(self, s: PrintStmt):
+        self.expression(s.pArg)
+        for i in s.pArgList or []:
+            self.expression(i)
+        return s
+
+    def check_ReturnStmt(self, s: ReturnStmt):
+        self.expression(s.exp)
+        s.exp = self.convert(s.exp, self.scope.t, "return {0}".format(s.exp))
+        return s
+
+    def expression(self, e: Expr) -> Optional[str]:
+        e.type = getattr(self, "type_" + type(e).__name__)(e)
+        return e.type
+
+    def type_LitExpr(self, e: LitExpr) -> str:
+        return e.t.__name__
+
+    type_ConstExpr = type_LitExpr
+
+    def type_IDExpr(self, e: IDExpr) -> str:
+        return self.scope.types[e.slot]
+
+    def type_Coercion(self, e: Coercion) -> str:
+        self.expression(e.exp)
+        return e.t
+
+    def type_UnaryOp(self, e: UnaryOp) -> Optional[str]:
+        t = self.expression(e.tree)
+        # eval multiplies by -1, which turns a bool into an int
+        return "int" if t == "bool" else t
+
+    def type_BinaryExpr(self, e: BinaryExpr) -> Optional[str]:
+        l = self.expression(e.left)
+        r = self.expression(e.right)
+        op = e.op
+        if op in ("==", "!="):
+            return "bool"
+        if l == r == "bool" and op in logical:
+            return "bool"
+        if l in numeric and r in numeric:
+            if op in relational:
+                return "bool"
+            if op == "/":
+                return "float"
+            if op in arithmetic:
+                return "float" if "float" in (l, r) else "int"
+            if op in logical and l == r == "int":
+                return "int"
+            if op in shifts and l == r == "int":
+                return "int"
+        elif l == r == "str" and (op in relational or op == "+"):
+            return "bool" if op in relational else "str"
+        elif op == "*" and {l, r} in ({"str", "int"}, {"str", "bool"}):
+            return "str"
+        if l is not None and r is not None:
+            self.error("Type Mismatch, {0} {1} {2} in {3}".format(l, op, r, e))
+        return None
+
+    type_AndExpr = type_BinaryExpr
+    type_OrExpr = type_BinaryExpr
+
+    def type_FunctionExpr(self, e: FunctionExpr) -> Optional[str]:
+        for p in e.params:
+            self.expression(p)
+        if e.id not in self.functions:
+            self.error("function {0} is not defined".format(e.id))
+            return None
+        f = self.functions[e.id]
+        prms = f.params.eval()
+        if len(prms) != len(e.params):
+            self.error("function {0} expected {1} parameters, got {2}".format(e.id, len(prms), len(e.params)))
+            return f.t
+        e.params = [self.convert(p, t, "argument {0} of {1}".format(id, e.id))
+                    for p, (t, id) in zip(e.params, prms)]
+        return f.t
+
+
+class SLUCTypeError(Exception):
+    def __init__(self, message: str):
+        Exception.__init__(self)
+        self.message = message
+
+    def __str__(self):
+        return self.message
+
+
+def check(prog: Program) -> Program:
+    """
+    Type checks prog in place and returns it, raising SLUCTypeError with
+    every error found
+    """
+    return TypeChecker().program(prog)
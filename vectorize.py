@@ -0,0 +1,282 @@
+"""
+SLU-C batched execution
+
+Runs one SLU-C function over whole columns of arguments at once: every
+variable holds a NumPy array with one lane per argument tuple, expressions
+are evaluated elementwise, and ifs and whiles run under a mask of the lanes
+that take them. A function that calls other functions or prints, or a batch
+that would behave differently elementwise (reading a variable before it is
+set, dividing by zero, overflowing a 64-bit int), is run lane by lane on the
+VM instead, so the results are always those of calling the function once per
+argument tuple.
+
+NumPy is only needed here; vectorize raises ImportError without it.
+"""
+import os
+import sys
+from typing import List, Optional, Sequence
+from ast import *
+import typechecker
+import vm
+
+np = None
+
+# node types the masked evaluator handles; anything else runs lane by lane
+supported = {TypedAssignment, Block, IfStmt, WhileStmt, ReturnStmt,
+             BinaryExpr, AndExpr, OrExpr, UnaryOp, LitExpr, ConstExpr, IDExpr, Coercion}
+arithmetic = {"+", "-", "*", "/", "%"}
+shifts = {"<<", ">>"}
+int_max = 2.0 ** 63
+dtypes = {"int": "int64", "float": "float64", "bool": "bool"}
+
+
+def import_numpy():
+    """
+    Imports numpy into the module global np. numpy imports the standard
+    library's ast module (through inspect), which the ast.py next to this
+    file hides, so this directory is taken off sys.path while it loads.
+    """
+    global np
+    if np is not None:
+        return
+    here = os.path.dirname(os.path.abspath(__file__))
+    ours = sys.modules.pop("ast", None)
+    path = sys.path[:]
+    sys.path[:] = [p for p in path if os.path.abspath(p or os.curdir) != here]
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("batched execution needs NumPy (pip install numpy)")
+    finally:
+        sys.path[:] = path
+        if ours is not None:
+            sys.modules["ast"] = ours
+    np = numpy
+
+
+class Fallback(Exception):
+    """
+    The lanes of a batch cannot run together; message says why
+    """
+    pass
+
+
+class Lanes:
+    """
+    One masked run of a function over n lanes. Every method takes the mask
+    of the lanes it applies to; execute returns the lanes still running
+    afterwards (those that did not return).
+    """
+    def __init__(self, f: FunctionDef, columns: List, n: int):
+        self.f = f
+        self.n = n
+        self.frame = list(columns) + [None] * len(f.blank)
+        # lanes in which each declared variable has been assigned
+        self.assigned = [None] * f.nparams + [np.zeros(n, bool) for _ in f.blank]
+        self.done = np.zeros(n, bool)
+        self.result = np.zeros(n, dtypes[f.t])
+
+    def run(self):
+        mask = np.ones(self.n, bool)
+        with np.errstate(all="ignore"):
+            for s in self.f.stmts:
+                mask = self.execute(s, mask)
+        if self.done.all():
+            return self.result
+        # lanes that ran off the end of the function return None
+        result = self.result.astype(object)
+        result[~self.done] = None
+        return result
+
+    def full(self, v):
+        return np.broadcast_to(v, (self.n,))
+
+    def execute(self, s, mask):
+        if type(s) == str or not mask.any():
+            return mask
+        return getattr(self, "exec_" + type(s).__name__)(s, mask)
+
+    def exec_TypedAssignment(self, s: TypedAssignment, mask):
+        v = self.value(s.exp, mask)
+        old = self.frame[s.slot]
+        if old is None:
+            old = np.zeros(self.n, dtypes[s.t])
+        self.frame[s.slot] = np.where(mask, v, old)
+        if self.assigned[s.slot] is not None:
+            self.assigned[s.slot] = self.assigned[s.slot] | mask
+        return mask
+
+    def exec_Block(self, s: Block, mask):
+        for i in s.stmts:
+            for j in i:
+                mask = self.execute(j, mask)
+        return mask
+
+    def exec_IfStmt(self, s: IfStmt, mask):
+        c = self.truth(self.value(s.cond, mask))
+        after = self.execute(s.truepart, mask & c)
+        other = mask & ~c
+        for i in s.falsepart:
+            other = self.execute(i, other)
+        return after | other
+
+    def exec_WhileStmt(self, s: WhileStmt, mask):
+        finished = np.zeros(self.n, bool)
+        while mask.any():
+            c = mask & self.truth(self.value(s.cond, mask))
+            finished |= mask & ~c
+            mask = self.execute(s.inLoop, c)
+        return finished
+
+    def exec_ReturnStmt(self, s: ReturnStmt, mask):
+        self.result[mask] = self.full(self.value(s.exp, mask))[mask]
+        self.done |= mask
+        return np.zeros(self.n, bool)
+
+    def truth(self, v):
+        return self.full(v != 0 if v.dtype != bool else v)
+
+    def value(self, e: Expr, mask):
+        return getattr(self, "value_" + type(e).__name__)(e, mask)
+
+    def value_LitExpr(self, e: LitExpr, mask):
+        v = e.eval(None, None)
+        if type(v) is int and abs(v) >= int_max:
+            raise Fallback("{0} does not fit in 64 bits".format(v))
+        return np.asarray(v)
+
+    value_ConstExpr = value_LitExpr
+
+    def value_IDExpr(self, e: IDExpr, mask):
+        v = self.frame[e.slot]
+        assigned = self.assigned[e.slot]
+        if v is None or assigned is not None and (mask & ~assigned).any():
+            raise Fallback("{0} is read before it is set".format(e.id))
+        return v
+
+    def value_Coercion(self, e: Coercion, mask):
+        v = self.value(e.exp, mask)
+        if e.t == "float":
+            return v.astype(np.float64)
+        bad = ~np.isfinite(v) | (np.abs(v) >= int_max)
+        if self.full(bad)[mask].any():
+            raise Fallback("a float does not fit in an int")
+        return v.astype(np.int64)
+
+    def value_UnaryOp(self, e: UnaryOp, mask):
+        return self.value(e.tree, mask) * -1
+
+    def value_BinaryExpr(self, e: BinaryExpr, mask):
+        l = self.value(e.left, mask)
+        r = self.value(e.right, mask)
+        op = e.op
+        if op in arithmetic:
+            # Python adds bools as ints, NumPy as logical or
+            if l.dtype == bool:
+                l = l.astype(np.int64)
+            if r.dtype == bool:
+                r = r.astype(np.int64)
+            if op in ("/", "%") and self.full(r == 0)[mask].any():
+                raise Fallback("division by zero")
+        v = ops[op](l, r)
+        if op in ("+", "-", "*") and v.dtype == np.int64:
+            big = np.abs(ops[op](l.astype(np.float64), r.astype(np.float64))) >= int_max
+            if self.full(big)[mask].any():
+                raise Fallback("an int does not fit in 64 bits")
+        return v
+
+    def value_AndExpr(self, e: AndExpr, mask):
+        if e.type != "bool":
+            return self.value_BinaryExpr(e, mask)
+        l = self.full(self.value(e.left, mask))
+        # right only runs in the lanes where left is true
+        return l & self.value(e.right, mask & l)
+
+    def value_OrExpr(self, e: OrExpr, mask):
+        if e.type != "bool":
+            return self.value_BinaryExpr(e, mask)
+        l = self.full(self.value(e.left, mask))
+        return l | self.value(e.right, mask & ~l)
+
+
+class BatchFunction:
+    """
+    One function of a Program, called with a column of values for each
+    parameter. The Program is type checked first so every conversion
+    between int and float is explicit. reason says why the function runs
+    lane by lane (None when it is vectorized) and fallback why the last
+    batch did.
+    """
+    def __init__(self, prog: Program, name: str):
+        import_numpy()
+        typechecker.check(prog)
+        functions = {str(f.id): f for f in prog.funcs}
+        if name not in functions:
+            raise SLUCFunctionError("Error: function {0} is not defined".format(name))
+        self.f = functions[name]
+        self.code = vm.Compiler().program(prog)
+        self.reason = None
+        self.fallback = None
+        for node in (n for s in self.f.stmts if type(s) != str for n in walk(s)):
+            if type(node) not in supported:
+                self.reason = "uses {0}".format(type(node).__name__)
+                break
+            if isinstance(node, LitExpr) and node.t == str:
+                self.reason = "uses a string"
+                break
+            if type(node) == BinaryExpr and node.op in shifts:
+                # NumPy shifts wrap around and take negative counts
+                self.reason = "uses a shift"
+                break
+
+    def __call__(self, *columns: Sequence):
+        f = self.f
+        if len(columns) != f.nparams:
+            raise SLUCFunctionError("Error: function {0} expected {1} parameters, got {2}".format(
+                f.id, f.nparams, len(columns)))
+        columns = [self.column(c, t, id) for c, (t, id) in zip(np.broadcast_arrays(*columns) if columns else [],
+                                                               f.params.eval())]
+        n = len(columns[0]) if columns else 1
+        self.fallback = self.reason
+        if self.reason is None:
+            try:
+                return Lanes(f, columns, n).run()
+            except Fallback as e:
+                self.fallback = str(e)
+        return self.per_lane(columns, n)
+
+    def column(self, c, t: str, id: str):
+        """
+        Converts one argument column to its parameter's type, the way the
+        type checker converts arguments
+        """
+        c = np.array(c).reshape(-1)
+        kind = {"b": "bool", "i": "int", "u": "int", "f": "float"}.get(c.dtype.kind)
+        if kind == t:
+            return c.astype(dtypes[t])
+        if {kind, t} == {"int", "float"}:
+            if t == "int" and not np.all(np.isfinite(c)):
+                raise SLUCFunctionError("Error: Type Mismatch, argument {0} is not a number".format(id))
+            return c.astype(dtypes[t])
+        raise SLUCFunctionError("Error: Type Mismatch, argument {0} is {1}, expected {2}".format(id, kind, t))
+
+    def per_lane(self, columns: List, n: int):
+        machine = vm.VM(self.code)
+        code = self.code[str(self.f.id)]
+        try:
+            results = [machine.run(code, [c[i].item() for c in columns]) for i in range(n)]
+        finally:
+            machine.out.flush()
+        try:
+            if None not in results:
+                return np.array(results, dtypes[self.f.t])
+        except OverflowError:
+            pass
+        return np.array(results, object)
+
+
+def vectorize(prog: Program, name: str) -> BatchFunction:
+    """
+    Returns function name of prog as a BatchFunction
+    """
+    return BatchFunction(prog, name)
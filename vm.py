@@ -0,0 +1,395 @@
+"""
+SLU-C bytecode compiler and stack virtual machine
+
+The Compiler turns each FunctionDef of a Program into a CodeObject, a flat
+list of (op, a, b, c) instructions over numbered local slots. The VM runs
+those instructions with a single dispatch loop instead of calling eval on
+every node of the tree. SLU-C calls do not use Python recursion: the VM
+keeps its own stack of caller frames, and a "return f(...)" of a function
+that always returns a value reuses the current frame, so recursion depth is
+limited only by memory.
+"""
+from typing import Dict, List, Optional
+from ast import *
+from output import Output
+import analysis
+
+# opcodes
+CONST = 0         # push a
+LOAD = 1          # push frame[a]
+STORE_INT = 2     # frame[a] = pop(), converted like Assignment.eval
+STORE_FLOAT = 3
+STORE_BOOL = 4
+STORE = 5         # frame[a] = pop() if its type name is b
+BINOP = 6         # r = pop(); l = pop(); push a(l, r)
+BINOP_LC = 7      # push b(frame[a], c)
+BINOP_LL = 8      # push b(frame[a], frame[c])
+NEG = 9           # push pop() * -1
+JUMP = 10         # pc = a
+JUMP_IF_FALSE = 11  # if not pop(): pc = a
+PRINT = 12        # print the top a values, deepest first
+CALL = 13         # call CodeObject a with the top b values, as many as it takes
+RETURN = 14       # return pop() unless it is None
+TAILCALL = 15     # return the result of calling CodeObject a with the top b values,
+                  # which is never None
+END = 16          # return None
+STORE_TYPED = 17  # frame[a] = pop(), statically typed, so only None is rejected
+CONVERT = 18      # push a(pop()) unless it is None
+JUMP_IF_FALSE_OR_POP = 19  # if not top: pc = a (keeping it), else pop()
+JUMP_IF_TRUE_OR_POP = 20   # if top or top is None: pc = a (keeping it), else pop()
+JUMP_IF_IS = 21   # if top is b or None: pc = a (keeping it)
+FAIL = 22         # raise SLUCFunctionError(a)
+
+opnames = ["CONST", "LOAD", "STORE_INT", "STORE_FLOAT", "STORE_BOOL", "STORE", "BINOP",
+           "BINOP_LC", "BINOP_LL", "NEG", "JUMP", "JUMP_IF_FALSE", "PRINT", "CALL",
+           "RETURN", "TAILCALL", "END", "STORE_TYPED", "CONVERT", "JUMP_IF_FALSE_OR_POP",
+           "JUMP_IF_TRUE_OR_POP", "JUMP_IF_IS", "FAIL"]
+
+stores = {"int": STORE_INT, "float": STORE_FLOAT, "bool": STORE_BOOL}
+
+
+class CodeObject:
+    """
+    Compiled form of one FunctionDef: its instructions, the number of
+    parameters and the frame slots left empty for declarations.
+    """
+    def __init__(self, name: str, nparams: int):
+        self.name = name
+        self.nparams = nparams
+        self.types = []  # of the parameters
+        self.instrs = []
+        self.blank = []
+
+    def __str__(self):
+        lines = ["{0}:".format(self.name)]
+        for pc, (op, a, b, c) in enumerate(self.instrs):
+            args = [x.__name__ if callable(x) else
+                    x.name if isinstance(x, CodeObject) else repr(x)
+                    for x in (a, b, c) if x is not None]
+            lines.append("{0:>5}  {1:<14}{2}".format(pc, opnames[op], " ".join(args)))
+        return "\n".join(lines)
+
+
+class Compiler:
+    """
+    Compiles a Program into CodeObjects, one per function, using the frame
+    slots FunctionDef.resolve gave each variable.
+    """
+    def __init__(self):
+        self.functions = {}
+        self.returning = set()
+
+    def program(self, prog: Program) -> Dict[str, CodeObject]:
+        self.returning = analysis.returning(prog)
+        # create every CodeObject first so calls can be linked directly
+        for f in prog.funcs:
+            self.functions[str(f.id)] = CodeObject(str(f.id), len(f.params.eval()))
+        for f in prog.funcs:
+            self.function(f)
+        return self.functions
+
+    def function(self, f: FunctionDef):
+        code = self.functions[str(f.id)]
+        self.code = code.instrs
+        code.blank = f.blank
+        code.types = f.types[:f.nparams]
+        for s in f.stmts:
+            self.statement(s)
+        self.emit(END)
+
+    def emit(self, op: int, a=None, b=None, c=None) -> int:
+        self.code.append((op, a, b, c))
+        return len(self.code) - 1
+
+    def patch(self, at: int, target: int):
+        op, a, b, c = self.code[at]
+        self.code[at] = (op, target, b, c)
+
+    def statement(self, s):
+        if s is None or type(s) == str:
+            return
+        getattr(self, "compile_" + type(s).__name__)(s)
+
+    def compile_ReturnStmt(self, s: ReturnStmt):
+        # a None result does not return, so only a callee that always
+        # returns a value can take over the frame
+        if type(s.exp) == FunctionExpr and s.exp.id in self.returning:
+            self.compile_FunctionExpr(s.exp, TAILCALL)
+        else:
+            self.expression(s.exp)
+            self.emit(RETURN)
+
+    def compile_Assignment(self, s: Assignment):
+        self.expression(s.exp)
+        if s.t in stores:
+            self.emit(stores[s.t], s.slot)
+        else:
+            self.emit(STORE, s.slot, s.t)
+
+    def compile_TypedAssignment(self, s: TypedAssignment):
+        self.expression(s.exp)
+        self.emit(STORE_TYPED, s.slot)
+
+    def compile_Block(self, s: Block):
+        for i in s.stmts:
+            for j in i:
+                self.statement(j)
+
+    def condition(self, e: Expr) -> List[int]:
+        """
+        Compiles e to jump where it is false, returning the jumps to patch.
+        A && of two bools becomes a jump after each side, so nothing is kept
+        on the stack to test again.
+        """
+        if type(e) == AndExpr and e.type == "bool":
+            return self.condition(e.left) + self.condition(e.right)
+        self.expression(e)
+        return [self.emit(JUMP_IF_FALSE)]
+
+    def compile_IfStmt(self, s: IfStmt):
+        jumps = self.condition(s.cond)
+        self.statement(s.truepart)
+        if s.falsepart:
+            j = self.emit(JUMP)
+            for jf in jumps:
+                self.patch(jf, len(self.code))
+            for i in s.falsepart:
+                self.statement(i)
+            self.patch(j, len(self.code))
+        else:
+            for jf in jumps:
+                self.patch(jf, len(self.code))
+
+    def compile_WhileStmt(self, s: WhileStmt):
+        top = len(self.code)
+        jumps = self.condition(s.cond)
+        self.statement(s.inLoop)
+        self.emit(JUMP, top)
+        for jf in jumps:
+            self.patch(jf, len(self.code))
+
+    def compile_PrintStmt(self, s: PrintStmt):
+        args = [s.pArg] + list(s.pArgList or [])
+        for a in args:
+            self.expression(a)
+        self.emit(PRINT, len(args))
+
+    def expression(self, e: Expr):
+        getattr(self, "compile_" + type(e).__name__)(e)
+
+    def compile_LitExpr(self, e: LitExpr):
+        self.emit(CONST, e.eval(None, None))
+
+    compile_ConstExpr = compile_LitExpr
+
+    def compile_IDExpr(self, e: IDExpr):
+        self.emit(LOAD, e.slot)
+
+    def compile_BinaryExpr(self, e: BinaryExpr):
+        fn = ops[e.op]
+        if type(e.left) == IDExpr:
+            if isinstance(e.right, LitExpr):
+                self.emit(BINOP_LC, e.left.slot, fn, e.right.eval(None, None))
+                return
+            if type(e.right) == IDExpr:
+                self.emit(BINOP_LL, e.left.slot, fn, e.right.slot)
+                return
+        self.expression(e.left)
+        self.expression(e.right)
+        self.emit(BINOP, fn)
+
+    def compile_AndExpr(self, e: AndExpr):
+        if e.type is None:
+            return self.unchecked(e, False)
+        if e.type != "bool":
+            return self.compile_BinaryExpr(e)
+        self.expression(e.left)
+        j = self.emit(JUMP_IF_FALSE_OR_POP)
+        self.expression(e.right)
+        self.patch(j, len(self.code))
+
+    def compile_OrExpr(self, e: OrExpr):
+        if e.type is None:
+            return self.unchecked(e, True)
+        if e.type != "bool":
+            return self.compile_BinaryExpr(e)
+        self.expression(e.left)
+        j = self.emit(JUMP_IF_TRUE_OR_POP)
+        self.expression(e.right)
+        self.patch(j, len(self.code))
+
+    def unchecked(self, e: BinaryExpr, decides: bool):
+        """
+        && (decides False) or || (decides True) not type checked: a left
+        value that is the bool decides, or None, is the result; otherwise
+        both sides go to BINOP, like AndExpr.eval
+        """
+        self.expression(e.left)
+        j = self.emit(JUMP_IF_IS, None, decides)
+        self.expression(e.right)
+        self.emit(BINOP, ops[e.op])
+        self.patch(j, len(self.code))
+
+    def compile_UnaryOp(self, e: UnaryOp):
+        self.expression(e.tree)
+        self.emit(NEG)
+
+    def compile_Coercion(self, e: Coercion):
+        self.expression(e.exp)
+        self.emit(CONVERT, e.conv)
+
+    def compile_FunctionExpr(self, e: FunctionExpr, op: int = CALL):
+        # a bad call fails when it runs, before its arguments, like FunctionExpr.eval
+        code = self.functions.get(e.id)
+        if code is None:
+            self.emit(FAIL, "Error: function {0} is not defined".format(e.id))
+            return
+        if len(e.params) != code.nparams:
+            self.emit(FAIL, "Error: function {0} expected {1} parameters, got {2}".format(
+                e.id, code.nparams, len(e.params)))
+            return
+        for p in e.params:
+            self.expression(p)
+        self.emit(op, code, len(e.params))
+
+
+class VM:
+    """
+    Runs CodeObjects. Every call gets a frame (a list of slot values); the
+    frames of callers wait on the VM's own call stack, and all of them share
+    one operand stack. A tail call replaces the current frame and returns
+    the callee's result directly; the Compiler only makes tail calls to
+    functions that never return None.
+    Prints go to out, which main flushes when the program ends and callers
+    of run flush themselves.
+    """
+    def __init__(self, functions: Dict[str, CodeObject], out: Optional[Output] = None):
+        self.functions = functions
+        self.out = Output() if out is None else out
+
+    def main(self):
+        try:
+            if "main" in self.functions:
+                self.run(self.functions["main"], [])
+        finally:
+            self.out.flush()
+
+    def run(self, code: CodeObject, args: List) -> Optional[object]:
+        if len(args) != code.nparams:
+            raise SLUCFunctionError("Error: function {0} expected {1} parameters, got {2}".format(
+                code.name, code.nparams, len(args)))
+        frame = args + code.blank
+        instrs = code.instrs
+        calls = []  # (instrs, pc, frame) of every caller
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        write = self.out.write
+        pc = 0
+        while True:
+            op, a, b, c = instrs[pc]
+            pc += 1
+            if op == LOAD:
+                push(frame[a])
+            elif op == BINOP_LC:
+                l = frame[a]
+                push(None if l is None else b(l, c))
+            elif op == BINOP_LL:
+                l = frame[a]
+                r = frame[c]
+                push(None if l is None or r is None else b(l, r))
+            elif op == JUMP_IF_FALSE:
+                if not pop():
+                    pc = a
+            elif op == CONST:
+                push(a)
+            elif op == BINOP:
+                r = pop()
+                l = pop()
+                push(None if l is None or r is None else a(l, r))
+            elif op == JUMP:
+                pc = a
+            elif op == STORE_TYPED:
+                v = pop()
+                if v is None:
+                    raise SLUCFunctionError("Error: Type Mismatch")
+                frame[a] = v
+            elif op == CONVERT:
+                v = pop()
+                push(None if v is None else a(v))
+            elif op == JUMP_IF_FALSE_OR_POP:
+                if stack[-1]:
+                    pop()
+                else:
+                    pc = a
+            elif op == JUMP_IF_TRUE_OR_POP:
+                v = stack[-1]
+                if v or v is None:
+                    pc = a
+                else:
+                    pop()
+            elif op == JUMP_IF_IS:
+                v = stack[-1]
+                if v is b or v is None:
+                    pc = a
+            elif op == STORE_INT:
+                v = pop()
+                t = type(v)
+                if t is int:
+                    frame[a] = v
+                elif t is float:
+                    frame[a] = int(v)
+                else:
+                    raise SLUCFunctionError("Error: Type Mismatch")
+            elif op == STORE_FLOAT:
+                v = pop()
+                t = type(v)
+                if t is float:
+                    frame[a] = v
+                elif t is int:
+                    frame[a] = float(v)
+                else:
+                    raise SLUCFunctionError("Error: Type Mismatch")
+            elif op == STORE_BOOL:
+                v = pop()
+                if type(v) is not bool:
+                    raise SLUCFunctionError("Error: Type Mismatch")
+                frame[a] = v
+            elif op == CALL or op == TAILCALL:
+                if b:
+                    args = stack[-b:]
+                    del stack[-b:]
+                    args.extend(a.blank)
+                else:
+                    args = a.blank[:]
+                if op == CALL:
+                    calls.append((instrs, pc, frame))
+                frame = args
+                instrs = a.instrs
+                pc = 0
+            elif op == PRINT:
+                write(stack[-a:])
+                del stack[-a:]
+            elif op == NEG:
+                push(pop() * -1)
+            elif op == RETURN or op == END:
+                v = pop() if op == RETURN else None
+                if v is not None or op == END:
+                    if not calls:
+                        return v
+                    instrs, pc, frame = calls.pop()
+                    push(v)
+            elif op == STORE:
+                v = pop()
+                if type(v).__name__ != b:
+                    raise SLUCFunctionError("Error: Type Mismatch")
+                frame[a] = v
+            elif op == FAIL:
+                raise SLUCFunctionError(a)
+
+
+def run(prog: Program, out: Optional[Output] = None):
+    """
+    Compiles prog and runs its main function
+    """
+    VM(Compiler().program(prog), out).main()
@@ -0,0 +1,163 @@
+"""
+SLU-C generated workloads
+
+Seeded generators of runnable SLU-C programs, one per kind of work the
+lexer, parser and evaluator do. Each takes a scale (the number of functions
+it writes, so the source and the run time both grow with it) and a seed,
+and returns the same text for the same arguments. Every program type checks
+and ends: main calls each generated function a fixed number of times.
+"""
+import random
+from typing import Callable, Dict, List
+
+
+def main_calling(calls: List[str], times: int) -> str:
+    """
+    A main that runs calls (expressions of type int) times times
+    """
+    body = ["int main() {", "    int i;", "    int r;", "    i = 0;", "    r = 0;",
+            "    while (i < {0}) {{".format(times)]
+    body += ["        r = (r + {0}) % 1000003;".format(c) for c in calls]
+    body += ["        i = i + 1;", "    }", "    print(r);", "}", ""]
+    return "\n".join(body)
+
+
+def expressions(scale: int, seed: int = 364) -> str:
+    """
+    Functions of assignments of deep expressions: nests of +, -, %, the
+    comparisons, && and || about six levels down. A comparison where an int
+    goes is negated, and an int where a bool goes is compared with 0.
+    """
+    rnd = random.Random(seed)
+    ops = ["+", "-", "<", "<=", ">", ">=", "==", "!=", "&&", "||"]
+
+    def expr(depth: int, t: str = "int") -> str:
+        if depth == 0 or rnd.random() < 0.15:
+            if t == "bool":
+                return rnd.choice(["true", "false"])
+            return rnd.choice(["a", "b", "c", "d", str(rnd.randint(0, 99))])
+        op = rnd.choice(ops)
+        if op in ("+", "-") and rnd.random() < 0.3:
+            e, r = "({0} % {1})".format(expr(depth - 1), rnd.randint(2, 9)), "int"
+        elif op in ("&&", "||"):
+            r = rnd.choice(["int", "bool"])
+            e = "({0} {1} {2})".format(expr(depth - 1, r), op, expr(depth - 1, r))
+        else:
+            e, r = "({0} {1} {2})".format(expr(depth - 1), op, expr(depth - 1)), "int" if op in ("+", "-") else "bool"
+        if r == t:
+            return e
+        return "-" + e if t == "int" else "({0} != 0)".format(e)
+
+    funcs = []
+    for n in range(scale):
+        body = ["int e{0}(int a, int b) {{".format(n), "    int c;", "    int d;", "    c = a;", "    d = b;"]
+        body += ["    {0} = {1} % 1000;".format(rnd.choice("cd"), expr(6)) for _ in range(6)]
+        body += ["    return c + d;", "}", ""]
+        funcs.append("\n".join(body))
+    return "\n".join(funcs) + main_calling(["e{0}(i, {1})".format(n, n % 7) for n in range(scale)], 20)
+
+
+def straight_line(scale: int, seed: int = 364) -> str:
+    """
+    Long functions without a branch or a loop: 150 short assignments each
+    """
+    rnd = random.Random(seed)
+    funcs = []
+    for n in range(scale):
+        body = ["int s{0}(int a) {{".format(n), "    int b;", "    int c;", "    float x;",
+                "    b = 1;", "    c = 2;", "    x = 0.5;"]
+        for _ in range(150):
+            v = rnd.choice("abc")
+            body.append(rnd.choice([
+                "    {0} = ({1} + {2}) % 1009;".format(v, rnd.choice("abc"), rnd.randint(1, 99)),
+                "    {0} = {1} - {2} % 7;".format(v, rnd.choice("abc"), rnd.choice("abc")),
+                "    x = x * 0.5 + {0};".format(rnd.choice("abc")),
+            ]))
+        body += ["    return a + b + c;", "}", ""]
+        funcs.append("\n".join(body))
+    return "\n".join(funcs) + main_calling(["s{0}(i)".format(n) for n in range(scale)], 10)
+
+
+def nested_loops(scale: int, seed: int = 364) -> str:
+    """
+    Functions of three nested while loops with an if in the innermost one
+    """
+    rnd = random.Random(seed)
+    funcs = []
+    for n in range(scale):
+        k = rnd.randint(5, 8)
+        funcs.append("\n".join([
+            "int w{0}(int n) {{".format(n),
+            "    int i;", "    int j;", "    int k;", "    int s;",
+            "    s = 0;", "    i = 0;",
+            "    while (i < {0}) {{".format(k),
+            "        j = 0;",
+            "        while (j < {0}) {{".format(k),
+            "            k = 0;",
+            "            while (k < n) {",
+            "                if ((i + j + k) % {0} == 0)".format(rnd.randint(2, 5)),
+            "                    s = s + i * j;",
+            "                else",
+            "                    s = s - k;",
+            "                k = k + 1;",
+            "            }",
+            "            j = j + 1;",
+            "        }",
+            "        i = i + 1;",
+            "    }",
+            "    return s;",
+            "}", ""]))
+    return "\n".join(funcs) + main_calling(["w{0}(4)".format(n) for n in range(scale)], 2)
+
+
+def recursive(scale: int, seed: int = 364) -> str:
+    """
+    Doubly recursive functions (fib and friends), each calling itself a few
+    hundred times per call from main
+    """
+    rnd = random.Random(seed)
+    funcs = []
+    for n in range(scale):
+        base = rnd.randint(1, 3)
+        funcs.append("\n".join([
+            "int r{0}(int n) {{".format(n),
+            "    if (n < 2)",
+            "        return n + {0};".format(base),
+            "    return r{0}(n - 1) + r{0}(n - 2);".format(n),
+            "}", ""]))
+    return "\n".join(funcs) + main_calling(["r{0}({1})".format(n, rnd.randint(11, 13)) for n in range(scale)], 2)
+
+
+def print_heavy(scale: int, seed: int = 364) -> str:
+    """
+    Loops that print two values and a string every iteration
+    """
+    rnd = random.Random(seed)
+    funcs = []
+    for n in range(scale):
+        funcs.append("\n".join([
+            "int p{0}(int n) {{".format(n),
+            "    int i;",
+            "    float x;",
+            "    i = 0;",
+            "    x = {0}.25;".format(rnd.randint(0, 9)),
+            "    while (i < n) {",
+            "        print(\"row\", i, x * i)",
+            "        i = i + 1;",
+            "    }",
+            "    return i;",
+            "}", ""]))
+    return "\n".join(funcs) + main_calling(["p{0}(100)".format(n) for n in range(scale)], 2)
+
+
+# name -> generator
+workloads: Dict[str, Callable[[int, int], str]] = {
+    "expressions": expressions,
+    "straight-line": straight_line,
+    "nested loops": nested_loops,
+    "recursive": recursive,
+    "print-heavy": print_heavy,
+}
+
+# size name -> scale
+sizes = {"small": 5, "medium": 20, "large": 80}